@@ -0,0 +1,98 @@
+"""
+Throughput of the document loaders
+Loads every file in embeddings/other_docs plus generated JSON and SQL samples
+(the sample folder has none) and prints MB/s per file and per loader.
+Run from the backend folder: python embeddings/benchmark_loaders.py [folder]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))
+
+from utils.document_loaders import load_document, loader_for  # noqa: E402
+
+REPEAT = 3
+
+
+def write_samples(sample_dir):
+    """A JSON array of position records and a SQL mapping script"""
+    records = [
+        {
+            "position_id": f"FRDWH-020-775_371-{i:012d}",
+            "B017": [0.0, 0.1, 0.2, 0.4, 0.5, 1.0][i % 6],
+            "exposure_class": "Retail" if i % 3 else "Corporate",
+            "comment": "CCF nach CRR3 Art. 111",
+        }
+        for i in range(50000)
+    ]
+    json_path = os.path.join(sample_dir, "positions.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False)
+
+    statements = [
+        f"-- B{i % 1000:03d}: Feld {i}\n"
+        f"INSERT INTO mapping (field, source, note) VALUES "
+        f"('B{i % 1000:03d}', 'FRWDH.POS_{i}', 'Wert; siehe /* CRR3 */');"
+        for i in range(20000)
+    ]
+    sql_path = os.path.join(sample_dir, "mapping.sql")
+    with open(sql_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(statements))
+    return [json_path, sql_path]
+
+
+def benchmark(path):
+    name, _ = loader_for(path)
+    size = os.path.getsize(path)
+    best = None
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        documents = load_document(path)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    chars = sum(len(d.page_content) for d in documents)
+    return name, size, best, len(documents), chars
+
+
+def main():
+    docs_dir = os.path.join(current_dir, "other_docs")
+    if len(sys.argv) > 1:
+        docs_dir = sys.argv[1]
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(docs_dir)
+        for name in names
+    )
+    totals = defaultdict(lambda: [0, 0.0])
+
+    with tempfile.TemporaryDirectory() as sample_dir:
+        paths += write_samples(sample_dir)
+        print(f"{'loader':<6} {'MB/s':>8} {'KB':>9} {'docs':>6} {'chars':>9}  file")
+        for path in paths:
+            try:
+                name, size, seconds, documents, chars = benchmark(path)
+            except Exception as e:
+                print(f"❌ {os.path.basename(path)}: {e}")
+                continue
+            rate = size / seconds / 1e6 if seconds else 0.0
+            totals[name][0] += size
+            totals[name][1] += seconds
+            print(
+                f"{name:<6} {rate:>8.2f} {size / 1024:>9.1f} {documents:>6} "
+                f"{chars:>9}  {os.path.basename(path)}"
+            )
+
+    print("\nPer loader:")
+    for name, (size, seconds) in sorted(totals.items()):
+        rate = size / seconds / 1e6 if seconds else 0.0
+        print(f"{name:<6} {rate:>8.2f} MB/s over {size / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
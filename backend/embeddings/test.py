@@ -1,10 +1,13 @@
 import os
+import sys
+import uuid
 import tiktoken
 from openai import OpenAI
 
 from langchain.text_splitter import CharacterTextSplitter
 from langchain_community.document_loaders import Docx2txtLoader, PyPDFLoader
 from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from langchain_openai import OpenAIEmbeddings
 
 from dotenv import load_dotenv
@@ -16,6 +19,14 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 files_dir = os.path.join(current_dir, "docs")
 db_dir = os.path.join(current_dir, "db")
 
+sys.path.insert(0, os.path.dirname(current_dir))
+from utils.field_code_index import (  # noqa: E402
+    FieldCodeIndex,
+    extract_field_codes,
+    load_field_code_index,
+    merge_documents,
+)
+
 # Initialize tokenizer for text-embedding-3-large
 tokenizer = tiktoken.get_encoding("cl100k_base")
 
@@ -145,6 +156,14 @@ def create_batches(docs, max_tokens_per_batch=200000):
 def create_or_update_vector_store(docs, embeddings, store_name):
     """Create new vector store or add documents to existing one"""
     persistent_directory = os.path.join(db_dir, store_name)
+    code_index = FieldCodeIndex.for_store(persistent_directory)
+    ids = {id(doc): uuid.uuid4().hex for doc in docs}
+
+    def batch_ids(batch):
+        return [ids[id(doc)] for doc in batch]
+
+    def index_batch(batch):
+        code_index.add_chunks(batch_ids(batch), [doc.page_content for doc in batch])
 
     if not os.path.exists(persistent_directory):
         print(f"\n--- Creating new vector store: {store_name} ---")
@@ -155,18 +174,27 @@ def create_or_update_vector_store(docs, embeddings, store_name):
 
             # Create with first batch
             db = Chroma.from_documents(
-                batches[0], embeddings, persist_directory=persistent_directory
+                batches[0],
+                embeddings,
+                persist_directory=persistent_directory,
+                ids=batch_ids(batches[0]),
             )
+            index_batch(batches[0])
             print(f"Created initial store with {len(batches[0])} chunks")
 
             # Add remaining batches
             for i, batch in enumerate(batches[1:], 2):
                 print(f"Adding batch {i}/{len(batches)} ({len(batch)} chunks)")
-                db.add_documents(batch)
+                db.add_documents(batch, ids=batch_ids(batch))
+                index_batch(batch)
         else:
             db = Chroma.from_documents(
-                docs, embeddings, persist_directory=persistent_directory
+                docs,
+                embeddings,
+                persist_directory=persistent_directory,
+                ids=batch_ids(docs),
             )
+            index_batch(docs)
         print(f"--- Created vector store with {len(docs)} total chunks ---")
     else:
         print(f"\n--- Adding documents to existing vector store: {store_name} ---")
@@ -181,7 +209,8 @@ def create_or_update_vector_store(docs, embeddings, store_name):
         for i, batch in enumerate(batches, 1):
             print(f"Processing batch {i}/{len(batches)} ({len(batch)} chunks)")
             try:
-                db.add_documents(batch)
+                db.add_documents(batch, ids=batch_ids(batch))
+                index_batch(batch)
                 print(f"  ✅ Batch {i} added successfully")
             except Exception as e:
                 print(f"  ❌ Error adding batch {i}: {e}")
@@ -190,9 +219,27 @@ def create_or_update_vector_store(docs, embeddings, store_name):
 
         print(f"--- Finished adding documents to vector store ---")
 
+    code_index.save()
+    print(f"Field code index: {len(code_index)} codes")
     return db
 
 
+def get_exact_documents(db, store_name, query):
+    """Chunks defining the field codes named in the query (exact index lookup)"""
+    code_index = load_field_code_index(os.path.join(db_dir, store_name))
+    chunk_ids = code_index.lookup(extract_field_codes(query))
+    if not chunk_ids:
+        return []
+    found = db.get(ids=chunk_ids)
+    by_id = {
+        chunk_id: Document(page_content=text, metadata=metadata or {})
+        for chunk_id, text, metadata in zip(
+            found["ids"], found["documents"], found["metadatas"]
+        )
+    }
+    return [by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in by_id]
+
+
 def process_all_documents(store_name="chroma_db"):
     """Process all supported documents in the files directory"""
     print(f"\n--- Processing all documents in {files_dir} ---")
@@ -304,13 +351,18 @@ def query_with_rag(store_name, query, embedding_function, model="gpt-4o"):
             "score_threshold": 0.1,
         },  # Get more docs for better context
     )
-    relevant_docs = retriever.invoke(query)
+    # Chunks defining the queried field codes come first
+    exact_docs = get_exact_documents(db, store_name, query)
+    relevant_docs = merge_documents(exact_docs, retriever.invoke(query))
 
     if not relevant_docs:
         print("No relevant documents found for this query.")
         return None
 
-    print(f"Found {len(relevant_docs)} relevant document chunks")
+    print(
+        f"Found {len(relevant_docs)} relevant document chunks "
+        f"({len(exact_docs)} by field code)"
+    )
 
     # Create RAG prompt
     rag_prompt = create_rag_prompt(query, relevant_docs)
@@ -5,22 +5,34 @@ FastAPI Backend with Enhanced Mobile Support & LLM Integration - SYNTAX CHECKED
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import (
+    FileResponse,
+    HTMLResponse,
+    JSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import os
 import tempfile
 import sqlite3
 import json
-import subprocess
 import asyncio
 import aiohttp
 import time
+import io
+import shutil
+import uuid
+import random
+import secrets
+import pandas as pd
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
@@ -45,9 +57,9 @@ load_dotenv()
 # Import your existing RAG functions
 try:
     from pages.rag_cag import (
-        process_document,
-        split_documents,
-        build_vectordb,
+        open_vectordb_update,
+        add_to_vectordb,
+        publish_vectordb,
         get_combined_retriever,
         create_qa_chain,
     )
@@ -59,15 +71,15 @@ except ImportError:
     )
 
     # Define placeholder functions
-    def process_document(path):
-        return []
-
-    def split_documents(docs):
-        return docs
+    def open_vectordb_update(target_dir):
+        return None
 
-    def build_vectordb(chunks, target_dir):
+    def add_to_vectordb(update, chunks):
         pass
 
+    def publish_vectordb(update):
+        return None
+
     def get_combined_retriever():
         return None
 
@@ -75,6 +87,36 @@ except ImportError:
         return None
 
 
+from utils.archives import ArchiveError, archive_format, extract_archive
+from utils.audit_store import AuditStore
+from utils.document_manifest import DocumentManifest
+from utils.document_parsing import ParsingPool
+from utils.ingestion_jobs import IngestionJobs
+from utils.batch_jobs import BatchJobStore, BatchWorkerPool, RetryableTaskError
+from utils.rate_limiter import KeyedRateLimiter, RateLimitExceeded, parse_retry_after
+from utils.lineage_graph import LineageIndex
+from utils.mapping_rules import MappingRuleEngine, format_rule_check
+from utils.mapping_validation import validate_positions_file
+from utils.metrics import MetricsRegistry
+from utils.tracing import JsonLinesSpanSink, Tracer
+from utils.uploads import (
+    RequestSizeLimit,
+    UploadTooLarge,
+    safe_filename,
+    store_upload,
+)
+from utils.store_versions import store_lock
+from utils.profiling import PROFILE_MODES, RequestProfiler
+from utils.model_router import AUTO_MODEL, ModelRouter, estimate_tokens
+from utils.ollama_inventory import OllamaInventory
+from utils.response_cache import ResponseCache, make_cache_key
+from utils.scheduler import (
+    PriorityScheduler,
+    SchedulerOverloaded,
+    normalize_priority,
+    parse_department_weights,
+)
+
 # Corporate branding configuration
 CORPORATE_CONFIG = {
     "app_name": os.getenv(
@@ -122,10 +164,109 @@ app.add_middleware(
 
 # Configuration from environment
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_INVENTORY_TTL = float(os.getenv("OLLAMA_INVENTORY_TTL", "10"))
 DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "llama3")
 MAX_CONTEXT_DOCS = int(os.getenv("MAX_CONTEXT_DOCS", "6"))
 MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", "10485760"))  # 10MB default
+ARCHIVE_MAX_MEMBERS = int(os.getenv("ARCHIVE_MAX_MEMBERS", "500"))
+ARCHIVE_MAX_TOTAL_SIZE = int(os.getenv("ARCHIVE_MAX_TOTAL_SIZE", "209715200"))  # 200MB
+ALLOWED_DOCUMENT_EXTENSIONS = (
+    ".txt",
+    ".pdf",
+    ".md",
+    ".csv",
+    ".xlsx",
+    ".docx",
+    ".json",
+    ".sql",
+)
+# Whole upload request (all files and archives of one POST), checked before the
+# body is received
+MAX_UPLOAD_REQUEST_SIZE = int(
+    os.getenv("MAX_UPLOAD_REQUEST_SIZE", str(ARCHIVE_MAX_TOTAL_SIZE))
+)
+app.add_middleware(
+    RequestSizeLimit,
+    max_bytes=MAX_UPLOAD_REQUEST_SIZE,
+    path_prefixes=("/api/documents/upload/",),
+)
 GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+GEMINI_RATE_LIMIT_RPM = float(os.getenv("GEMINI_RATE_LIMIT_RPM", "14"))
+GEMINI_RATE_LIMIT_BURST = int(
+    os.getenv("GEMINI_RATE_LIMIT_BURST", str(max(1, int(GEMINI_RATE_LIMIT_RPM))))
+)
+RATE_LIMIT_PER_ANALYST = os.getenv("RATE_LIMIT_PER_ANALYST", "False").lower() == "true"
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+LLM_MAX_QUEUE_DEPTH = int(os.getenv("LLM_MAX_QUEUE_DEPTH", "100"))
+SCHEDULER_DEPARTMENT_WEIGHTS = parse_department_weights(
+    os.getenv("SCHEDULER_DEPARTMENT_WEIGHTS", "")
+)
+AUTO_MODEL_PREFERENCE = os.getenv(
+    "AUTO_MODEL_PREFERENCE", "llama3.1,llama3,gemma2,mistral"
+).split(",")
+AUTO_MODEL_LATENCY_TARGET = float(os.getenv("AUTO_MODEL_LATENCY_TARGET", "30"))
+AUTO_MODEL_MAX_IN_FLIGHT = int(os.getenv("AUTO_MODEL_MAX_IN_FLIGHT", "2"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+OLLAMA_GENERATION_PARAMS = {"temperature": 0.7, "top_p": 0.9}
+BATCH_DB_PATH = os.getenv("BATCH_DB_PATH", "batch_jobs.db")
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "2"))
+BATCH_MAX_ATTEMPTS = int(os.getenv("BATCH_MAX_ATTEMPTS", "3"))
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", "5000"))
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+PARSING_WORKERS = int(os.getenv("PARSING_WORKERS", "0"))  # 0 = one per core
+DOCUMENT_MANIFEST_PATH = os.getenv("DOCUMENT_MANIFEST_PATH", "document_manifest.json")
+MAPPING_DOCS_DIRS = os.getenv("MAPPING_DOCS_DIRS", "mapping_docs,docs/mapping_docs")
+MAPPING_DEFAULT_REGIME = os.getenv("MAPPING_DEFAULT_REGIME", "CRR3")
+LINEAGE_INDEX_PATH = os.getenv("LINEAGE_INDEX_PATH", "lineage_index.json")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces/spans.jsonl")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sampling")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+AUDIT_DB_PATH = os.getenv("AUDIT_DB_PATH", "audit_log.db")
+AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "1000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "0"))
+AUDIT_MAX_EVENTS = int(os.getenv("AUDIT_MAX_EVENTS", "0"))
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "")
+VALIDATION_CHUNK_SIZE = int(os.getenv("VALIDATION_CHUNK_SIZE", "50000"))
+VALIDATION_RESULTS_DIR = Path(os.getenv("VALIDATION_RESULTS_DIR", "validation_results"))
+
+# Model catalogue shown in /api/health; AUTO_MODEL_PREFERENCE ranks them for routing
+MODEL_CONFIGS = {
+    "llama3": {
+        "name": "Llama 3",
+        "description": "Enterprise-grade general analysis",
+        "specialized_for": ["regulatory_compliance", "business_analysis"],
+        "performance": "balanced",
+        "mobile_friendly": True,
+    },
+    "llama3.1": {
+        "name": "Llama 3.1",
+        "description": "Advanced reasoning for complex scenarios",
+        "specialized_for": ["complex_mapping", "multi_system_analysis"],
+        "performance": "enhanced",
+        "mobile_friendly": True,
+    },
+    "mistral": {
+        "name": "Mistral",
+        "description": "High-speed error detection",
+        "specialized_for": ["rapid_analysis", "error_detection"],
+        "performance": "fast",
+        "mobile_friendly": True,
+    },
+    "gemma2": {
+        "name": "Gemma 2",
+        "description": "Structured data validation specialist",
+        "specialized_for": ["data_validation", "schema_analysis"],
+        "performance": "precise",
+        "mobile_friendly": True,
+    },
+}
 
 # Create directories
 os.makedirs("rag_docs", exist_ok=True)
@@ -139,12 +280,15 @@ class CorporateAnalysisRequest(BaseModel):
     query: str
     model: str = DEFAULT_MODEL
     error_type: str = "data_inconsistency"
-    context_sources: List[str] = ["rag", "cag"]
+    context_sources: List[str] = ["rag", "cag", "lineage"]
     analysis_focus: str = "root_cause"
     priority_level: str = "standard"
     department: Optional[str] = None
     analyst_id: Optional[str] = None
     custom_instructions: Optional[str] = None
+    use_cache: bool = True
+    use_rule_engine: bool = True
+    regime: Optional[str] = None
 
 
 class CorporateAnalysisResponse(BaseModel):
@@ -165,6 +309,13 @@ class CorporateAnalysisResponse(BaseModel):
     context_sources_used: List[str] = []
     timestamp: str
     analyst_notes: Optional[str] = None
+    cache_status: Optional[str] = None
+
+
+class MappingEvaluationRequest(BaseModel):
+    position: Dict[str, Any]
+    fields: Optional[List[str]] = None
+    regime: Optional[str] = None
 
 
 class GeminiChatRequest(BaseModel):
@@ -175,6 +326,7 @@ class GeminiChatRequest(BaseModel):
     max_tokens: int = 2048
     use_context: bool = True
     context_sources: List[str] = ["rag", "cag"]
+    analyst_id: Optional[str] = None
 
 
 class GeminiChatResponse(BaseModel):
@@ -200,34 +352,6 @@ class SystemHealthResponse(BaseModel):
     corporate_info: Dict[str, str]
 
 
-class RateLimiter:
-    """Rate limiter for API calls"""
-
-    def __init__(self, max_requests: int = 14, window_seconds: int = 60):
-        self.max_requests = max_requests
-        self.window_seconds = window_seconds
-        self.requests = []
-
-    async def wait_if_needed(self):
-        """Wait if rate limit would be exceeded"""
-        now = time.time()
-        # Remove old requests outside the window
-        self.requests = [
-            req_time
-            for req_time in self.requests
-            if now - req_time < self.window_seconds
-        ]
-
-        if len(self.requests) >= self.max_requests:
-            # Wait until the oldest request is outside the window
-            wait_time = self.window_seconds - (now - self.requests[0]) + 1
-            if wait_time > 0:
-                logger.info(f"Rate limit reached, waiting {wait_time:.2f} seconds")
-                await asyncio.sleep(wait_time)
-
-        self.requests.append(now)
-
-
 class AuditLog(BaseModel):
     timestamp: str
     action: str
@@ -238,8 +362,209 @@ class AuditLog(BaseModel):
 
 # Global state management
 llm_cache: Dict[str, OllamaLLM] = {}
-audit_logs: List[AuditLog] = []
-rate_limiter = RateLimiter()
+rate_limiter = KeyedRateLimiter(
+    requests_per_minute=GEMINI_RATE_LIMIT_RPM, burst=GEMINI_RATE_LIMIT_BURST
+)
+model_router = ModelRouter(
+    preference=[m.strip() for m in AUTO_MODEL_PREFERENCE],
+    fallback_model=DEFAULT_MODEL,
+    latency_target_s=AUTO_MODEL_LATENCY_TARGET,
+    max_in_flight=AUTO_MODEL_MAX_IN_FLIGHT,
+)
+ollama_inventory = OllamaInventory(OLLAMA_HOST, ttl_seconds=OLLAMA_INVENTORY_TTL)
+response_cache = ResponseCache(
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl_seconds=RESPONSE_CACHE_TTL
+)
+llm_scheduler = PriorityScheduler(
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_queue_depth=LLM_MAX_QUEUE_DEPTH,
+    department_weights=SCHEDULER_DEPARTMENT_WEIGHTS,
+)
+# Retrieved context shared by batch rows with the same retrieval fields
+batch_context_cache = ResponseCache(max_entries=256, ttl_seconds=RESPONSE_CACHE_TTL)
+# Stores, indexes and background writers are created by open_state() on
+# startup: spawned parsing workers re-import this module and must not open
+# the databases, start writer threads or rewrite the document manifest
+audit_store: AuditStore
+batch_store: BatchJobStore
+batch_pool: BatchWorkerPool
+mapping_rules: MappingRuleEngine
+lineage_index: LineageIndex
+document_manifest: DocumentManifest
+
+# Metrics (Prometheus text format at /metrics)
+metrics = MetricsRegistry()
+http_requests = metrics.counter(
+    "ba_http_requests_total", "HTTP requests", ["method", "route", "status"]
+)
+http_latency = metrics.histogram(
+    "ba_http_request_duration_seconds", "HTTP request latency", ["method", "route"]
+)
+http_mobile_requests = metrics.counter(
+    "ba_http_mobile_requests_total", "HTTP requests from mobile user agents"
+)
+stage_latency = metrics.histogram(
+    "ba_stage_duration_seconds",
+    "Latency of pipeline stages (retrieval, embedding, llm, ...)",
+    ["stage"],
+)
+gemini_requests = metrics.counter(
+    "ba_gemini_requests_total", "Gemini chat requests by outcome", ["outcome"]
+)
+metrics.callback(
+    "ba_cache_events_total",
+    "Response cache hits, misses, coalesced requests and evictions",
+    lambda: {
+        (name, event): cache.stats()[event]
+        for name, cache in (
+            ("analysis", response_cache),
+            ("batch_context", batch_context_cache),
+        )
+        for event in ("hits", "misses", "coalesced", "evictions")
+    },
+    ["cache", "event"],
+    kind="counter",
+)
+metrics.callback(
+    "ba_rate_limit_events_total",
+    "Gemini rate limiter decisions and upstream 429s",
+    lambda: {
+        (event,): rate_limiter.stats()[event]
+        for event in ("allowed", "rejected", "upstream_429")
+    },
+    ["event"],
+    kind="counter",
+)
+metrics.callback(
+    "ba_llm_queue_depth",
+    "Analyses waiting for an LLM slot",
+    lambda: llm_scheduler.queued,
+)
+metrics.callback(
+    "ba_llm_running", "Analyses holding an LLM slot", lambda: llm_scheduler.running
+)
+metrics.callback(
+    "ba_uptime_seconds",
+    "Seconds since the process started",
+    lambda: metrics.uptime_seconds,
+)
+MOBILE_USER_AGENT_RE = re.compile(r"Mobile|Android|iPhone|iPad", re.IGNORECASE)
+
+# Tracing: per-stage spans, Server-Timing headers and an OTLP/JSON span file
+tracer = Tracer(sample_rate=TRACE_SAMPLE_RATE)
+tracer.add_listener(
+    lambda span: span.is_root
+    or stage_latency.observe(span.duration_ms / 1000, stage=span.name)
+)
+
+
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    """Trace every request; record latency and status per route template"""
+    started = time.perf_counter()
+    status = 500
+    with tracer.start_trace(
+        f"{request.method} {request.url.path}",
+        request.headers.get("traceparent"),
+        **{"http.method": request.method, "http.target": request.url.path},
+    ) as trace:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            response.headers["Server-Timing"] = trace.server_timing()
+            response.headers["X-Trace-Id"] = trace.trace_id
+            return response
+        finally:
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            trace.root.name = f"{request.method} {route}"
+            trace.root.set_attribute("http.route", route)
+            trace.root.set_attribute("http.status_code", status)
+            http_latency.observe(
+                time.perf_counter() - started, method=request.method, route=route
+            )
+            http_requests.inc(method=request.method, route=route, status=str(status))
+            if MOBILE_USER_AGENT_RE.search(request.headers.get("user-agent", "")):
+                http_mobile_requests.inc()
+
+
+# Profiling: admins opt in per request with X-Profile-Token, or a share of the
+# traffic is sampled. The middleware is only installed when one of them is set
+request_profiler = RequestProfiler(PROFILE_DIR, max_profiles=PROFILE_MAX_FILES)
+
+
+async def profile_request(request: Request, call_next):
+    """Profile opted-in or sampled requests and return the X-Profile-Id"""
+    requested = bool(PROFILE_ADMIN_TOKEN) and secrets.compare_digest(
+        request.headers.get("x-profile-token", "").encode(),
+        PROFILE_ADMIN_TOKEN.encode(),
+    )
+    if request.url.path.startswith("/api/profiles") or (
+        not requested and random.random() >= PROFILE_SAMPLE_RATE
+    ):
+        return await call_next(request)
+
+    session = request_profiler.start(
+        request.headers.get("x-profile-mode", PROFILE_MODE)
+    )
+    if session is None:
+        response = await call_next(request)
+        response.headers["X-Profile-Status"] = "busy"
+        return response
+
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        request_profiler.stop(session)
+        profile_id = await asyncio.to_thread(
+            request_profiler.save,
+            session,
+            method=request.method,
+            path=request.url.path,
+            status=status,
+            trigger="header" if requested else "sampled",
+        )
+        logger.info(f"🔬 Profiled {request.method} {request.url.path}: {profile_id}")
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+if PROFILE_ADMIN_TOKEN or PROFILE_SAMPLE_RATE > 0:
+    app.middleware("http")(profile_request)
+
+
+def require_profile_admin(request: Request):
+    # Profiles expose request paths and stacks: without a token (e.g. when only
+    # PROFILE_SAMPLE_RATE is set) they cannot be read over HTTP at all
+    if not PROFILE_ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=403, detail="Profile access requires PROFILE_ADMIN_TOKEN"
+        )
+    if not secrets.compare_digest(
+        request.headers.get("x-profile-token", "").encode(),
+        PROFILE_ADMIN_TOKEN.encode(),
+    ):
+        raise HTTPException(status_code=403, detail="Profile access denied")
+
+
+def request_metrics_summary() -> Dict[str, Any]:
+    """Measured latency percentiles, success and mobile share for status endpoints"""
+    total = http_requests.value()
+    server_errors = http_requests.value_where(lambda l: l["status"].startswith("5"))
+    return {
+        "uptime_seconds": round(metrics.uptime_seconds, 1),
+        "requests_total": int(total),
+        "latency_seconds": http_latency.summary(),
+        "success_rate": round(1 - server_errors / total, 4) if total else None,
+        "mobile_share": (
+            round(http_mobile_requests.value() / total, 4) if total else None
+        ),
+        "stages": {
+            stage: stage_latency.summary(stage=stage)
+            for (stage,) in stage_latency.label_values()
+        },
+    }
 
 
 def log_audit_event(
@@ -253,8 +578,8 @@ def log_audit_event(
         details=details,
         success=success,
     )
-    audit_logs.append(audit_entry)
-    logger.info(f"Audit: {action} - {success} - {details}")
+    audit_store.record(audit_entry.model_dump())
+    logger.debug(f"Audit: {action} - {success} - {details}")
 
 
 def get_llm_for_model(model_name: str) -> OllamaLLM:
@@ -262,7 +587,7 @@ def get_llm_for_model(model_name: str) -> OllamaLLM:
     if model_name not in llm_cache:
         try:
             llm_cache[model_name] = OllamaLLM(
-                model=model_name, base_url=OLLAMA_HOST, temperature=0.7, top_p=0.9
+                model=model_name, base_url=OLLAMA_HOST, **OLLAMA_GENERATION_PARAMS
             )
             log_audit_event("llm_initialization", {"model": model_name})
             logger.info(f"✅ Initialized {model_name} successfully")
@@ -279,8 +604,7 @@ def get_llm_for_model(model_name: str) -> OllamaLLM:
                 llm_cache[model_name] = OllamaLLM(
                     model=DEFAULT_MODEL,
                     base_url=OLLAMA_HOST,
-                    temperature=0.7,
-                    top_p=0.9,
+                    **OLLAMA_GENERATION_PARAMS,
                 )
             else:
                 raise HTTPException(
@@ -289,6 +613,466 @@ def get_llm_for_model(model_name: str) -> OllamaLLM:
     return llm_cache[model_name]
 
 
+async def list_installed_ollama_models() -> List[str]:
+    """Installed Ollama model names without tags (empty when Ollama is unavailable)"""
+    return await ollama_inventory.installed_models()
+
+
+async def generate_with_model(
+    prompt: str,
+    requested_model: str,
+    priority_level: Optional[str] = None,
+    department: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Run a prompt through the scheduler, routing model="auto" by live statistics
+
+    Every call feeds the router's latency/throughput/error statistics. In auto mode a
+    failing model is excluded and the request is retried once on the next best model.
+    """
+    auto = requested_model == AUTO_MODEL
+    installed = await list_installed_ollama_models() if auto else []
+    tried: List[str] = []
+
+    while True:
+        if auto:
+            model_name, route_reason = model_router.choose(installed, exclude=tried)
+        else:
+            model_name, route_reason = requested_model, "requested"
+        tried.append(model_name)
+
+        llm = get_llm_for_model(model_name)
+        try:
+            # Only the model call itself is tracked: shed requests and time spent
+            # in the queue say nothing about the model's health
+            queued_at = time.perf_counter()
+            async with llm_scheduler.slot(priority_level, department):
+                started = time.perf_counter()
+                tracer.record_span("llm_queue", started - queued_at)
+                with model_router.track(model_name) as call:
+                    text = await asyncio.to_thread(llm.invoke, prompt)
+                    elapsed = time.perf_counter() - started
+                    call.success(elapsed, estimate_tokens(text))
+                tracer.record_span("llm", elapsed, model=model_name)
+            return {"text": text, "model": model_name, "route_reason": route_reason}
+        except SchedulerOverloaded:
+            raise
+        except Exception as e:
+            if not auto or len(tried) >= 2 or model_name == DEFAULT_MODEL:
+                raise
+            logger.warning(f"Auto-routed model {model_name} failed ({e}), rerouting")
+
+
+def build_analysis_context(
+    query: str, context_sources: List[str], regime: Optional[str] = None
+) -> Tuple[str, List[str]]:
+    """Retrieve lineage/RAG/CAG context for an analysis (blocking - run in a thread)"""
+    context_parts = []
+    sources_used = []
+
+    if "lineage" in context_sources:
+        with tracer.span("lineage"):
+            lineage_section, lineage_files = lineage_index.context_for_query(
+                query, regime
+            )
+        if lineage_section:
+            context_parts.append(lineage_section)
+            sources_used.extend(lineage_files)
+
+    if "rag" in context_sources or "cag" in context_sources:
+        with tracer.span("vectorstore_load"):
+            retriever = get_combined_retriever()
+        if retriever:
+            # Query embedding + similarity search
+            with tracer.span("retrieval"):
+                docs = retriever.get_relevant_documents(query)
+            if docs:
+                context_parts.append("[REGULATORY & BUSINESS CONTEXT]")
+                for i, doc in enumerate(docs[:MAX_CONTEXT_DOCS]):
+                    source = Path(doc.metadata.get("source", "Unknown")).name
+                    if source not in sources_used:
+                        sources_used.append(source)
+
+                    doc_type = (
+                        "RAG" if "rag_docs" in doc.metadata.get("source", "") else "CAG"
+                    )
+                    context_parts.append(
+                        f"[{doc_type}] {source}:\n{doc.page_content[:800]}"
+                    )
+
+    context_section = "\n".join(context_parts) if context_parts else ""
+    return context_section, sources_used
+
+
+def build_analysis_prompt(request: CorporateAnalysisRequest, context_section: str):
+    """Enhanced analysis prompt"""
+    system_prompt = f"""Du bist ein Senior Business Analyst bei {CORPORATE_CONFIG['organization']} und spezialisiert auf regulatorische Berichterstattung und Unternehmensdaten-Mapping.
+
+UNTERNEHMENSKONTEXT:
+Organisation: {CORPORATE_CONFIG['organization']}
+Prioritätsstufe: {request.priority_level.upper()}
+Abteilung: {request.department or 'Enterprise Analytics'}
+Mobile-optimiert: Ja
+
+VERFÜGBARER KONTEXT:
+{context_section}
+
+BENUTZERANFRAGE: {request.query}
+
+ENHANCED ANALYSE-FRAMEWORK:
+1. MOBILE-FREUNDLICHE ZUSAMMENFASSUNG: Kurze, prägnante Übersicht
+2. GESCHÄFTSAUSWIRKUNGSBEWERTUNG: Operative und regulatorische Auswirkungen
+3. TECHNISCHE URSACHENANALYSE: Genaue Standorte und Ursachen
+4. COMPLIANCE-AUSWIRKUNGEN: Regulatorische und Audit-Anforderungen
+5. MOBILE-OPTIMIERTE EMPFEHLUNGEN: Umsetzbare Schritte
+
+Analysetyp: {request.error_type.upper()}
+Priorität: {request.priority_level.upper()}
+
+Bitte geben Sie eine strukturierte Antwort auf Deutsch mit klaren Abschnitten."""
+
+    if request.custom_instructions:
+        system_prompt += f"\n\nZUSÄTZLICHE ANFORDERUNGEN:\n{request.custom_instructions}"
+    return system_prompt
+
+
+async def run_mapping_generation(
+    request: CorporateAnalysisRequest, context_section: str
+) -> Tuple[Dict[str, Any], str]:
+    """Get analysis from model - admission controlled by priority lane
+
+    Identical prompts are answered from the cache or share one generation.
+    Returns (generation, cache_status).
+    """
+    with tracer.span("prompt"):
+        system_prompt = build_analysis_prompt(request, context_section)
+
+    async def generate():
+        return await generate_with_model(
+            system_prompt,
+            request.model,
+            priority_level=request.priority_level,
+            department=request.department,
+        )
+
+    with tracer.span("generation", model=request.model) as span:
+        if not request.use_cache:
+            result = await generate(), "bypass"
+        else:
+            cache_key = make_cache_key(
+                system_prompt, request.model, OLLAMA_GENERATION_PARAMS
+            )
+            result = await response_cache.get_or_generate(cache_key, generate)
+        span.set_attribute("cache_status", result[1])
+    return result
+
+
+def parse_position_file(filename: str, content: bytes) -> pd.DataFrame:
+    """Read an uploaded CSV/XLSX of positions as strings (blocking - run in a thread)"""
+    if Path(filename).suffix.lower() == ".csv":
+        df = pd.read_csv(io.BytesIO(content), dtype=str, sep=None, engine="python")
+    else:
+        df = pd.read_excel(io.BytesIO(content), dtype=str)
+    df.columns = [str(c).strip() for c in df.columns]
+    return df.dropna(how="all").fillna("")
+
+
+def select_retrieval_fields(df: pd.DataFrame) -> List[str]:
+    """Default shared-retrieval fields: columns repeated across many rows"""
+    if len(df) < 2:
+        return []
+    return [
+        column
+        for column in df.columns
+        if 1 < df[column].nunique() <= max(1, len(df) // 5)
+        or (df[column].nunique() == 1 and df[column].iloc[0] != "")
+    ]
+
+
+def format_position_query(position: Dict[str, Any], question: str) -> str:
+    fields = " ; ".join(f"{k} = {v}" for k, v in position.items() if v != "")
+    return f"{question}\n{fields}" if question else fields
+
+
+async def process_batch_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Analyze one queued position row"""
+    options = task["options"]
+    position = task["payload"]
+    request = CorporateAnalysisRequest(
+        query=format_position_query(position, options.get("question", "")),
+        model=options.get("model", DEFAULT_MODEL),
+        error_type=options.get("error_type", "data_inconsistency"),
+        context_sources=options.get("context_sources", ["rag", "cag", "lineage"]),
+        priority_level=options.get("priority_level", "low"),
+        department=options.get("department"),
+        analyst_id=options.get("analyst_id"),
+        custom_instructions=options.get("custom_instructions"),
+    )
+
+    # Rows sharing the retrieval fields reuse one retrieval (concurrent workers
+    # asking for the same key wait for the first lookup)
+    retrieval_fields = options.get("retrieval_fields") or []
+    shared = {k: position.get(k, "") for k in retrieval_fields}
+    retrieval_query = (
+        format_position_query(shared, options.get("question", ""))
+        if retrieval_fields
+        else request.query
+    )
+
+    async def retrieve():
+        return await asyncio.to_thread(
+            build_analysis_context,
+            retrieval_query,
+            request.context_sources,
+            options.get("regime"),
+        )
+
+    # Rows that agree with the mapping rules need no LLM call
+    rule_check = mapping_rules.check_position(position, regime=options.get("regime"))
+    if rule_check and rule_check["deterministic"] and not rule_check["discrepancy"]:
+        return {
+            "analysis": format_rule_check(rule_check),
+            "model_used": "rule-engine",
+            "route_reason": "deterministic mapping rule",
+            "cache_status": "rules",
+            "rule_check": rule_check["results"],
+            "timestamp": datetime.now().isoformat(),
+        }
+
+    context_key = f"{task['job_id']}:{task['retrieval_key']}"
+    (context_section, sources_used), _ = await batch_context_cache.get_or_generate(
+        context_key, retrieve
+    )
+    if rule_check:
+        context_section = f"{format_rule_check(rule_check)}\n\n{context_section}"
+
+    try:
+        generation, cache_status = await run_mapping_generation(
+            request, context_section
+        )
+    except SchedulerOverloaded as e:
+        raise RetryableTaskError(str(e), retry_after=e.retry_after)
+
+    return {
+        "analysis": generation["text"],
+        "model_used": generation["model"],
+        "route_reason": generation["route_reason"],
+        "cache_status": cache_status,
+        "context_sources_used": sources_used,
+        "rule_check": rule_check["results"] if rule_check else None,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+async def traced_batch_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    with tracer.start_trace(
+        "batch_task", **{"batch.job_id": task["job_id"], "batch.row": task["row_index"]}
+    ):
+        return await process_batch_task(task)
+
+
+def ingest_documents(job: Dict[str, Any], progress) -> Dict[str, Any]:
+    """Parse, chunk, embed and index the files of an upload (blocking)
+
+    All files of the job are embedded into one update of the category's vector
+    store, which becomes visible to retrieval in a single atomic switch.
+    """
+    category = job["category"]
+    files = job["files"]
+    try:
+        return run_ingestion(job, progress)
+    except Exception:
+        for file_info in files:
+            document_manifest.forget(category, file_info["sha256"])
+        raise
+
+
+def run_ingestion(job: Dict[str, Any], progress) -> Dict[str, Any]:
+    category = job["category"]
+    files = job["files"]
+    if category == "mapping":
+        started = time.perf_counter()
+        reload_mapping_documents()
+        seconds = (time.perf_counter() - started) / max(len(files), 1)
+        for index, file_info in enumerate(files):
+            progress(index, stage="indexed")
+            document_manifest.mark_ingested(category, file_info["sha256"], 0, seconds)
+        return {"total_chunks": 0}
+
+    # Parsed and split in worker processes; results arrive in completion order
+    chunk_lists = [[] for _ in files]
+    file_seconds = [0.0] * len(files)
+    paths = [file_info["path"] for file_info in files]
+    for index, result in parsing_pool.parse_files(paths):
+        file_info = files[index]
+        file_seconds[index] = result["seconds"]
+        tracer.record_span(
+            "document_parsing", result["seconds"], file=file_info["filename"]
+        )
+        if result["error"]:
+            logger.warning(
+                f"⚠️ Could not parse {file_info['filename']}: {result['error']}"
+            )
+            progress(index, stage="failed", error=result["error"])
+            document_manifest.forget(category, file_info["sha256"])
+            continue
+        progress(index, stage="parsed", documents=result["documents"])
+        if not result["chunks"]:
+            # Nothing to index: forget the content so a fixed file can be retried
+            logger.warning(f"⚠️ No text extracted from {file_info['filename']}")
+            progress(index, stage="failed", error="No text could be extracted")
+            document_manifest.forget(category, file_info["sha256"])
+            continue
+        progress(index, stage="chunked", chunks=len(result["chunks"]))
+        chunk_lists[index] = result["chunks"]
+
+    target_dir = f"{category}_docs"
+    with store_lock(f"{target_dir}_vectorstore"):
+        update = open_vectordb_update(target_dir)
+        for index, chunks in enumerate(chunk_lists):
+            if chunks:
+                started = time.perf_counter()
+                with tracer.span("embedding", file=files[index]["filename"]):
+                    add_to_vectordb(update, chunks)
+                file_seconds[index] += time.perf_counter() - started
+                progress(index, stage="embedded")
+        with tracer.span("indexing"):
+            publish_vectordb(update)
+    for index, chunks in enumerate(chunk_lists):
+        if chunks:
+            progress(index, stage="indexed")
+            document_manifest.mark_ingested(
+                category, files[index]["sha256"], len(chunks), file_seconds[index]
+            )
+
+    total_chunks = sum(len(chunks) for chunks in chunk_lists)
+    log_audit_event(
+        "document_ingestion_completed",
+        {
+            "job_id": job["job_id"],
+            "category": category,
+            "file_count": len(files),
+            "failed_files": sum(1 for chunks in chunk_lists if not chunks),
+            "total_chunks": total_chunks,
+            "department": job.get("department"),
+            "analyst_id": job.get("analyst_id"),
+        },
+    )
+    logger.info(f"📚 Ingestion {job['job_id']}: {total_chunks} chunks indexed")
+    return {"total_chunks": total_chunks}
+
+
+parsing_pool = ParsingPool(PARSING_WORKERS)
+ingestion_jobs = IngestionJobs(ingest_documents, workers=INGESTION_WORKERS)
+
+
+def build_rule_engine_response(
+    analysis_id: str, rule_check: Dict[str, Any]
+) -> CorporateAnalysisResponse:
+    """Answer a mapping question directly from the deterministic rules"""
+    confirmed = any(r["matches"] for r in rule_check["results"])
+    sources = {Path(spec.source_file).name for spec in mapping_rules.mappings.values()}
+    return CorporateAnalysisResponse(
+        analysis_id=analysis_id,
+        analysis=format_rule_check(rule_check),
+        error_classification=(
+            "Keine Mapping-Abweichung" if confirmed else "Regelbasierte Wertermittlung"
+        ),
+        business_impact="Keine - Wert folgt deterministisch aus der Mapping-Regel",
+        probable_location=rule_check["results"][0]["rule"],
+        remediation_steps=(
+            [] if confirmed else ["✅ Erwarteten Wert in der Meldung prüfen"]
+        ),
+        business_priority="Niedrig",
+        confidence_score=1.0,
+        model_used="rule-engine",
+        context_sources_used=sorted(sources),
+        timestamp=datetime.now().isoformat(),
+        analyst_notes=f"Mapping {rule_check['regime']} ohne LLM ausgewertet",
+        cache_status="rules",
+    )
+
+
+def reload_mapping_documents() -> Dict[str, Any]:
+    """Re-parse the mapping documents and update the lineage index (blocking)"""
+    summary = mapping_rules.reload()
+    summary["lineage"] = lineage_index.sync(mapping_rules)
+    return summary
+
+
+@app.on_event("startup")
+async def open_state():
+    global audit_store, batch_store, batch_pool, mapping_rules, lineage_index
+    global document_manifest
+    audit_store = AuditStore(
+        AUDIT_DB_PATH,
+        buffer_size=AUDIT_BUFFER_SIZE,
+        batch_size=AUDIT_BATCH_SIZE,
+        flush_interval=AUDIT_FLUSH_INTERVAL,
+        retention_days=AUDIT_RETENTION_DAYS,
+        max_events=AUDIT_MAX_EVENTS,
+        archive_dir=AUDIT_ARCHIVE_DIR or None,
+    )
+    batch_store = BatchJobStore(db_path=BATCH_DB_PATH, max_attempts=BATCH_MAX_ATTEMPTS)
+    batch_pool = BatchWorkerPool(batch_store, traced_batch_task, workers=BATCH_WORKERS)
+    mapping_rules = MappingRuleEngine(
+        directories=[d.strip() for d in MAPPING_DOCS_DIRS.split(",")],
+        default_regime=MAPPING_DEFAULT_REGIME,
+    )
+    lineage_index = LineageIndex(LINEAGE_INDEX_PATH)
+    document_manifest = DocumentManifest(DOCUMENT_MANIFEST_PATH)
+    document_manifest.drop_pending()
+    if TRACE_FILE:
+        tracer.sink = JsonLinesSpanSink(TRACE_FILE, "ba-agent-tool")
+
+
+@app.on_event("startup")
+async def load_mapping_rules():
+    await asyncio.to_thread(reload_mapping_documents)
+
+
+@app.on_event("startup")
+async def start_ollama_inventory():
+    ollama_inventory.start()
+
+
+@app.on_event("shutdown")
+async def stop_ollama_inventory():
+    await ollama_inventory.stop()
+
+
+@app.on_event("shutdown")
+async def close_audit_store():
+    await asyncio.to_thread(audit_store.close)
+
+
+@app.on_event("shutdown")
+async def close_trace_sink():
+    if tracer.sink:
+        await asyncio.to_thread(tracer.sink.close)
+
+
+@app.on_event("startup")
+async def start_batch_workers():
+    batch_pool.start()
+    logger.info(f"🧵 Batch worker pool started ({batch_pool.workers} workers)")
+
+
+@app.on_event("shutdown")
+async def stop_batch_workers():
+    await batch_pool.stop()
+
+
+@app.on_event("startup")
+async def start_ingestion_workers():
+    ingestion_jobs.start()
+
+
+@app.on_event("shutdown")
+async def stop_ingestion_workers():
+    await ingestion_jobs.stop()
+    parsing_pool.shutdown()
+
+
 # Enhanced corporate-branded routes with mobile optimization
 @app.get("/", response_class=HTMLResponse)
 async def get_corporate_landing():
@@ -364,18 +1148,26 @@ async def chat_with_gemini(request: GeminiChatRequest):
     """Enhanced Gemini chat integration with rate limiting and error handling"""
     start_time = time.time()
 
+    # Per-key rate limiting - reject immediately with an ETA instead of sleeping
+    limiter_key = rate_limiter.make_key(
+        request.api_key, request.analyst_id if RATE_LIMIT_PER_ANALYST else None
+    )
     try:
-        # Rate limiting
-        await rate_limiter.wait_if_needed()
+        rate_limiter.acquire(limiter_key)
+    except RateLimitExceeded as e:
+        raise_rate_limited(e, request.model, time.time() - start_time)
 
+    try:
         # Get context if requested
         context_sources = []
         context_text = ""
 
         if request.use_context and request.context_sources:
-            retriever = get_combined_retriever()
+            with tracer.span("vectorstore_load"):
+                retriever = get_combined_retriever()
             if retriever:
-                docs = retriever.get_relevant_documents(request.message)
+                with tracer.span("retrieval"):
+                    docs = retriever.get_relevant_documents(request.message)
                 if docs:
                     context_parts = []
                     for doc in docs[:MAX_CONTEXT_DOCS]:
@@ -397,15 +1189,18 @@ async def chat_with_gemini(request: GeminiChatRequest):
 Bitte geben Sie eine strukturierte, professionelle Antwort auf Deutsch."""
 
         # Make API call to Gemini with retry logic
-        response_text = await call_gemini_api_with_retry(
-            api_key=request.api_key,
-            model=request.model,
-            prompt=system_prompt,
-            temperature=request.temperature,
-            max_tokens=request.max_tokens,
-        )
+        with tracer.span("gemini"):
+            response_text = await call_gemini_api_with_retry(
+                api_key=request.api_key,
+                model=request.model,
+                prompt=system_prompt,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+                limiter_key=limiter_key,
+            )
 
         processing_time = time.time() - start_time
+        gemini_requests.inc(outcome="success")
 
         # Log successful request
         log_audit_event(
@@ -427,9 +1222,13 @@ Bitte geben Sie eine strukturierte, professionelle Antwort auf Deutsch."""
             success=True,
         )
 
+    except RateLimitExceeded as e:
+        raise_rate_limited(e, request.model, time.time() - start_time)
+
     except Exception as e:
         processing_time = time.time() - start_time
         error_message = str(e)
+        gemini_requests.inc(outcome="error")
 
         # Enhanced error handling
         if "429" in error_message or "rate limit" in error_message.lower():
@@ -460,6 +1259,32 @@ Bitte geben Sie eine strukturierte, professionelle Antwort auf Deutsch."""
         )
 
 
+def raise_rate_limited(error: RateLimitExceeded, model: str, processing_time: float):
+    """Audit a rate-limit rejection and answer with a fast 429 carrying the ETA"""
+    gemini_requests.inc(outcome="rate_limited")
+    log_audit_event(
+        "gemini_chat_rate_limited",
+        {
+            "model": model,
+            "error": "rate_limit",
+            "retry_after": round(error.retry_after, 2),
+            "processing_time": processing_time,
+        },
+        False,
+    )
+    raise HTTPException(
+        status_code=429,
+        detail={
+            "message": "Rate limit exceeded. Please wait a moment and try again.",
+            "retry_after_seconds": round(error.retry_after, 2),
+            "retry_at": datetime.fromtimestamp(
+                time.time() + error.retry_after
+            ).isoformat(),
+        },
+        headers={"Retry-After": error.retry_after_header},
+    )
+
+
 async def call_gemini_api_with_retry(
     api_key: str,
     model: str,
@@ -467,8 +1292,13 @@ async def call_gemini_api_with_retry(
     temperature: float = 0.7,
     max_tokens: int = 2048,
     max_retries: int = 3,
+    limiter_key: Optional[str] = None,
 ):
-    """Call Gemini API with exponential backoff retry logic"""
+    """Call Gemini API with exponential backoff retry logic
+
+    Upstream 429s are not retried in-process: the Retry-After is applied to the
+    caller's token bucket and RateLimitExceeded is raised so the client gets an ETA.
+    """
 
     for attempt in range(max_retries):
         try:
@@ -522,17 +1352,18 @@ async def call_gemini_api_with_retry(
                         raise Exception("Empty response from Gemini API")
 
                     elif response.status == 429:  # Rate limit
-                        if attempt < max_retries - 1:
-                            wait_time = (2**attempt) * 2  # Exponential backoff
-                            logger.warning(
-                                f"Rate limited, waiting {wait_time}s before retry {attempt + 1}"
-                            )
-                            await asyncio.sleep(wait_time)
-                            continue
-                        else:
-                            raise Exception(
-                                "Rate limit exceeded - please try again later"
-                            )
+                        retry_after = parse_retry_after(
+                            response.headers.get("Retry-After"),
+                            default=(2**attempt) * 2,
+                        )
+                        if limiter_key:
+                            rate_limiter.penalize(limiter_key, retry_after)
+                        logger.warning(
+                            f"Gemini rate limited, Retry-After {retry_after:.1f}s"
+                        )
+                        raise RateLimitExceeded(
+                            retry_after, "Rate limit exceeded - please try again later"
+                        )
 
                     elif response.status == 403:
                         raise Exception("Invalid API key or insufficient permissions")
@@ -552,6 +1383,9 @@ async def call_gemini_api_with_retry(
             else:
                 raise Exception("Request timeout - please try again")
 
+        except RateLimitExceeded:
+            raise
+
         except Exception as e:
             if attempt < max_retries - 1 and "rate limit" in str(e).lower():
                 wait_time = (2**attempt) * 2
@@ -564,76 +1398,32 @@ async def call_gemini_api_with_retry(
 @app.get("/api/health", response_model=SystemHealthResponse)
 async def get_enhanced_system_health():
     """Enhanced system health with mobile optimization status"""
-    # Check Ollama status
-    ollama_status = "offline"
+    # Ollama status from the cached inventory (refreshed in the background)
+    inventory = await ollama_inventory.get()
+    ollama_status = inventory["status"]
     available_models = []
+    router_stats = model_router.stats()
 
-    try:
-        result = subprocess.run(
-            ["ollama", "list"], capture_output=True, text=True, timeout=5
-        )
-        if result.returncode == 0:
-            ollama_status = "online"
-
-            # Model configurations
-            model_configs = {
-                "llama3": {
-                    "name": "Llama 3",
-                    "description": "Enterprise-grade general analysis",
-                    "specialized_for": ["regulatory_compliance", "business_analysis"],
-                    "performance": "balanced",
-                    "mobile_friendly": True,
-                },
-                "llama3.1": {
-                    "name": "Llama 3.1",
-                    "description": "Advanced reasoning for complex scenarios",
-                    "specialized_for": ["complex_mapping", "multi_system_analysis"],
-                    "performance": "enhanced",
-                    "mobile_friendly": True,
-                },
-                "mistral": {
-                    "name": "Mistral",
-                    "description": "High-speed error detection",
-                    "specialized_for": ["rapid_analysis", "error_detection"],
-                    "performance": "fast",
-                    "mobile_friendly": True,
-                },
-                "gemma2": {
-                    "name": "Gemma 2",
-                    "description": "Structured data validation specialist",
-                    "specialized_for": ["data_validation", "schema_analysis"],
-                    "performance": "precise",
-                    "mobile_friendly": True,
-                },
-            }
-
-            # Get installed models
-            lines = result.stdout.strip().split("\n")[1:]
-            installed_models = set()
-            for line in lines:
-                if line.strip():
-                    model_name = line.split()[0].split(":")[0]
-                    installed_models.add(model_name)
-
-            # Build enhanced model list
-            for model_id, config in model_configs.items():
-                status = (
-                    "available" if model_id in installed_models else "not_installed"
-                )
-                available_models.append(
-                    {
-                        "id": model_id,
-                        "name": config["name"],
-                        "description": config["description"],
-                        "status": status,
-                        "specialized_for": config["specialized_for"],
-                        "performance": config["performance"],
-                        "mobile_friendly": config["mobile_friendly"],
-                    }
-                )
+    if ollama_status == "online":
+        installed_models = {m["id"] for m in inventory["installed"]}
+        loaded_models = {m["id"] for m in inventory["loaded"]}
 
-    except (subprocess.TimeoutExpired, FileNotFoundError):
-        ollama_status = "not_installed"
+        # Build enhanced model list
+        for model_id, config in MODEL_CONFIGS.items():
+            status = "available" if model_id in installed_models else "not_installed"
+            available_models.append(
+                {
+                    "id": model_id,
+                    "name": config["name"],
+                    "description": config["description"],
+                    "status": status,
+                    "loaded": model_id in loaded_models,
+                    "specialized_for": config["specialized_for"],
+                    "performance": config["performance"],
+                    "mobile_friendly": config["mobile_friendly"],
+                    "live_stats": router_stats["models"].get(model_id),
+                }
+            )
 
     # Check Gemini proxy status
     gemini_proxy_status = "available"
@@ -660,18 +1450,19 @@ async def get_enhanced_system_health():
     }
 
     # Enhanced system metrics
+    rate_limit_stats = rate_limiter.stats()
     system_metrics = {
-        "uptime": "99.9%",
-        "avg_response_time": "1.2s",
-        "total_analyses": len(audit_logs),
-        "success_rate": "98.5%",
-        "mobile_requests": "45%",
-        "gemini_api_calls": len(
-            [log for log in audit_logs if log.action.startswith("gemini")]
-        ),
-        "rate_limit_hits": len(
-            [log for log in audit_logs if "rate_limit" in log.details.get("error", "")]
-        ),
+        **request_metrics_summary(),
+        "total_analyses": audit_store.total_events,
+        "audit_store": audit_store.stats(),
+        "gemini_api_calls": int(gemini_requests.value()),
+        "rate_limit_hits": rate_limit_stats["rejected"]
+        + rate_limit_stats["upstream_429"],
+        "rate_limiter": rate_limit_stats,
+        "llm_queue_depth": llm_scheduler.queued,
+        "llm_running": llm_scheduler.running,
+        "ollama_inventory": ollama_inventory.stats(),
+        "loaded_models": [m["name"] for m in inventory["loaded"]],
     }
 
     return SystemHealthResponse(
@@ -695,104 +1486,196 @@ async def upload_corporate_documents(
     department: Optional[str] = Form(None),
     analyst_id: Optional[str] = Form(None),
 ):
-    """Enhanced document upload with mobile optimization"""
+    """Store uploaded documents and queue them for background ingestion
+
+    Returns at once with a job ID; GET /api/documents/jobs/{job_id} reports
+    each file's stage (stored, parsed, chunked, embedded, indexed). ZIP and TAR
+    archives are accepted; their supported members are ingested like files.
+    """
     if category not in ["rag", "cag", "mapping"]:
         raise HTTPException(status_code=400, detail="Invalid document category")
 
+    stored_files = []
+    # Content hashes this request registered as new; released again (with the
+    # stored files) when the request fails before its ingestion job is queued
+    claimed = []
+
+    def release_claims():
+        for sha256 in claimed:
+            document_manifest.forget(category, sha256)
+        for stored in stored_files:
+            try:
+                os.unlink(stored["path"])
+            except OSError:
+                pass
+
     try:
-        processed_files = []
-        total_chunks = 0
+        duplicate_files = []
+        skipped_members = []
         target_dir = f"{category}_docs"
         os.makedirs(target_dir, exist_ok=True)
 
+        # Content already in the manifest (under any name) is discarded instead
+        # of re-ingested; the matching entries are kept per stored file name
+        duplicate_of = {}
+
+        def keep_new_content(filename: str, sha256: str, size: int) -> bool:
+            entry = document_manifest.claim(
+                category, sha256, filename, size, analyst_id=analyst_id
+            )
+            duplicate_of[filename] = entry
+            if entry is None:
+                claimed.append(sha256)
+            return entry is None
+
+        def duplicate_record(stored: Dict[str, Any]) -> Dict[str, Any]:
+            entry = duplicate_of[stored["filename"]]
+            return {
+                "filename": stored["filename"],
+                "sha256": stored["sha256"],
+                "size": stored["size"],
+                "duplicate_of": entry["filename"],
+                "status": entry["status"],
+                "chunks": entry["chunks"],
+                "saved_processing_seconds": entry["processing_seconds"],
+            }
+
         for file in files:
-            if file.size and file.size > MAX_FILE_SIZE:
-                raise HTTPException(
-                    status_code=413,
-                    detail=f"File {file.filename} exceeds maximum size of {MAX_FILE_SIZE/1024/1024:.1f}MB",
+            if archive_format(file.filename):
+                # Members are streamed from the archive into target_dir one at
+                # a time and join the same ingestion job as loose files
+                try:
+                    extracted = await asyncio.to_thread(
+                        extract_archive,
+                        file.file,
+                        file.filename,
+                        target_dir,
+                        ALLOWED_DOCUMENT_EXTENSIONS,
+                        MAX_FILE_SIZE,
+                        ARCHIVE_MAX_MEMBERS,
+                        ARCHIVE_MAX_TOTAL_SIZE,
+                        keep_if=keep_new_content,
+                    )
+                except ArchiveError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                archive_name = Path(file.filename).name
+                for stored in extracted["members"]:
+                    if not stored["stored"]:
+                        duplicate_files.append(
+                            {**duplicate_record(stored), "archive": archive_name}
+                        )
+                        continue
+                    stored_files.append(
+                        {
+                            **stored,
+                            "size_mb": round(stored["size"] / 1024 / 1024, 2),
+                            "type": Path(stored["filename"]).suffix.lower(),
+                            "archive": archive_name,
+                        }
+                    )
+                skipped_members.extend(
+                    {**skipped, "archive": archive_name}
+                    for skipped in extracted["skipped"]
                 )
+                continue
 
-            allowed_extensions = [
-                ".txt",
-                ".pdf",
-                ".md",
-                ".csv",
-                ".xlsx",
-                ".docx",
-                ".json",
-                ".sql",
-            ]
             file_extension = Path(file.filename).suffix.lower()
 
-            if file_extension not in allowed_extensions:
+            if file_extension not in ALLOWED_DOCUMENT_EXTENSIONS:
                 logger.warning(f"Skipping unsupported file type: {file.filename}")
                 continue
 
-            content = await file.read()
-            file_path = os.path.join(target_dir, file.filename)
-
-            with open(file_path, "wb") as f:
-                f.write(content)
-
-            # Process for vector storage
-            chunks_count = 0
-            if category in ["rag", "cag"]:
-                with tempfile.NamedTemporaryFile(
-                    delete=False, suffix=file_extension
-                ) as temp_file:
-                    temp_file.write(content)
-                    temp_path = temp_file.name
+            # Streamed to its final location; the limit applies to the bytes
+            # received, not to the client-declared size
+            def keep_new_file(sha256: str, size: int, file=file) -> bool:
+                return keep_new_content(safe_filename(file.filename), sha256, size)
+
+            try:
+                stored = await asyncio.to_thread(
+                    store_upload,
+                    file.file,
+                    file.filename,
+                    target_dir,
+                    MAX_FILE_SIZE,
+                    keep_if=keep_new_file,
+                )
+            except UploadTooLarge as e:
+                raise HTTPException(status_code=413, detail=str(e))
 
-                try:
-                    documents = process_document(temp_path)
-                    if documents:
-                        chunks = split_documents(documents)
-                        build_vectordb(chunks, target_dir)
-                        chunks_count = len(chunks)
-                        total_chunks += chunks_count
-                        logger.info(
-                            f"Successfully processed {file.filename}: {chunks_count} chunks"
-                        )
-                finally:
-                    os.unlink(temp_path)
+            if not stored["stored"]:
+                duplicate_files.append(duplicate_record(stored))
+                continue
 
-            processed_files.append(
+            stored_files.append(
                 {
-                    "filename": file.filename,
-                    "size": len(content),
-                    "size_mb": round(len(content) / 1024 / 1024, 2),
-                    "chunks": chunks_count,
+                    **stored,
+                    "size_mb": round(stored["size"] / 1024 / 1024, 2),
                     "type": file_extension,
-                    "category": category,
-                    "mobile_optimized": True,
                 }
             )
 
+        if not stored_files and not duplicate_files:
+            raise HTTPException(status_code=400, detail="No supported files uploaded")
+
+        job = (
+            ingestion_jobs.submit(
+                category, stored_files, department=department, analyst_id=analyst_id
+            )
+            if stored_files
+            else None
+        )
+        claimed.clear()
+        total_size_mb = round(sum(f["size_mb"] for f in stored_files), 2)
+        skipped_bytes = sum(f["size"] for f in duplicate_files)
+        saved_seconds = round(
+            sum(f["saved_processing_seconds"] or 0 for f in duplicate_files), 3
+        )
+
         log_audit_event(
             "document_upload_enhanced",
             {
                 "category": category,
-                "file_count": len(processed_files),
-                "total_chunks": total_chunks,
+                "job_id": job["job_id"] if job else None,
+                "file_count": len(stored_files),
+                "duplicate_count": len(duplicate_files),
+                "skipped_bytes": skipped_bytes,
+                "skipped_archive_members": len(skipped_members),
                 "department": department,
                 "analyst_id": analyst_id,
                 "mobile_upload": True,
-                "total_size_mb": sum(f["size_mb"] for f in processed_files),
+                "total_size_mb": total_size_mb,
             },
         )
 
-        return {
-            "success": True,
-            "category": category,
-            "processed_files": processed_files,
-            "total_chunks": total_chunks,
-            "total_size_mb": sum(f["size_mb"] for f in processed_files),
-            "mobile_optimized": True,
-            "audit_id": len(audit_logs),
-            "message": f"Successfully processed {len(processed_files)} files",
-        }
+        return JSONResponse(
+            status_code=202 if job else 200,
+            content={
+                "success": True,
+                "category": category,
+                "job_id": job["job_id"] if job else None,
+                "status": job["status"] if job else "completed",
+                "status_url": f"/api/documents/jobs/{job['job_id']}" if job else None,
+                "processed_files": [
+                    {k: v for k, v in f.items() if k not in ("path", "stored")}
+                    for f in (job["files"] if job else [])
+                ],
+                "duplicate_files": duplicate_files,
+                "skipped_archive_members": skipped_members,
+                "skipped_bytes": skipped_bytes,
+                "saved_processing_seconds": saved_seconds,
+                "total_size_mb": total_size_mb,
+                "mobile_optimized": True,
+                "audit_id": audit_store.total_events,
+                "message": f"Queued {len(stored_files)} files for ingestion, "
+                f"{len(duplicate_files)} already stored",
+            },
+        )
 
+    except HTTPException:
+        release_claims()
+        raise
     except Exception as e:
+        release_claims()
         log_audit_event(
             "document_upload_failed",
             {
@@ -806,13 +1689,34 @@ async def upload_corporate_documents(
         raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
 
 
+@app.get("/api/documents/jobs")
+async def list_ingestion_jobs(limit: int = 50):
+    """Recent document ingestion jobs, newest first"""
+    return {
+        "jobs": ingestion_jobs.list(limit),
+        **ingestion_jobs.stats(),
+        "stored_documents": document_manifest.stats(),
+    }
+
+
+@app.get("/api/documents/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """Status and per-file stage of a document ingestion job"""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    for file_info in job["files"]:
+        file_info.pop("path", None)
+    return job
+
+
 @app.post("/api/analyze/mapping")
 async def analyze_mapping_errors(
     request: CorporateAnalysisRequest,
 ) -> CorporateAnalysisResponse:
     """Enhanced mapping error analysis with mobile optimization"""
     analysis_id = (
-        f"ANALYSIS_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{len(audit_logs)+1:04d}"
+        f"ANALYSIS_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{audit_store.total_events+1:04d}"
     )
 
     try:
@@ -823,73 +1727,47 @@ async def analyze_mapping_errors(
                 "model": request.model,
                 "error_type": request.error_type,
                 "priority": request.priority_level,
+                "lane": normalize_priority(request.priority_level),
                 "department": request.department,
                 "analyst_id": request.analyst_id,
                 "mobile_optimized": True,
             },
         )
 
-        # Build comprehensive context
-        context_parts = []
-        sources_used = []
-
-        if "rag" in request.context_sources or "cag" in request.context_sources:
-            retriever = get_combined_retriever()
-            if retriever:
-                docs = retriever.get_relevant_documents(request.query)
-                if docs:
-                    context_parts.append("[REGULATORY & BUSINESS CONTEXT]")
-                    for i, doc in enumerate(docs[:MAX_CONTEXT_DOCS]):
-                        source = Path(doc.metadata.get("source", "Unknown")).name
-                        if source not in sources_used:
-                            sources_used.append(source)
-
-                        doc_type = (
-                            "RAG"
-                            if "rag_docs" in doc.metadata.get("source", "")
-                            else "CAG"
-                        )
-                        context_parts.append(
-                            f"[{doc_type}] {source}:\n{doc.page_content[:800]}"
-                        )
-
-        # Enhanced analysis prompt
-        context_section = "\n".join(context_parts) if context_parts else ""
-
-        system_prompt = f"""Du bist ein Senior Business Analyst bei {CORPORATE_CONFIG['organization']} und spezialisiert auf regulatorische Berichterstattung und Unternehmensdaten-Mapping.
-
-UNTERNEHMENSKONTEXT:
-Organisation: {CORPORATE_CONFIG['organization']}
-Analyse-ID: {analysis_id}
-Prioritätsstufe: {request.priority_level.upper()}
-Abteilung: {request.department or 'Enterprise Analytics'}
-Mobile-optimiert: Ja
-
-VERFÜGBARER KONTEXT:
-{context_section}
-
-BENUTZERANFRAGE: {request.query}
-
-ENHANCED ANALYSE-FRAMEWORK:
-1. MOBILE-FREUNDLICHE ZUSAMMENFASSUNG: Kurze, prägnante Übersicht
-2. GESCHÄFTSAUSWIRKUNGSBEWERTUNG: Operative und regulatorische Auswirkungen
-3. TECHNISCHE URSACHENANALYSE: Genaue Standorte und Ursachen
-4. COMPLIANCE-AUSWIRKUNGEN: Regulatorische und Audit-Anforderungen
-5. MOBILE-OPTIMIERTE EMPFEHLUNGEN: Umsetzbare Schritte
-
-Analysetyp: {request.error_type.upper()}
-Priorität: {request.priority_level.upper()}
-
-Bitte geben Sie eine strukturierte Antwort auf Deutsch mit klaren Abschnitten."""
-
-        if request.custom_instructions:
-            system_prompt += (
-                f"\n\nZUSÄTZLICHE ANFORDERUNGEN:\n{request.custom_instructions}"
+        # Deterministic fast path: answer from the mapping rules when the query
+        # carries the position values; only real discrepancies go to the LLM
+        with tracer.span("rules"):
+            rule_check = (
+                mapping_rules.check_query(request.query, request.regime)
+                if request.use_rule_engine
+                else None
             )
+        if rule_check and rule_check["deterministic"] and not rule_check["discrepancy"]:
+            log_audit_event(
+                "analysis_completed_enhanced",
+                {
+                    "analysis_id": analysis_id,
+                    "confidence_score": 1.0,
+                    "model_used": "rule-engine",
+                    "regime": rule_check["regime"],
+                    "cache_status": "rules",
+                },
+            )
+            return build_rule_engine_response(analysis_id, rule_check)
 
-        # Get analysis from model
-        llm = get_llm_for_model(request.model)
-        analysis_result = llm.invoke(system_prompt)
+        context_section, sources_used = await asyncio.to_thread(
+            build_analysis_context,
+            request.query,
+            request.context_sources,
+            request.regime,
+        )
+        if rule_check:
+            context_section = f"{format_rule_check(rule_check)}\n\n{context_section}"
+        generation, cache_status = await run_mapping_generation(
+            request, context_section
+        )
+        analysis_result = generation["text"]
+        model_used = generation["model"]
 
         # Enhanced processing
         business_impact = (
@@ -924,10 +1802,11 @@ Bitte geben Sie eine strukturierte Antwort auf Deutsch mit klaren Abschnitten.""
             estimated_effort="3-5 Werktage (mobile-optimiert)",
             business_priority=business_priority,
             confidence_score=0.87,
-            model_used=request.model,
+            model_used=model_used,
             context_sources_used=sources_used,
             timestamp=datetime.now().isoformat(),
             analyst_notes=f"Mobile-optimierte Analyse mit {CORPORATE_CONFIG['organization']} Framework",
+            cache_status=cache_status,
         )
 
         log_audit_event(
@@ -936,7 +1815,9 @@ Bitte geben Sie eine strukturierte Antwort auf Deutsch mit klaren Abschnitten.""
                 "analysis_id": analysis_id,
                 "confidence_score": 0.87,
                 "business_priority": business_priority,
-                "model_used": request.model,
+                "model_used": model_used,
+                "route_reason": generation["route_reason"],
+                "cache_status": cache_status,
                 "mobile_optimized": True,
                 "sources_used": len(sources_used),
             },
@@ -944,6 +1825,27 @@ Bitte geben Sie eine strukturierte Antwort auf Deutsch mit klaren Abschnitten.""
 
         return response
 
+    except SchedulerOverloaded as e:
+        log_audit_event(
+            "analysis_shed",
+            {
+                "analysis_id": analysis_id,
+                "lane": e.lane,
+                "error": str(e),
+                "department": request.department,
+            },
+            False,
+        )
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "message": str(e),
+                "lane": e.lane,
+                "retry_after_seconds": round(e.retry_after, 1),
+            },
+            headers={"Retry-After": str(int(e.retry_after + 0.999))},
+        )
+
     except Exception as e:
         log_audit_event(
             "analysis_failed_enhanced",
@@ -969,70 +1871,486 @@ Bitte geben Sie eine strukturierte Antwort auf Deutsch mit klaren Abschnitten.""
 
 
 @app.get("/api/audit/logs")
-async def get_audit_logs(limit: int = 100, mobile_optimized: bool = False):
-    """Get audit logs with mobile optimization"""
-    logs = audit_logs[-limit:]
+async def get_audit_logs(
+    limit: int = 100,
+    mobile_optimized: bool = False,
+    cursor: Optional[int] = None,
+    action: Optional[str] = None,
+    analyst_id: Optional[str] = None,
+    department: Optional[str] = None,
+    model: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    success: Optional[bool] = None,
+):
+    """Get audit logs newest first; pass next_cursor back as cursor to page"""
+    page = await asyncio.to_thread(
+        audit_store.query,
+        cursor=cursor,
+        limit=limit,
+        since=since,
+        until=until,
+        success=success,
+        action=action,
+        analyst_id=analyst_id,
+        department=department,
+        model=model,
+    )
+    logs = page["events"]
 
     if mobile_optimized:
         logs = [
             {
-                "id": log.timestamp,
-                "action": log.action,
+                "id": log["id"],
+                "action": log["action"],
                 "details": {
                     k: v
-                    for k, v in log.details.items()
+                    for k, v in log["details"].items()
                     if k in ["model", "error", "mobile_optimized"]
                 },
-                "success": log.success,
-                "timestamp": log.timestamp,
+                "success": log["success"],
+                "timestamp": log["timestamp"],
             }
             for log in logs
         ]
 
     return {
         "logs": logs,
-        "total_count": len(audit_logs),
+        "next_cursor": page["next_cursor"],
+        "total_count": audit_store.total_events,
         "mobile_optimized": mobile_optimized,
         "corporate_info": CORPORATE_CONFIG,
     }
 
 
+@app.get("/api/audit/aggregates")
+async def get_audit_aggregates(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    action: Optional[str] = None,
+    bucket: str = "hour",
+):
+    """Event and failure counts per action per hour or day"""
+    if bucket not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="bucket must be hour or day")
+    counts = await asyncio.to_thread(
+        audit_store.hourly_counts,
+        since=since,
+        until=until,
+        action=action,
+        bucket=bucket,
+    )
+    return {"bucket": bucket, "counts": counts}
+
+
 @app.get("/api/models")
 async def get_model_status():
     """Get available models with mobile optimization info"""
+    inventory = await ollama_inventory.get()
+    if inventory["status"] != "online":
+        return {
+            "models": [],
+            "status": "error",
+            "message": f"Ollama service unavailable: {inventory['error']}",
+        }
+
+    loaded = {m["name"]: m for m in inventory["loaded"]}
+    models = [
+        {
+            "name": model["name"],
+            "status": "available",
+            "size": model["size"],
+            "details": model["details"],
+            "loaded": model["name"] in loaded,
+            "residency": loaded.get(model["name"]),
+            "enterprise_ready": True,
+            "mobile_optimized": True,
+        }
+        for model in inventory["installed"]
+    ]
+    return {
+        "models": models,
+        "status": "success",
+        "checked_at": inventory["checked_at"],
+        "mobile_optimized": True,
+    }
+
+
+@app.get("/api/rate-limit/stats")
+async def get_rate_limit_stats():
+    """Get per-key rate limiter rejection and wait statistics"""
+    return {
+        "gemini": rate_limiter.stats(),
+        "per_analyst": RATE_LIMIT_PER_ANALYST,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+@app.get("/api/scheduler/stats")
+async def get_scheduler_stats():
+    """Get LLM scheduler queue depth, shedding and per-lane queue times"""
+    return {
+        "llm_scheduler": llm_scheduler.stats(),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+@app.get("/api/models/routing")
+async def get_model_routing_stats():
+    """Get rolling per-model latency, throughput and error statistics used by auto"""
+    return {
+        "auto_model": AUTO_MODEL,
+        "router": model_router.stats(),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+@app.get("/api/cache/stats")
+async def get_response_cache_stats():
+    """Get analysis response cache hit, coalescing and eviction statistics"""
+    return {
+        "analysis_cache": response_cache.stats(),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+@app.delete("/api/cache")
+async def clear_response_cache():
+    """Drop all cached analysis responses (e.g. after re-indexing documents)"""
+    response_cache.invalidate()
+    log_audit_event("response_cache_cleared", {})
+    return {"success": True}
+
+
+@app.get("/api/mapping/rules")
+async def get_mapping_rules():
+    """Mapping rule sets compiled from the mapping documents"""
+    return mapping_rules.summary()
+
+
+@app.post("/api/mapping/rules/reload")
+async def reload_mapping_rules():
+    """Re-parse the mapping documents"""
+    return await asyncio.to_thread(reload_mapping_documents)
+
+
+@app.get("/api/mapping/lineage")
+async def get_lineage_index():
+    """Size of the field lineage graph per mapping"""
+    return lineage_index.summary()
+
+
+@app.get("/api/mapping/lineage/{field}")
+async def get_field_lineage(field: str, regime: Optional[str] = None):
+    """Derivation of a field back to its source columns"""
+    subgraphs = lineage_index.lineage(field, regime)
+    if not subgraphs:
+        raise HTTPException(status_code=404, detail=f"No lineage found for {field}")
+    return {"field": field.upper(), "lineage": subgraphs}
+
+
+@app.post("/api/mapping/evaluate")
+async def evaluate_mapping_rules(request: MappingEvaluationRequest):
+    """Expected field values for one position with the exact matching rule"""
+    started = time.perf_counter()
     try:
-        result = subprocess.run(
-            ["ollama", "list"], capture_output=True, text=True, timeout=5
-        )
-        if result.returncode == 0:
-            lines = result.stdout.strip().split("\n")[1:]
-            models = []
-            for line in lines:
-                if line.strip():
-                    parts = line.split()
-                    model_name = parts[0]
-                    models.append(
-                        {
-                            "name": model_name,
-                            "status": "available",
-                            "enterprise_ready": True,
-                            "mobile_optimized": True,
-                        }
-                    )
-            return {"models": models, "status": "success", "mobile_optimized": True}
+        if request.fields:
+            results = [
+                mapping_rules.evaluate(request.position, field, request.regime)
+                for field in request.fields
+            ]
         else:
-            return {
-                "models": [],
-                "status": "error",
-                "message": "Ollama service unavailable",
-            }
+            check = mapping_rules.check_position(
+                request.position, regime=request.regime
+            )
+            results = check["results"] if check else []
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e).strip("'\""))
+    return {
+        "results": results,
+        "discrepancy": any(r["matches"] is False for r in results),
+        "evaluation_time_us": round((time.perf_counter() - started) * 1e6, 1),
+    }
+
+
+@app.post("/api/batch/positions")
+async def submit_position_batch(
+    file: UploadFile = File(...),
+    question: str = Form(
+        "Analysiere diese Position auf Mapping-Fehler (CRR2/CRR3 Meldefelder)"
+    ),
+    model: str = Form(DEFAULT_MODEL),
+    error_type: str = Form("data_inconsistency"),
+    priority_level: str = Form("low"),
+    retrieval_fields: Optional[str] = Form(None),
+    department: Optional[str] = Form(None),
+    analyst_id: Optional[str] = Form(None),
+    custom_instructions: Optional[str] = Form(None),
+):
+    """Queue one mapping analysis per row of an uploaded CSV/XLSX of positions"""
+    if Path(file.filename).suffix.lower() not in [".csv", ".xlsx"]:
+        raise HTTPException(status_code=400, detail="Only CSV or XLSX files supported")
+    if file.size and file.size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File {file.filename} exceeds maximum size of {MAX_FILE_SIZE/1024/1024:.1f}MB",
+        )
+
+    content = await file.read()
+    try:
+        df = await asyncio.to_thread(parse_position_file, file.filename, content)
     except Exception as e:
-        return {"models": [], "status": "error", "message": str(e)}
+        raise HTTPException(status_code=400, detail=f"Could not parse file: {str(e)}")
+    if df.empty:
+        raise HTTPException(status_code=400, detail="File contains no positions")
+    if len(df) > BATCH_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File has {len(df)} rows, maximum is {BATCH_MAX_ROWS}",
+        )
+
+    if retrieval_fields is not None:
+        fields = [f.strip() for f in retrieval_fields.split(",") if f.strip()]
+        unknown = [f for f in fields if f not in df.columns]
+        if unknown:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown retrieval fields: {unknown}"
+            )
+    else:
+        fields = select_retrieval_fields(df)
+
+    rows = df.to_dict(orient="records")
+    retrieval_keys = [
+        json.dumps([row[f] for f in fields], ensure_ascii=False) if fields else str(i)
+        for i, row in enumerate(rows)
+    ]
+    options = {
+        "question": question,
+        "model": model,
+        "error_type": error_type,
+        "priority_level": priority_level,
+        "retrieval_fields": fields,
+        "department": department,
+        "analyst_id": analyst_id,
+        "custom_instructions": custom_instructions,
+    }
+    job_id = await asyncio.to_thread(
+        batch_store.create_job, rows, retrieval_keys, options, file.filename
+    )
+    batch_pool.notify()
+
+    log_audit_event(
+        "batch_submitted",
+        {
+            "job_id": job_id,
+            "rows": len(rows),
+            "distinct_retrievals": len(set(retrieval_keys)),
+            "retrieval_fields": fields,
+            "model": model,
+            "department": department,
+        },
+        user_id=analyst_id,
+    )
+
+    return await asyncio.to_thread(batch_store.job_progress, job_id)
+
+
+@app.get("/api/batch/jobs")
+async def list_batch_jobs(limit: int = 50):
+    """Recent batch jobs with progress"""
+    jobs = await asyncio.to_thread(batch_store.list_jobs, limit)
+    return {"jobs": jobs, "workers": batch_pool.workers, "running": batch_pool.running}
+
+
+@app.get("/api/batch/jobs/{job_id}")
+async def get_batch_job(job_id: str):
+    """Progress of one batch job"""
+    progress = await asyncio.to_thread(batch_store.job_progress, job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return progress
+
+
+@app.get("/api/batch/jobs/{job_id}/results")
+async def get_batch_results(
+    job_id: str, offset: int = 0, limit: int = 100, status: Optional[str] = None
+):
+    """Per-row results, available while the job is still running"""
+    progress = await asyncio.to_thread(batch_store.job_progress, job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    results = await asyncio.to_thread(
+        batch_store.results, job_id, offset, min(limit, 1000), status
+    )
+    return {"job": progress, "offset": offset, "results": results}
+
+
+@app.post("/api/batch/jobs/{job_id}/cancel")
+async def cancel_batch_job(job_id: str):
+    """Cancel the pending rows of a batch job (rows in progress finish)"""
+    if await asyncio.to_thread(batch_store.job_progress, job_id) is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    cancelled = await asyncio.to_thread(batch_store.cancel_job, job_id)
+    log_audit_event("batch_cancelled", {"job_id": job_id, "cancelled": cancelled})
+    return await asyncio.to_thread(batch_store.job_progress, job_id)
+
+
+@app.post("/api/validation/positions")
+async def validate_positions(
+    file: UploadFile = File(...),
+    fields: Optional[str] = Form(None),
+    regime: Optional[str] = Form(None),
+    enqueue_analysis: bool = Form(False),
+    model: str = Form(DEFAULT_MODEL),
+    department: Optional[str] = Form(None),
+    analyst_id: Optional[str] = Form(None),
+):
+    """Check every row of a position extract against the mapping rules
+
+    The extract is streamed to disk and validated in chunks, so its size is not
+    bounded by MAX_FILE_SIZE. Mismatching rows can optionally be queued as a
+    batch job for LLM analysis.
+    """
+    suffix = Path(file.filename).suffix.lower()
+    if suffix not in [".csv", ".txt", ".parquet", ".xlsx"]:
+        raise HTTPException(
+            status_code=400, detail="Only CSV, TXT, Parquet or XLSX files supported"
+        )
+    if not mapping_rules.mappings:
+        raise HTTPException(status_code=503, detail="No mapping rules loaded")
+
+    validation_id = uuid.uuid4().hex[:12]
+    VALIDATION_RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    output_path = VALIDATION_RESULTS_DIR / f"{validation_id}.csv"
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        await asyncio.to_thread(shutil.copyfileobj, file.file, tmp)
+        tmp_path = tmp.name
+    try:
+        summary = await asyncio.to_thread(
+            validate_positions_file,
+            tmp_path,
+            mapping_rules,
+            fields=field_list,
+            regime=regime,
+            chunk_size=VALIDATION_CHUNK_SIZE,
+            output_path=str(output_path),
+            sample_limit=100,
+            collect_rows=BATCH_MAX_ROWS if enqueue_analysis else 0,
+        )
+    except Exception as e:
+        logger.error(f"❌ Validation of {file.filename} failed: {e}")
+        raise HTTPException(status_code=400, detail=f"Validation failed: {str(e)}")
+    finally:
+        os.unlink(tmp_path)
+
+    mismatch_rows = summary.pop("mismatch_rows")
+    job_id = None
+    if enqueue_analysis and mismatch_rows:
+        retrieval_fields = select_retrieval_fields(pd.DataFrame(mismatch_rows))
+        retrieval_keys = [
+            json.dumps([row[f] for f in retrieval_fields], ensure_ascii=False)
+            if retrieval_fields
+            else str(i)
+            for i, row in enumerate(mismatch_rows)
+        ]
+        options = {
+            "question": "Analysiere diese Position auf Mapping-Fehler "
+            "(CRR2/CRR3 Meldefelder)",
+            "model": model,
+            "error_type": "data_inconsistency",
+            "priority_level": "low",
+            "retrieval_fields": retrieval_fields,
+            "department": department,
+            "analyst_id": analyst_id,
+            "custom_instructions": None,
+        }
+        job_id = await asyncio.to_thread(
+            batch_store.create_job,
+            mismatch_rows,
+            retrieval_keys,
+            options,
+            file.filename,
+        )
+        batch_pool.notify()
+
+    log_audit_event(
+        "positions_validated",
+        {
+            "validation_id": validation_id,
+            "filename": file.filename,
+            "rows": summary["rows"],
+            "mismatches": summary["mismatches"],
+            "rows_per_sec": summary["rows_per_sec"],
+            "batch_job_id": job_id,
+            "department": department,
+        },
+        user_id=analyst_id,
+    )
+
+    return {
+        "validation_id": validation_id,
+        "filename": file.filename,
+        "batch_job_id": job_id,
+        **summary,
+        "result_file": (
+            f"/api/validation/results/{validation_id}"
+            if summary["result_file"]
+            else None
+        ),
+    }
+
+
+@app.get("/api/validation/results/{validation_id}")
+async def get_validation_results(validation_id: str):
+    """Download the mismatching rows of a validation run as CSV"""
+    path = VALIDATION_RESULTS_DIR / f"{Path(validation_id).name}.csv"
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Validation result not found")
+    return FileResponse(path, media_type="text/csv", filename=path.name)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/api/profiles")
+async def list_profiles(request: Request, limit: int = 50):
+    """Recent request profiles, newest first"""
+    require_profile_admin(request)
+    return {
+        "enabled": bool(PROFILE_ADMIN_TOKEN or PROFILE_SAMPLE_RATE > 0),
+        "sample_rate": PROFILE_SAMPLE_RATE,
+        "modes": list(PROFILE_MODES),
+        "profiles": await asyncio.to_thread(request_profiler.list, limit),
+    }
+
+
+@app.get("/api/profiles/{profile_id}")
+async def get_profile(request: Request, profile_id: str, format: str = "json"):
+    """Profile summary, or a download: collapsed (flame graph), pstats or txt"""
+    require_profile_admin(request)
+    if format == "json":
+        info = await asyncio.to_thread(request_profiler.get, profile_id)
+        if info is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return info
+    path = request_profiler.file_path(profile_id, format)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile file not found")
+    media_type = "application/octet-stream" if format == "pstats" else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=path.name)
 
 
 @app.get("/api/mobile/status")
 async def get_mobile_status():
     """Get mobile-specific status information"""
+    summary = request_metrics_summary()
     return {
         "mobile_optimized": True,
         "responsive_design": True,
@@ -1045,9 +2363,9 @@ async def get_mobile_status():
             "push_notifications": False,
         },
         "performance": {
-            "avg_load_time": "1.2s",
-            "mobile_usage": "45%",
-            "satisfaction_score": "4.8/5",
+            "latency_seconds": http_latency.summary(),
+            "mobile_share": summary["mobile_share"],
+            "requests_total": summary["requests_total"],
         },
     }
 
@@ -1060,7 +2378,7 @@ async def get_troubleshooting_info():
             "gemini_rate_limit": {
                 "description": "429 Rate limit exceeded errors",
                 "solutions": [
-                    "Wait 60 seconds between requests",
+                    "Wait for the Retry-After interval returned with the 429",
                     "Upgrade to paid Gemini API tier",
                     "Use smaller batch sizes",
                     "Implement exponential backoff",
@@ -2,48 +2,105 @@ import streamlit as st
 import pandas as pd
 import sqlite3
 import os
+import hashlib
 import shutil
 from pathlib import Path
 from langchain_community.llms import Ollama
 from utils.ui import custom_divider
+from utils.sql_schema import SchemaIndex, database_fingerprint, introspect_schema
+from utils.sql_cache import SqlTranslationCache, fingerprint
+from utils.sql_execution import QueryCursor, QueryTimeout, execute_statement, returns_rows
+from utils.sql_index_advisor import IndexAdvisor, working_copy_path
+from utils.store_versions import active_store_path
+
+SQL_CACHE_PATH = os.getenv("SQL_CACHE_PATH", "sql_cache.db")
+SQL_PAGE_SIZE = int(os.getenv("SQL_PAGE_SIZE", "500"))
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "10000"))
+SQL_QUERY_TIMEOUT = float(os.getenv("SQL_QUERY_TIMEOUT", "30"))
+INDEX_ADVICE_PATH = os.getenv("INDEX_ADVICE_PATH", "index_advice.json")
+INDEX_ADVISOR_MIN_ROWS = int(os.getenv("INDEX_ADVISOR_MIN_ROWS", "10000"))
 
 # Import the RAG/CAG retrieval functions from rag_cag.py
 try:
-    from pages.rag_cag import get_retriever, get_combined_retriever
+    from pages.rag_cag import get_retriever, get_combined_retriever, get_embeddings
 except ImportError:
     # If import fails due to circular dependency, define dummy functions
     def get_retriever(dir_name):
         return None
     def get_combined_retriever():
         return None
+    def get_embeddings():
+        return None
 
 # LLM Setup - Note: Only initialize if needed
 def get_llm():
     return Ollama(model="llama3")
 
-# Database structure function - MOVED OUTSIDE
-def get_database_structure(db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view');")
-    tables = cursor.fetchall()
-
-    structure = {}
-    for table in tables:
-        table_name, table_type = table
-        structure[table_name] = {"type": table_type, "columns": []}
-        cursor.execute(f"PRAGMA table_info({table_name});")
-        columns = cursor.fetchall()
-        for column in columns:
-            structure[table_name]["columns"].append({"name": column[1], "type": column[2]})
-    conn.close()
-    return structure
+# Schema introspected once per database content, keyed by the file's SHA-256
+@st.cache_resource(max_entries=8)
+def load_schema_index(fingerprint, db_path):
+    return SchemaIndex(introspect_schema(db_path))
+
+def get_schema_index(db_path):
+    return load_schema_index(database_fingerprint(db_path), db_path)
+
+# Persistent NL->SQL cache, shared by all sessions
+@st.cache_resource
+def get_sql_cache():
+    return SqlTranslationCache(SQL_CACHE_PATH)
+
+# Embedding model for the similar-question lookup, loaded once per process
+@st.cache_resource
+def get_question_embeddings():
+    return get_embeddings()
+
+# Fingerprint of the document context: the active vector store versions, or the
+# files themselves when there is no store (fallback context)
+def context_fingerprint(use_rag=True, use_cag=True):
+    state = []
+    for enabled, dir_name in ((use_rag, "rag_docs"), (use_cag, "cag_docs")):
+        if not enabled:
+            continue
+        index_path = os.path.join(active_store_path(f"{dir_name}_vectorstore"), "index.faiss")
+        if os.path.exists(index_path):
+            state.append([dir_name, index_path, os.stat(index_path).st_mtime_ns])
+        else:
+            files = sorted(
+                (f.name, f.stat().st_size, f.stat().st_mtime_ns)
+                for f in Path(dir_name).glob("*") if f.is_file()
+            )
+            state.append([dir_name, files])
+    return fingerprint(state)
+
+# SQL from the cache when the same (or, optionally, a similar) question was
+# translated before for this schema and context; otherwise from the LLM
+def sql_generieren(natürliche_frage, schema_index, modifizieren=False, use_rag=True, use_cag=True,
+                   use_cache=True, ähnliche_fragen=False):
+    cache = get_sql_cache()
+    scope = (schema_index.schema_hash, modifizieren, context_fingerprint(use_rag, use_cag))
+    embedding = None
+    if use_cache:
+        hit = cache.get(natürliche_frage, *scope)
+        if hit is None and ähnliche_fragen:
+            embeddings = get_question_embeddings()
+            if embeddings is not None:
+                embedding = embeddings.embed_query(natürliche_frage)
+                hit = cache.get_similar(*scope, embedding)
+        if hit:
+            return hit
+
+    sql_query = frage_ki(natürliche_frage, schema_index, modifizieren, use_rag, use_cag)
+    cache_key = cache.put(natürliche_frage, *scope, sql_query, embedding=embedding)
+    return {"sql": sql_query, "cache_key": cache_key, "match": None}
 
 # SQL generation function - MOVED OUTSIDE
-def frage_ki(natürliche_frage, db_structure, modifizieren=False, use_rag=True, use_cag=True):
+def frage_ki(natürliche_frage, schema_index, modifizieren=False, use_rag=True, use_cag=True):
     # Initialize the LLM when needed
     llm = get_llm()
     
+    # Only the tables and columns relevant to the question go into the prompt
+    db_structure = schema_index.prompt_schema(natürliche_frage)
+    
     # Load the context for the AI using our new vector-based retrieval if possible
     context = get_context_from_retriever(natürliche_frage, use_rag, use_cag)
     
@@ -145,6 +202,121 @@ def load_context_docs(use_rag=True, use_cag=True):
 
     return context_text
 
+# Plan analysis and the indexes created per uploaded database, shared by all sessions
+@st.cache_resource
+def get_index_advisor():
+    return IndexAdvisor(INDEX_ADVICE_PATH, INDEX_ADVISOR_MIN_ROWS)
+
+# Run the generated SQL: queries open a read-only cursor whose rows are read page
+# by page, modifications (only with "Datenbank ändern") run in a transaction.
+# The query plan is checked first; execution errors are reported below
+def sql_ausführen(db_path, übersetzung):
+    schließe_ergebnis()
+    sql_query = übersetzung["sql"]
+    try:
+        st.session_state["sql_analyse"] = get_index_advisor().analyze(db_path, sql_query)
+    except sqlite3.Error:
+        st.session_state["sql_analyse"] = None
+    try:
+        if übersetzung["modifizieren"] and not returns_rows(sql_query):
+            rowcount = execute_statement(db_path, sql_query, SQL_QUERY_TIMEOUT)
+            st.success(f"Befehl erfolgreich ausgeführt. {rowcount} Zeilen betroffen.")
+        else:
+            cursor = QueryCursor(db_path, sql_query, SQL_PAGE_SIZE, SQL_MAX_ROWS, SQL_QUERY_TIMEOUT)
+            st.session_state["sql_cursor"] = cursor
+            st.session_state["sql_seite"] = (0, cursor.fetch_page())
+        # Executed successfully: keep this translation longer
+        get_sql_cache().promote(übersetzung["cache_key"])
+    except QueryTimeout as e:
+        schließe_ergebnis()
+        st.error(f"Abfrage nach {e.timeout_seconds:g}s abgebrochen. Bitte die Frage eingrenzen.")
+    except Exception as e:
+        schließe_ergebnis()
+        # Failing SQL is not served from the cache again
+        get_sql_cache().forget(übersetzung["cache_key"])
+        st.error(f"Fehler beim Ausführen: {str(e)}")
+
+def schließe_ergebnis():
+    cursor = st.session_state.pop("sql_cursor", None)
+    st.session_state.pop("sql_seite", None)
+    st.session_state.pop("sql_analyse", None)
+    st.session_state.pop("index_ergebnis", None)
+    if cursor is not None:
+        cursor.close()
+
+# Current result page with cursor-based paging; only one page is held in memory
+def zeige_ergebnis():
+    cursor = st.session_state.get("sql_cursor")
+    if cursor is None:
+        return
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Nächste Seite", disabled=cursor.exhausted):
+            try:
+                start = cursor.rows_read
+                rows = cursor.fetch_page()
+                if rows:
+                    st.session_state["sql_seite"] = (start, rows)
+            except QueryTimeout as e:
+                st.error(f"Abfrage nach {e.timeout_seconds:g}s abgebrochen.")
+    with col2:
+        von_vorne = st.button("Von vorne", disabled=cursor.pages_read <= 1)
+
+    if von_vorne:
+        sql_ausführen(st.session_state["db_path"], st.session_state["sql_übersetzung"])
+        cursor = st.session_state.get("sql_cursor")
+        if cursor is None:
+            return
+
+    start, rows = st.session_state["sql_seite"]
+    st.subheader("Ergebnisse")
+    st.dataframe(pd.DataFrame(rows, columns=cursor.columns))
+    if rows:
+        st.caption(f"Zeilen {start + 1}–{start + len(rows)} ({cursor.seconds:.2f}s)")
+    else:
+        st.caption("Keine Zeilen")
+    if cursor.truncated:
+        st.warning(f"Ergebnis nach {cursor.max_rows} Zeilen abgeschnitten. Bitte die Abfrage eingrenzen.")
+
+# EXPLAIN QUERY PLAN of the executed SQL, flagged full scans and index suggestions
+def zeige_analyse(upload_path):
+    analyse = st.session_state.get("sql_analyse")
+    if not analyse:
+        return
+    with st.expander("Ausführungsplan (EXPLAIN QUERY PLAN)"):
+        tiefe = {0: 0}
+        for schritt in analyse["plan"]:
+            tiefe[schritt["id"]] = tiefe.get(schritt["parent"], 0) + 1
+            st.text("  " * (tiefe[schritt["id"]] - 1) + schritt["detail"])
+    for scan in analyse["full_scans"]:
+        st.warning(f"Vollständiger Scan der Tabelle \"{scan['table']}\" (~{scan['rows']:,} Zeilen)")
+    if analyse["candidates"]:
+        st.markdown("**Empfohlene Indizes**")
+        st.code(";\n".join(c["sql"] for c in analyse["candidates"]) + ";", language="sql")
+        if st.button("Indizes auf Arbeitskopie anlegen"):
+            with st.spinner("Lege Indizes an und messe die Abfrage..."):
+                try:
+                    ergebnis = get_index_advisor().apply(
+                        upload_path, st.session_state["db_upload_hash"], st.session_state["sql_übersetzung"]["sql"],
+                        analyse["candidates"], SQL_QUERY_TIMEOUT
+                    )
+                    st.session_state["index_ergebnis"] = ergebnis
+                    if ergebnis["kept"]:
+                        # From now on this session queries the indexed working copy
+                        st.session_state["db_work_path"] = ergebnis["working_copy"]
+                        st.session_state["db_path"] = ergebnis["working_copy"]
+                        analyse["candidates"] = []
+                except Exception as e:
+                    st.error(f"Fehler beim Anlegen der Indizes: {str(e)}")
+    ergebnis = st.session_state.get("index_ergebnis")
+    if ergebnis:
+        vorher, nachher = ergebnis["before_seconds"], ergebnis["after_seconds"]
+        zeiten = f" Vorher {vorher:.3f}s, nachher {nachher:.3f}s." if vorher is not None else ""
+        if ergebnis["kept"]:
+            st.success(f"Indizes {', '.join(ergebnis['indexes'])} auf der Arbeitskopie angelegt.{zeiten}")
+        else:
+            st.info(f"Indizes nicht übernommen, die Abfrage wurde nicht schneller.{zeiten}")
+
 # Main function for Streamlit page
 def show_data_analytics():
     # --- Neue Rollen-Auswahl ---
@@ -158,13 +330,32 @@ def show_data_analytics():
         uploaded_db = st.file_uploader("SQLite Datenbank hochladen", type=["db", "sqlite", "sqlite3"])
         
         if uploaded_db is not None:
-            # Save uploaded database
-            db_path = "uploaded_database.db"
-            with open(db_path, "wb") as f:
-                f.write(uploaded_db.getbuffer())
+            # Save uploaded database (only when a different file was uploaded,
+            # so open result cursors and changes made here stay valid)
+            upload_path = "uploaded_database.db"
+            upload_hash = hashlib.sha256(uploaded_db.getbuffer()).hexdigest()
+            if st.session_state.get("db_upload_hash") != upload_hash or not os.path.exists(upload_path):
+                schließe_ergebnis()
+                st.session_state.pop("sql_übersetzung", None)
+                with open(upload_path, "wb") as f:
+                    f.write(uploaded_db.getbuffer())
+                st.session_state["db_upload_hash"] = upload_hash
+                # Indexes created for this database in earlier sessions are
+                # recreated on a fresh working copy; the upload stays untouched
+                if os.path.exists(working_copy_path(upload_path)):
+                    os.unlink(working_copy_path(upload_path))
+                with st.spinner("Lege gespeicherte Indizes an..."):
+                    work_path = get_index_advisor().prepare_working_copy(upload_path, upload_hash)
+                st.session_state["db_work_path"] = work_path
+                if work_path:
+                    anzahl = len(get_index_advisor().recommended(upload_hash))
+                    st.info(f"{anzahl} gespeicherte Indizes auf der Arbeitskopie angelegt.")
+            db_path = st.session_state.get("db_work_path") or upload_path
+            st.session_state["db_path"] = db_path
             
-            # Get database structure
-            db_structure = get_database_structure(db_path)
+            # Get database structure (cached until the file content changes)
+            schema_index = get_schema_index(db_path)
+            db_structure = schema_index.structure
             
             # Display database structure
             st.subheader("Datenbankstruktur")
@@ -188,40 +379,44 @@ def show_data_analytics():
                 use_cag = st.checkbox("CAG Kontext verwenden", value=True)
             with col3:
                 modifizieren = st.checkbox("Datenbank ändern", value=False)
+            col4, col5 = st.columns(2)
+            with col4:
+                use_cache = st.checkbox("Gespeichertes SQL wiederverwenden", value=True)
+            with col5:
+                ähnliche_fragen = st.checkbox("Ähnliche Fragen erkennen", value=False)
             
             if st.button("SQL generieren"):
                 if natürliche_frage:
                     with st.spinner("Generiere SQL..."):
                         try:
-                            sql_query = frage_ki(natürliche_frage, db_structure, modifizieren, use_rag, use_cag)
-                            
-                            st.subheader("Generierter SQL-Befehl")
-                            st.code(sql_query, language="sql")
-                            
-                            # Execute query option
-                            if st.button("SQL ausführen"):
-                                try:
-                                    conn = sqlite3.connect(db_path)
-                                    cursor = conn.cursor()
-                                    cursor.execute(sql_query)
-                                    
-                                    if sql_query.strip().upper().startswith("SELECT"):
-                                        results = cursor.fetchall()
-                                        columns = [description[0] for description in cursor.description]
-                                        df = pd.DataFrame(results, columns=columns)
-                                        st.subheader("Ergebnisse")
-                                        st.dataframe(df)
-                                    else:
-                                        conn.commit()
-                                        st.success(f"Befehl erfolgreich ausgeführt. {cursor.rowcount} Zeilen betroffen.")
-                                    
-                                    conn.close()
-                                except Exception as e:
-                                    st.error(f"Fehler beim Ausführen: {str(e)}")
+                            übersetzung = sql_generieren(natürliche_frage, schema_index, modifizieren,
+                                                         use_rag, use_cag, use_cache, ähnliche_fragen)
+                            schließe_ergebnis()
+                            st.session_state["sql_übersetzung"] = {
+                                **übersetzung, "modifizieren": modifizieren
+                            }
                         except Exception as e:
                             st.error(f"Fehler beim Generieren des SQL: {str(e)}")
                 else:
                     st.warning("Bitte geben Sie eine Frage ein.")
+            
+            # Generated SQL stays in the session, so executing and paging work across reruns
+            übersetzung = st.session_state.get("sql_übersetzung")
+            if übersetzung:
+                st.subheader("Generierter SQL-Befehl")
+                if übersetzung["match"] == "exact":
+                    st.caption("Aus dem Cache (gleiche Frage)")
+                elif übersetzung["match"] == "similar":
+                    st.caption(f"Aus dem Cache (ähnliche Frage: \"{übersetzung['similar_question']}\", "
+                               f"Ähnlichkeit {übersetzung['similarity']:.2f})")
+                st.code(übersetzung["sql"], language="sql")
+                
+                # Execute query option
+                if st.button("SQL ausführen"):
+                    with st.spinner("Führe SQL aus..."):
+                        sql_ausführen(db_path, übersetzung)
+                zeige_analyse(upload_path)
+                zeige_ergebnis()
         else:
             st.info("Bitte laden Sie eine SQLite-Datenbank hoch, um fortzufahren.")
     
@@ -4,6 +4,7 @@ import streamlit as st
 import os
 from pathlib import Path
 import tempfile
+import uuid
 import pandas as pd
 
 # LangChain Imports - Updated to use langchain_ollama (latest)
@@ -12,15 +13,20 @@ try:
 except ImportError:
     # Fallback to old import if new package not available
     from langchain_community.llms import Ollama as OllamaLLM
-from langchain_community.document_loaders import PyPDFLoader, CSVLoader, TextLoader, UnstructuredExcelLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings 
 from langchain_community.vectorstores import FAISS
 from langchain.chains import RetrievalQA, ConversationalRetrievalChain
 from langchain.memory import ConversationBufferMemory
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+from langchain_core.retrievers import BaseRetriever
+from typing import Any
 
 from utils.ui import custom_divider
+from utils.field_code_index import INDEX_FILE_NAME, FieldCodeIndex, extract_field_codes, load_field_code_index, merge_documents
+from utils.document_loaders import load_document
+from utils.document_parsing import ParsingPool
+from utils.store_versions import active_store_path, new_version_path, publish_version, store_lock
 
 # Get LLM only when needed to avoid initialization issues
 def get_llm():
@@ -36,20 +42,10 @@ def get_embeddings():
 
 # Load and process documents
 def process_document(file_path):
-    """Load and process a document based on its file extension"""
-    file_extension = Path(file_path).suffix.lower()
-    
+    """Load a document through the loader registered for its type"""
     try:
-        if file_extension == '.pdf':
-            loader = PyPDFLoader(file_path)
-        elif file_extension == '.csv':
-            loader = CSVLoader(file_path)
-        elif file_extension == '.xlsx':
-            loader = UnstructuredExcelLoader(file_path)
-        else:  # Default to text loader for .txt, .md and other text files
-            loader = TextLoader(file_path)
-            
-        documents = loader.load()
+        # Sniffed type first, then extension; plain text for anything else
+        documents = load_document(file_path)
         return documents
     except Exception as e:
         st.error(f"Error loading {file_path}: {str(e)}")
@@ -66,42 +62,91 @@ def split_documents(documents):
     chunks = text_splitter.split_documents(documents)
     return chunks
 
-# Build or update the vector database - FIXED with deserialization parameter
-def build_vectordb(chunks, directory_name):
-    """Create or update the vector database for the documents"""
-    embeddings = get_embeddings()
-    
-    # Check if vector store already exists
-    vectorstore_path = f"{directory_name}_vectorstore"
-    if os.path.exists(vectorstore_path):
+# Open the current vector store for an update that is published as a new version
+def open_vectordb_update(directory_name):
+    """Load the current vector store and field code index to add chunks to"""
+    store_dir = f"{directory_name}_vectorstore"
+    active_path = active_store_path(store_dir)
+    code_index = FieldCodeIndex.for_store(active_path)
+    vectorstore = None
+    if os.path.exists(os.path.join(active_path, "index.faiss")):
         try:
             # Load existing vectorstore and add new documents - FIXED
-            vectorstore = FAISS.load_local(vectorstore_path, embeddings, allow_dangerous_deserialization=True)
-            vectorstore.add_documents(chunks)
+            vectorstore = FAISS.load_local(active_path, get_embeddings(), allow_dangerous_deserialization=True)
         except Exception as e:
             st.warning(f"Error loading existing vector store: {str(e)}. Creating new one.")
-            # Create new vectorstore if loading fails
-            vectorstore = FAISS.from_documents(chunks, embeddings)
+            code_index.clear()
+    return {"store_dir": store_dir, "vectorstore": vectorstore, "code_index": code_index}
+
+def add_to_vectordb(update, chunks):
+    """Embed chunks into an open update (not visible until published)"""
+    if not chunks:
+        return
+    chunk_ids = [uuid.uuid4().hex for _ in chunks]
+    if update["vectorstore"] is None:
+        update["vectorstore"] = FAISS.from_documents(chunks, get_embeddings(), ids=chunk_ids)
     else:
-        # Create new vectorstore
-        vectorstore = FAISS.from_documents(chunks, embeddings)
-    
-    # Save the updated vectorstore
-    vectorstore.save_local(vectorstore_path)
+        update["vectorstore"].add_documents(chunks, ids=chunk_ids)
+    update["code_index"].add_chunks(chunk_ids, [chunk.page_content for chunk in chunks])
+
+def publish_vectordb(update):
+    """Save the update as a new store version and switch readers to it atomically"""
+    vectorstore = update["vectorstore"]
+    if vectorstore is None:
+        return None
+    version_path = new_version_path(update["store_dir"])
+    vectorstore.save_local(version_path)
+    code_index = update["code_index"]
+    code_index.path = os.path.join(version_path, INDEX_FILE_NAME)
+    code_index.save()
+    publish_version(update["store_dir"], version_path)
     return vectorstore
 
+# Build or update the vector database - FIXED with deserialization parameter
+def build_vectordb(chunks, directory_name):
+    """Create or update the vector database for the documents"""
+    with store_lock(f"{directory_name}_vectorstore"):
+        update = open_vectordb_update(directory_name)
+        add_to_vectordb(update, chunks)
+        return publish_vectordb(update)
+
+# Retriever that puts the chunks defining the queried field codes first
+class FieldCodeRetriever(BaseRetriever):
+    """Exact field-code hits (dictionary lookup) merged ahead of vector results"""
+
+    vectorstore: Any
+    code_index: Any
+    k: int = 4
+
+    def get_exact_documents(self, query):
+        documents = []
+        for chunk_id in self.code_index.lookup(extract_field_codes(query)):
+            document = self.vectorstore.docstore.search(chunk_id)
+            # docstore.search returns an error string for unknown IDs
+            if not isinstance(document, str):
+                documents.append(document)
+        return documents
+
+    def get_vector_documents(self, query):
+        return self.vectorstore.similarity_search(query, k=self.k)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return merge_documents(self.get_exact_documents(query), self.get_vector_documents(query))
+
 # Create a retriever from vectorstore - FIXED with deserialization parameter
 def get_retriever(directory_name):
     """Get a retriever for the specified directory"""
     embeddings = get_embeddings()
-    vectorstore_path = f"{directory_name}_vectorstore"
+    vectorstore_path = active_store_path(f"{directory_name}_vectorstore")
     
     # Check if vector store exists
-    if os.path.exists(vectorstore_path):
+    if os.path.exists(os.path.join(vectorstore_path, "index.faiss")):
         try:
             # FIXED - Added allow_dangerous_deserialization=True
             vectorstore = FAISS.load_local(vectorstore_path, embeddings, allow_dangerous_deserialization=True)
-            return vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 4})
+            return FieldCodeRetriever(
+                vectorstore=vectorstore, code_index=load_field_code_index(vectorstore_path), k=4
+            )
         except Exception as e:
             st.error(f"Error loading vector store from {vectorstore_path}: {str(e)}")
             st.info("You may need to rebuild your vector database. Use the 'Rebuild Vector Database' button in the Settings tab.")
@@ -124,15 +169,13 @@ def clear_and_rebuild_vectorstores():
         doc_dir = Path(doc_type)
         if doc_dir.exists():
             all_chunks = []
-            for file_path in doc_dir.glob("*"):
-                if file_path.is_file():
-                    try:
-                        documents = process_document(str(file_path))
-                        if documents:
-                            chunks = split_documents(documents)
-                            all_chunks.extend(chunks)
-                    except Exception as e:
-                        st.error(f"Error processing {file_path}: {e}")
+            file_paths = [str(file_path) for file_path in doc_dir.glob("*") if file_path.is_file()]
+            # Parse and split in worker processes, one failing file does not stop the rebuild
+            with ParsingPool() as pool:
+                for _, result in pool.parse_files(file_paths):
+                    if result["error"]:
+                        st.error(f"Error processing {result['path']}: {result['error']}")
+                    all_chunks.extend(result["chunks"])
             
             if all_chunks:
                 build_vectordb(all_chunks, doc_type)
@@ -149,9 +192,13 @@ def get_combined_retriever():
             # Return a function that combines results from both retrievers
             def combined_retrieve(query):
                 try:
-                    rag_docs = rag_retriever.get_relevant_documents(query)
-                    cag_docs = cag_retriever.get_relevant_documents(query)
-                    return rag_docs + cag_docs
+                    # Exact field-code hits of both stores go ahead of all vector results
+                    return merge_documents(
+                        rag_retriever.get_exact_documents(query),
+                        cag_retriever.get_exact_documents(query),
+                        rag_retriever.get_vector_documents(query),
+                        cag_retriever.get_vector_documents(query),
+                    )
                 except Exception as e:
                     st.error(f"Error retrieving documents: {str(e)}")
                     return []
@@ -216,7 +263,7 @@ def show_rag_cag():
             st.subheader("RAG Documents")
             st.write("Upload documents to augment AI responses with relevant context.")
             rag_files = st.file_uploader("Upload RAG documents", 
-                                        type=["txt", "pdf", "md", "csv", "xlsx"], 
+                                        type=["txt", "pdf", "md", "csv", "xlsx", "docx", "json", "sql"], 
                                         accept_multiple_files=True, 
                                         key="rag")
             if rag_files:
@@ -256,7 +303,7 @@ def show_rag_cag():
             st.subheader("CAG Documents")
             st.write("Upload documents to create custom AI answers.")
             cag_files = st.file_uploader("Upload CAG documents", 
-                                        type=["txt", "pdf", "md", "csv", "xlsx"], 
+                                        type=["txt", "pdf", "md", "csv", "xlsx", "docx", "json", "sql"], 
                                         accept_multiple_files=True, 
                                         key="cag")
             if cag_files:
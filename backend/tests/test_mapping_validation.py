@@ -0,0 +1,79 @@
+"""Parity of the vectorized extract validation with the per-position engine"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.mapping_rules import MappingRuleEngine
+from utils.mapping_validation import normalize_frame, validate_frame
+
+MAPPING_DOCS = Path(__file__).resolve().parent.parent / "docs" / "mapping_docs"
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = MappingRuleEngine(directories=[str(MAPPING_DOCS)])
+    engine.reload()
+    return engine
+
+
+def _extract(rows: int, seed: int = 7) -> pd.DataFrame:
+    # MATURITY_DATE and the CRR3-only inputs are deliberately absent
+    rng = np.random.default_rng(seed)
+
+    def pick(*values):
+        return rng.choice(np.array(values, dtype=object), rows)
+
+    frame = pd.DataFrame(
+        {
+            "CRR3_APPLICABLE_FLAG": pick("N", "Y"),
+            "PRODUCT_CODE": pick("CCARD", "COMMITMENT", "FACILITY", "LC", "SWAP"),
+            "COMMITMENT_TYPE": pick("UNCONDITIONAL", "CONDITIONAL", ""),
+            "BOOK_DATE": pick("2023-01-15", "2024-06-30"),
+            "B500": pick("0", "2", "1"),
+            "B603": pick("T", "O"),
+            "CONTRACT_LGDS_ABS": pick("", "0.45"),
+            "CCF_SOLVV_PERCENT": pick("50", "100", ""),
+            "CCF_FULLSTA_PERCENT": pick("20", "75"),
+            "B017": pick("0", "0.1", "0.2", "0.5", "0.75", "1"),
+        }
+    )
+    frame = normalize_frame(frame)
+    frame.index = pd.RangeIndex(1, rows + 1)
+    return frame
+
+
+def test_vector_mismatches_match_scalar_engine(engine):
+    frame = _extract(300)
+
+    outcome = validate_frame(engine, frame)
+    mismatches = outcome["mismatches"]
+    vector = set()
+    if mismatches is not None:
+        vector = set(zip(mismatches["row_number"], mismatches["field"]))
+
+    scalar = set()
+    for row_number, row in frame.iterrows():
+        check = engine.check_position(row.to_dict())
+        for result in check["results"] if check else []:
+            if result["matches"] is False:
+                scalar.add((row_number, result["field"]))
+
+    assert "MATURITY_DATE" in outcome["missing_inputs"]["CRR2"]
+    assert scalar
+    assert vector == scalar
+
+
+def test_rows_touching_absent_inputs_are_unverifiable(engine):
+    frame = _extract(300)
+
+    outcome = validate_frame(engine, frame, ["B017"], "CRR2")
+
+    unverifiable = sum(
+        engine.evaluate(row.to_dict(), "B017", "CRR2")["matches"] is None
+        for _, row in frame.iterrows()
+    )
+    assert outcome["unverifiable"].get("B017", 0) <= unverifiable
+    assert outcome["unverifiable"]["B017"] > 0
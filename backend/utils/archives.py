@@ -0,0 +1,165 @@
+"""
+Streaming extraction of uploaded ZIP and TAR archives
+Members are read one at a time and streamed straight into the document store
+through store_upload; nothing is unpacked to a scratch folder. Members are
+filtered by extension, limited in size individually and in total, and stored
+under their file name only (folders inside the archive are flattened)
+"""
+
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, Optional, Tuple
+
+from utils.uploads import UploadTooLarge, safe_filename, store_upload
+
+ARCHIVE_SUFFIXES = {
+    ".zip": "zip",
+    ".tar": "tar",
+    ".tar.gz": "tar",
+    ".tgz": "tar",
+    ".tar.bz2": "tar",
+    ".tar.xz": "tar",
+}
+# Resource forks, hidden files and Office lock files exported with folders
+SKIPPED_FOLDERS = ("__MACOSX",)
+SKIPPED_PREFIXES = (".", "~$")
+
+
+class ArchiveError(Exception):
+    """The upload is not a readable archive"""
+
+
+def archive_format(filename: str) -> Optional[str]:
+    """Archive kind ("zip" or "tar") of a file name, None if not an archive"""
+    name = filename.lower()
+    for suffix, kind in ARCHIVE_SUFFIXES.items():
+        if name.endswith(suffix):
+            return kind
+    return None
+
+
+def _zip_members(source: BinaryIO) -> Iterator[Tuple[str, int, Any]]:
+    try:
+        archive = zipfile.ZipFile(source)
+    except zipfile.BadZipFile as e:
+        raise ArchiveError(f"Not a valid ZIP archive: {e}")
+    with archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            if info.flag_bits & 0x1:
+                yield info.filename, info.file_size, "encrypted"
+                continue
+            with archive.open(info) as member:
+                yield info.filename, info.file_size, member
+
+
+def _tar_members(source: BinaryIO) -> Iterator[Tuple[str, int, Any]]:
+    # Stream mode: members are read in order without seeking back
+    try:
+        archive = tarfile.open(fileobj=source, mode="r|*")
+    except tarfile.TarError as e:
+        raise ArchiveError(f"Not a valid TAR archive: {e}")
+    with archive:
+        for info in archive:
+            if info.isdir():
+                continue
+            if not info.isfile():
+                yield info.name, info.size, "not a regular file"
+                continue
+            yield info.name, info.size, archive.extractfile(info)
+
+
+def _skip_reason(
+    member_name: str, declared_size: int, allowed_extensions, max_member_bytes: int
+) -> Optional[str]:
+    parts = [p for p in member_name.replace("\\", "/").split("/") if p not in ("", ".")]
+    if any(
+        part in SKIPPED_FOLDERS or part.startswith(SKIPPED_PREFIXES) for part in parts
+    ):
+        return "hidden or system file"
+    if not parts or Path(parts[-1]).suffix.lower() not in allowed_extensions:
+        return "unsupported file type"
+    if declared_size > max_member_bytes:
+        return "exceeds member size limit"
+    return None
+
+
+def extract_archive(
+    source: BinaryIO,
+    filename: str,
+    target_dir: str,
+    allowed_extensions,
+    max_member_bytes: int,
+    max_members: int,
+    max_total_bytes: int,
+    keep_if: Optional[Callable[[str, str, int], bool]] = None,
+) -> Dict[str, Any]:
+    """Stream the supported members of an archive into target_dir (blocking)
+
+    Returns {"members": [...], "skipped": [...]}: one store_upload result per
+    extracted member (with its "member" path inside the archive), and the
+    member name and reason for everything left out. keep_if(filename, sha256,
+    size) works as in store_upload. Size limits are enforced on the bytes
+    actually decompressed, not only on the sizes the archive declares.
+    """
+    kind = archive_format(filename)
+    if kind is None:
+        raise ArchiveError(f"Unsupported archive type: {filename}")
+    members_of = _zip_members if kind == "zip" else _tar_members
+
+    members, skipped = [], []
+    used_names = set()
+    total_bytes = 0
+    try:
+        for member_name, declared_size, stream in members_of(source):
+            reason = stream if isinstance(stream, str) else None
+            reason = reason or _skip_reason(
+                member_name, declared_size, allowed_extensions, max_member_bytes
+            )
+            if reason is None and len(members) >= max_members:
+                reason = f"archive member limit ({max_members}) reached"
+            if reason is None and total_bytes + declared_size > max_total_bytes:
+                reason = "archive size limit reached"
+            if reason:
+                skipped.append({"member": member_name, "reason": reason})
+                continue
+
+            # Same file name in different folders of the archive: keep both
+            name = safe_filename(member_name)
+            stem, suffix = Path(name).stem, Path(name).suffix
+            counter = 2
+            while name.lower() in used_names:
+                name = f"{stem} ({counter}){suffix}"
+                counter += 1
+            used_names.add(name.lower())
+
+            keep = None
+            if keep_if is not None:
+
+                def keep(sha256: str, size: int, name=name) -> bool:
+                    return keep_if(name, sha256, size)
+
+            limit = min(max_member_bytes, max_total_bytes - total_bytes)
+            try:
+                stored = store_upload(stream, name, target_dir, limit, keep_if=keep)
+            except UploadTooLarge:
+                skipped.append(
+                    {
+                        "member": member_name,
+                        "reason": "exceeds member size limit"
+                        if limit == max_member_bytes
+                        else "archive size limit reached",
+                    }
+                )
+                continue
+            total_bytes += stored["size"]
+            members.append({**stored, "member": member_name})
+    except BaseException:
+        # A corrupt archive leaves no partial set of members behind
+        for stored in members:
+            if stored["path"]:
+                Path(stored["path"]).unlink(missing_ok=True)
+        raise
+    return {"members": members, "skipped": skipped}
@@ -0,0 +1,412 @@
+"""
+Persistent audit log in SQLite with a batched background writer
+Request handlers only append to a bounded ring buffer and a queue; a writer
+thread inserts the queued events in batches (WAL mode) and applies the
+retention policy, optionally rolling expired events into monthly archives.
+Queries page by event id over per-filter indexes; hourly counts per action are
+kept up to date by the writer in the same transaction as the inserts
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_CLOSE = object()
+RETENTION_BATCH_SIZE = 10000
+MAX_QUERY_LIMIT = 1000
+FILTER_COLUMNS = ("action", "analyst_id", "department", "model")
+
+EVENTS_DDL = """
+CREATE TABLE IF NOT EXISTS {schema}events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    action TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    user_id TEXT,
+    analyst_id TEXT,
+    department TEXT,
+    model TEXT,
+    details TEXT NOT NULL
+)
+"""
+
+INDEXES_DDL = """
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS idx_events_action ON events(action, id);
+CREATE INDEX IF NOT EXISTS idx_events_analyst ON events(analyst_id, id);
+CREATE INDEX IF NOT EXISTS idx_events_department ON events(department, id);
+CREATE INDEX IF NOT EXISTS idx_events_model ON events(model, id);
+CREATE INDEX IF NOT EXISTS idx_events_success ON events(success, id);
+"""
+
+HOURLY_DDL = """
+CREATE TABLE IF NOT EXISTS hourly_counts (
+    hour TEXT NOT NULL,
+    action TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    PRIMARY KEY (hour, action)
+) WITHOUT ROWID
+"""
+
+
+def event_row(event: Dict[str, Any]) -> tuple:
+    """Column values of an event; filterable details are copied into columns"""
+    details = event.get("details") or {}
+    return (
+        event["timestamp"],
+        event["action"],
+        1 if event.get("success", True) else 0,
+        event.get("user_id"),
+        details.get("analyst_id"),
+        details.get("department"),
+        details.get("model") or details.get("model_used"),
+        json.dumps(details, ensure_ascii=False, default=str),
+    )
+
+
+def _row_to_event(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "timestamp": row["ts"],
+        "action": row["action"],
+        "user_id": row["user_id"],
+        "details": json.loads(row["details"]),
+        "success": bool(row["success"]),
+    }
+
+
+class AuditStore:
+    """Audit events: recent ones in memory, all of them in SQLite"""
+
+    def __init__(
+        self,
+        db_path: str = "audit_log.db",
+        buffer_size: int = 1000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_queue: int = 100000,
+        retention_days: int = 0,
+        max_events: int = 0,
+        archive_dir: Optional[str] = None,
+        retention_interval: float = 3600.0,
+    ):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.max_events = max_events
+        self.archive_dir = archive_dir
+        self.retention_interval = retention_interval
+        self._recent: deque = deque(maxlen=buffer_size)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._stats = {
+            "written": 0,
+            "dropped": 0,
+            "failed_batches": 0,
+            "expired": 0,
+            "archived": 0,
+        }
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(EVENTS_DDL.format(schema=""))
+            conn.executescript(INDEXES_DDL)
+            has_counts = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'hourly_counts'"
+            ).fetchone()
+            if not has_counts:
+                conn.execute(HOURLY_DDL)
+                # One-off backfill for databases written before the aggregates
+                conn.execute(
+                    "INSERT INTO hourly_counts "
+                    "SELECT substr(ts, 1, 13), action, COUNT(*), SUM(1 - success) "
+                    "FROM events GROUP BY 1, 2"
+                )
+            self.total_events = conn.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM events"
+            ).fetchone()[0]
+        self._thread = threading.Thread(
+            target=self._run, name="audit-writer", daemon=True
+        )
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(self, event: Dict[str, Any]):
+        """Buffer an event for writing; never blocks the caller"""
+        self._recent.append(event)
+        self.total_events += 1
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._stats["dropped"] += 1
+            if self._stats["dropped"] % 1000 == 1:
+                logger.warning(
+                    f"⚠️ Audit queue full, {self._stats['dropped']} events dropped"
+                )
+
+    def recent(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Newest events from the in-memory ring buffer, oldest first"""
+        events = list(self._recent)
+        return events[-limit:] if limit > 0 else []
+
+    def flush(self, timeout: float = 10.0):
+        """Wait until the events queued so far are written"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        self._queue.put(_CLOSE)
+        self._thread.join(timeout=30)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "queued": self._queue.qsize(),
+            "buffered": len(self._recent),
+            "total_events": self.total_events,
+            "db_path": self.db_path,
+            "retention_days": self.retention_days,
+            "max_events": self.max_events,
+        }
+
+    def query(
+        self,
+        cursor: Optional[int] = None,
+        limit: int = 100,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        success: Optional[bool] = None,
+        **filters: Optional[str],
+    ) -> Dict[str, Any]:
+        """Persisted events newest first, one page after the given cursor
+
+        filters are equality matches on FILTER_COLUMNS; since/until are ISO
+        timestamps (until exclusive). next_cursor is None on the last page.
+        """
+        limit = max(1, min(limit, MAX_QUERY_LIMIT))
+        conditions, params = [], []
+        for column in FILTER_COLUMNS:
+            if filters.get(column) is not None:
+                conditions.append(f"{column} = ?")
+                params.append(filters[column])
+        if success is not None:
+            conditions.append("success = ?")
+            params.append(1 if success else 0)
+        if cursor is not None:
+            conditions.append("id < ?")
+            params.append(cursor)
+        with self._reader() as conn:
+            # Event ids follow time, so the time range becomes an id range
+            # that every per-filter (column, id) index can seek into
+            if since:
+                row = conn.execute(
+                    "SELECT id FROM events WHERE ts >= ? ORDER BY ts LIMIT 1", (since,)
+                ).fetchone()
+                if row is None:
+                    return {"events": [], "next_cursor": None}
+                conditions += ["id >= ?", "ts >= ?"]
+                params += [row[0], since]
+            if until:
+                row = conn.execute(
+                    "SELECT id FROM events WHERE ts < ? ORDER BY ts DESC LIMIT 1",
+                    (until,),
+                ).fetchone()
+                if row is None:
+                    return {"events": [], "next_cursor": None}
+                conditions += ["id <= ?", "ts < ?"]
+                params += [row[0], until]
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            rows = conn.execute(
+                f"SELECT * FROM events {where} ORDER BY id DESC LIMIT ?",
+                (*params, limit + 1),
+            ).fetchall()
+        events = [_row_to_event(row) for row in rows[:limit]]
+        next_cursor = events[-1]["id"] if len(rows) > limit else None
+        return {"events": events, "next_cursor": next_cursor}
+
+    def hourly_counts(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        action: Optional[str] = None,
+        bucket: str = "hour",
+    ) -> List[Dict[str, Any]]:
+        """Event and failure counts per action per hour (or day)
+
+        Read from the incrementally maintained aggregate table, so the cost
+        does not depend on the size of the log. Retention does not remove
+        aggregates.
+        """
+        width = 10 if bucket == "day" else 13
+        conditions, params = [], []
+        if since:
+            conditions.append("hour >= ?")
+            params.append(since[:13])
+        if until:
+            conditions.append("hour < ?")
+            params.append(until[:13])
+        if action:
+            conditions.append("action = ?")
+            params.append(action)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._reader() as conn:
+            rows = conn.execute(
+                f"SELECT substr(hour, 1, {width}) AS bucket, action, "
+                f"SUM(total) AS total, SUM(failures) AS failures "
+                f"FROM hourly_counts {where} GROUP BY 1, 2 ORDER BY 1, 2",
+                params,
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    @contextmanager
+    def _reader(self):
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _run(self):
+        conn = self._connect()
+        pending: List[Dict[str, Any]] = []
+        last_retention = 0.0
+        closing = False
+        while not closing:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            drained = 0 if item is None else 1
+            while item is not None:
+                if item is _CLOSE:
+                    closing = True
+                    break
+                pending.append(item)
+                if len(pending) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                    drained += 1
+                except queue.Empty:
+                    item = None
+            if pending:
+                try:
+                    self._write(conn, pending)
+                    pending = []
+                except sqlite3.Error as e:
+                    self._stats["failed_batches"] += 1
+                    logger.warning(f"⚠️ Audit write failed, will retry: {e}")
+                    time.sleep(1)
+            for _ in range(drained):
+                self._queue.task_done()
+            if time.monotonic() - last_retention > self.retention_interval:
+                last_retention = time.monotonic()
+                try:
+                    self._apply_retention(conn)
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ Audit retention failed: {e}")
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, events: List[Dict[str, Any]]):
+        totals: Counter = Counter()
+        failures: Counter = Counter()
+        for event in events:
+            key = (event["timestamp"][:13], event["action"])
+            totals[key] += 1
+            failures[key] += 0 if event.get("success", True) else 1
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO events (ts, action, success, user_id, analyst_id, "
+                "department, model, details) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [event_row(event) for event in events],
+            )
+            conn.executemany(
+                "INSERT INTO hourly_counts (hour, action, total, failures) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (hour, action) DO UPDATE SET "
+                "total = total + excluded.total, "
+                "failures = failures + excluded.failures",
+                [
+                    (hour, action, total, failures[(hour, action)])
+                    for (hour, action), total in totals.items()
+                ],
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        self._stats["written"] += len(events)
+
+    def _expiry_bound(self, conn: sqlite3.Connection) -> int:
+        """Highest event id that falls outside the retention policy"""
+        bound = 0
+        if self.retention_days > 0:
+            cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+            row = conn.execute(
+                "SELECT MAX(id) FROM events WHERE ts < ?", (cutoff,)
+            ).fetchone()
+            bound = row[0] or 0
+        if self.max_events > 0:
+            max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()
+            bound = max(bound, max_id[0] - self.max_events)
+        return bound
+
+    def _apply_retention(self, conn: sqlite3.Connection):
+        bound = self._expiry_bound(conn)
+        if bound <= 0:
+            return
+        if self.archive_dir:
+            self._archive(conn, bound)
+        while True:
+            cursor = conn.execute(
+                "DELETE FROM events WHERE id IN "
+                "(SELECT id FROM events WHERE id <= ? LIMIT ?)",
+                (bound, RETENTION_BATCH_SIZE),
+            )
+            self._stats["expired"] += cursor.rowcount
+            if cursor.rowcount < RETENTION_BATCH_SIZE:
+                break
+        logger.info(f"🗄️ Audit retention applied up to event {bound}")
+
+    def _archive(self, conn: sqlite3.Connection, bound: int):
+        """Copy expired events into one SQLite file per month"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        months = [
+            row[0]
+            for row in conn.execute(
+                "SELECT DISTINCT substr(ts, 1, 7) FROM events WHERE id <= ?",
+                (bound,),
+            )
+        ]
+        for month in months:
+            path = os.path.join(self.archive_dir, f"audit_{month}.db")
+            conn.execute("ATTACH DATABASE ? AS archive", (path,))
+            try:
+                conn.execute(EVENTS_DDL.format(schema="archive."))
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO archive.events "
+                    "SELECT * FROM main.events WHERE id <= ? AND substr(ts, 1, 7) = ?",
+                    (bound, month),
+                )
+                self._stats["archived"] += cursor.rowcount
+            finally:
+                conn.execute("DETACH DATABASE archive")
@@ -0,0 +1,373 @@
+"""
+Durable SQLite-backed queue and worker pool for bulk position analysis
+Each uploaded position row becomes one task; tasks survive restarts and are
+claimed atomically by a configurable number of asyncio workers
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Status for a task put back in the queue: a task of a job cancelled while it
+# was running would never be claimed again, so it is cancelled instead
+REQUEUE_STATUS = (
+    "CASE WHEN EXISTS (SELECT 1 FROM jobs j WHERE j.job_id = tasks.job_id "
+    "AND j.cancelled = 1) THEN 'cancelled' ELSE 'pending' END"
+)
+
+
+class RetryableTaskError(Exception):
+    """Raised by a task handler to re-queue a task without using up an attempt"""
+
+    def __init__(self, message: str, retry_after: float = 5.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BatchJobStore:
+    """Jobs and their per-row tasks in a WAL-mode SQLite database"""
+
+    def __init__(self, db_path: str = "batch_jobs.db", max_attempts: int = 3):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_schema(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    created_at TEXT NOT NULL,
+                    source_name TEXT,
+                    total INTEGER NOT NULL,
+                    options TEXT NOT NULL,
+                    cancelled INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL REFERENCES jobs(job_id),
+                    row_index INTEGER NOT NULL,
+                    retrieval_key TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    not_before REAL NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    started_at TEXT,
+                    finished_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_tasks_claim
+                    ON tasks(status, job_id, retrieval_key, row_index);
+                CREATE INDEX IF NOT EXISTS idx_tasks_job ON tasks(job_id, row_index);
+                """
+            )
+
+    def create_job(
+        self,
+        rows: List[Dict[str, Any]],
+        retrieval_keys: List[str],
+        options: Dict[str, Any],
+        source_name: Optional[str] = None,
+    ) -> str:
+        """Persist a job and enqueue one task per row"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        job_id = f"BATCH_{timestamp}_{uuid.uuid4().hex[:6]}"
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO jobs (job_id, created_at, source_name, total, options) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    datetime.now().isoformat(),
+                    source_name,
+                    len(rows),
+                    json.dumps(options, ensure_ascii=False),
+                ),
+            )
+            conn.executemany(
+                "INSERT INTO tasks (job_id, row_index, retrieval_key, payload) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    (job_id, i, key, json.dumps(row, ensure_ascii=False, default=str))
+                    for i, (row, key) in enumerate(zip(rows, retrieval_keys))
+                ),
+            )
+            conn.execute("COMMIT")
+        return job_id
+
+    def requeue_interrupted(self) -> int:
+        """Return tasks left 'running' by a previous process to the queue"""
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                f"UPDATE tasks SET status = {REQUEUE_STATUS}, started_at = NULL "
+                "WHERE status = 'running'"
+            )
+            return cursor.rowcount
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically move the next pending task to 'running'
+
+        Tasks of one job that share a retrieval key are claimed back to back so
+        their retrieved context can be shared.
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT t.task_id, t.job_id, t.row_index, t.retrieval_key, t.payload, "
+                "t.attempts, j.options FROM tasks t JOIN jobs j ON j.job_id = t.job_id "
+                "WHERE t.status = 'pending' AND t.not_before <= ? AND j.cancelled = 0 "
+                "ORDER BY t.job_id, t.retrieval_key, t.row_index LIMIT 1",
+                (time.time(),),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = 'running', attempts = attempts + 1, "
+                "started_at = ? WHERE task_id = ?",
+                (datetime.now().isoformat(), row["task_id"]),
+            )
+            conn.execute("COMMIT")
+        task = dict(row)
+        task["payload"] = json.loads(task["payload"])
+        task["options"] = json.loads(task["options"])
+        task["attempts"] += 1
+        return task
+
+    def complete(self, task_id: int, result: Dict[str, Any]):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = 'completed', result = ?, error = NULL, "
+                "finished_at = ? WHERE task_id = ?",
+                (
+                    json.dumps(result, ensure_ascii=False, default=str),
+                    datetime.now().isoformat(),
+                    task_id,
+                ),
+            )
+
+    def fail(self, task_id: int, error: str, attempts: int, retry_after: float = 0.0):
+        """Re-queue the task while attempts remain, otherwise mark it failed"""
+        retry = attempts < self.max_attempts
+        status = REQUEUE_STATUS if retry else "'failed'"
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                f"UPDATE tasks SET status = {status}, error = ?, not_before = ?, "
+                "finished_at = ? WHERE task_id = ?",
+                (
+                    error,
+                    time.time() + retry_after if retry else 0,
+                    None if retry else datetime.now().isoformat(),
+                    task_id,
+                ),
+            )
+
+    def defer(self, task_id: int, reason: str, retry_after: float):
+        """Put a task back without counting the attempt (e.g. load shedding)"""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                f"UPDATE tasks SET status = {REQUEUE_STATUS}, "
+                "attempts = attempts - 1, error = ?, not_before = ?, "
+                "started_at = NULL WHERE task_id = ?",
+                (reason, time.time() + retry_after, task_id),
+            )
+
+    def cancel_job(self, job_id: str) -> int:
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE jobs SET cancelled = 1 WHERE job_id = ?", (job_id,))
+            cursor = conn.execute(
+                "UPDATE tasks SET status = 'cancelled' "
+                "WHERE job_id = ? AND status = 'pending'",
+                (job_id,),
+            )
+            conn.execute("COMMIT")
+            return cursor.rowcount
+
+    def job_progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            job = conn.execute(
+                "SELECT * FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            counts = {
+                row["status"]: row["n"]
+                for row in conn.execute(
+                    "SELECT status, COUNT(*) AS n FROM tasks WHERE job_id = ? "
+                    "GROUP BY status",
+                    (job_id,),
+                )
+            }
+            shared_keys = conn.execute(
+                "SELECT COUNT(DISTINCT retrieval_key) FROM tasks WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()[0]
+        return self._summarize(dict(job), counts, shared_keys)
+
+    @staticmethod
+    def _summarize(job: Dict[str, Any], counts: Dict[str, int], shared_keys: int):
+        total = job["total"]
+        done = sum(counts.get(s, 0) for s in ("completed", "failed", "cancelled"))
+        if job["cancelled"]:
+            status = "cancelled"
+        elif done >= total:
+            status = "completed_with_errors" if counts.get("failed") else "completed"
+        elif counts.get("running") or counts.get("completed") or counts.get("failed"):
+            status = "running"
+        else:
+            status = "queued"
+        return {
+            "job_id": job["job_id"],
+            "status": status,
+            "created_at": job["created_at"],
+            "source_name": job["source_name"],
+            "total": total,
+            "pending": counts.get("pending", 0),
+            "running": counts.get("running", 0),
+            "completed": counts.get("completed", 0),
+            "failed": counts.get("failed", 0),
+            "cancelled": counts.get("cancelled", 0),
+            "progress": round(done / total, 4) if total else 1.0,
+            "distinct_retrievals": shared_keys,
+            "options": json.loads(job["options"]),
+        }
+
+    def list_jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            job_ids = [
+                row["job_id"]
+                for row in conn.execute(
+                    "SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?",
+                    (limit,),
+                )
+            ]
+        return [self.job_progress(job_id) for job_id in job_ids]
+
+    def results(
+        self,
+        job_id: str,
+        offset: int = 0,
+        limit: int = 100,
+        status: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Per-row results (partial while the job is still running)"""
+        query = (
+            "SELECT row_index, status, attempts, payload, result, error, finished_at "
+            "FROM tasks WHERE job_id = ?"
+        )
+        params: List[Any] = [job_id]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY row_index LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [
+            {
+                "row_index": row["row_index"],
+                "status": row["status"],
+                "attempts": row["attempts"],
+                "position": json.loads(row["payload"]),
+                "result": json.loads(row["result"]) if row["result"] else None,
+                "error": row["error"],
+                "finished_at": row["finished_at"],
+            }
+            for row in rows
+        ]
+
+
+class BatchWorkerPool:
+    """Asyncio workers that drain the store through an async task handler"""
+
+    def __init__(
+        self,
+        store: BatchJobStore,
+        handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        workers: int = 2,
+        idle_poll_seconds: float = 2.0,
+    ):
+        self.store = store
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.idle_poll_seconds = idle_poll_seconds
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        """Resume interrupted work and start the workers (call from the event loop)"""
+        resumed = self.store.requeue_interrupted()
+        if resumed:
+            logger.info(f"🔁 Resumed {resumed} interrupted batch tasks")
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake idle workers after new tasks were enqueued"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _worker(self, worker_id: int):
+        while True:
+            task = await asyncio.to_thread(self.store.claim_next)
+            if task is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), timeout=self.idle_poll_seconds
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                result = await self.handler(task)
+                await asyncio.to_thread(self.store.complete, task["task_id"], result)
+            except asyncio.CancelledError:
+                raise
+            except RetryableTaskError as e:
+                await asyncio.to_thread(
+                    self.store.defer, task["task_id"], str(e), e.retry_after
+                )
+            except Exception as e:
+                logger.warning(
+                    f"Batch worker {worker_id}: task {task['task_id']} failed: {e}"
+                )
+                await asyncio.to_thread(
+                    self.store.fail, task["task_id"], str(e), task["attempts"], 5.0
+                )
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
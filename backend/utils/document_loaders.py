@@ -0,0 +1,428 @@
+"""
+Loader registry for uploaded documents
+Loaders are registered per file extension and per MIME type; the type sniffed
+from the file's leading bytes wins over the extension for binary formats, so a
+renamed DOCX or PDF is still parsed as such. DOCX is read straight from its
+XML, JSON is split into records while streaming, SQL into statements
+"""
+
+import csv
+import io
+import json
+import re
+import zipfile
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from langchain_core.documents import Document
+
+Loader = Callable[[str], List[Document]]
+
+RECORD_GROUP_CHARS = 1000
+JSON_READ_SIZE = 1024 * 1024
+TEXT_ENCODINGS = ("utf-8-sig", "cp1252", "latin-1")
+DOCX_MIME_TYPE = (
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+)
+XLSX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_LOADERS_BY_EXTENSION: Dict[str, Tuple[str, Loader]] = {}
+_LOADERS_BY_MIME: Dict[str, Tuple[str, Loader]] = {}
+
+
+def register_loader(name: str, extensions=(), mime_types=()):
+    """Decorator registering a loader for extensions and sniffed MIME types"""
+
+    def decorate(loader: Loader) -> Loader:
+        for extension in extensions:
+            _LOADERS_BY_EXTENSION[extension.lower()] = (name, loader)
+        for mime_type in mime_types:
+            _LOADERS_BY_MIME[mime_type] = (name, loader)
+        return loader
+
+    return decorate
+
+
+def sniff_mime_type(path: str) -> Optional[str]:
+    """MIME type from the leading bytes for the formats that have a signature"""
+    with open(path, "rb") as f:
+        head = f.read(8)
+    if head.startswith(b"%PDF"):
+        return "application/pdf"
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(path) as archive:
+                names = set(archive.namelist())
+        except zipfile.BadZipFile:
+            return None
+        if "word/document.xml" in names:
+            return DOCX_MIME_TYPE
+        if "xl/workbook.xml" in names:
+            return XLSX_MIME_TYPE
+        return "application/zip"
+    return None
+
+
+def loader_for(path: str) -> Tuple[str, Loader]:
+    """(loader name, loader) for a file; plain text when nothing matches"""
+    registered = _LOADERS_BY_MIME.get(sniff_mime_type(path) or "")
+    if registered:
+        return registered
+    extension = Path(path).suffix.lower()
+    return _LOADERS_BY_EXTENSION.get(extension, _LOADERS_BY_MIME["text/plain"])
+
+
+def load_document(path: str) -> List[Document]:
+    """Documents of one file through the registered loader"""
+    name, loader = loader_for(path)
+    documents = loader(path)
+    for document in documents:
+        document.metadata.setdefault("source", path)
+        document.metadata["loader"] = name
+    return documents
+
+
+def registered_loaders() -> Dict[str, List[str]]:
+    """Loader name -> extensions, for status pages and the benchmark"""
+    loaders: Dict[str, List[str]] = {}
+    for extension, (name, _) in sorted(_LOADERS_BY_EXTENSION.items()):
+        loaders.setdefault(name, []).append(extension)
+    return loaders
+
+
+def read_text(path: str) -> str:
+    """File content decoded with the first encoding that fits"""
+    data = Path(path).read_bytes()
+    for encoding in TEXT_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="replace")
+
+
+def _group_records(
+    records: Iterator[Tuple[int, str]], path: str, kind: str
+) -> List[Document]:
+    """Pack consecutive small records into documents of about RECORD_GROUP_CHARS"""
+    documents, texts, first = [], [], None
+    size = 0
+    for index, text in records:
+        if texts and size + len(text) > RECORD_GROUP_CHARS:
+            documents.append(_record_document(texts, path, kind, first, index - 1))
+            texts, size = [], 0
+        if not texts:
+            first = index
+        texts.append(text)
+        size += len(text) + 1
+    if texts:
+        documents.append(
+            _record_document(texts, path, kind, first, first + len(texts) - 1)
+        )
+    return documents
+
+
+def _record_document(texts, path, kind, first, last) -> Document:
+    return Document(
+        page_content="\n".join(texts),
+        metadata={"source": path, f"first_{kind}": first, f"last_{kind}": last},
+    )
+
+
+# Plain text ---------------------------------------------------------------
+
+
+@register_loader("text", extensions=(".txt", ".md"), mime_types=("text/plain",))
+def load_text(path: str) -> List[Document]:
+    return [Document(page_content=read_text(path), metadata={"source": path})]
+
+
+# JSON ----------------------------------------------------------------------
+
+
+class _JsonStream:
+    """Values decoded one at a time from a file read in JSON_READ_SIZE blocks"""
+
+    # A number cut off by a block boundary still decodes ("3." -> 3), so a value
+    # only counts as complete once one of these follows it
+    DELIMITERS = " \t\r\n,:]}"
+
+    def __init__(self, f):
+        self.f = f
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def _read_more(self) -> bool:
+        more = self.f.read(JSON_READ_SIZE)
+        self.buffer = self.buffer[self.position :] + more
+        self.position = 0
+        self.eof = not more
+        return bool(more)
+
+    def peek(self) -> str:
+        """Next non-whitespace character ("" at the end of the file)"""
+        while True:
+            while (
+                self.position < len(self.buffer)
+                and self.buffer[self.position] in " \t\r\n"
+            ):
+                self.position += 1
+            if self.position < len(self.buffer) or not self._read_more():
+                return self.buffer[self.position : self.position + 1]
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise json.JSONDecodeError(
+                f"Expecting {char!r}", self.buffer, self.position
+            )
+        self.position += 1
+
+    def value(self) -> object:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self.eof or not self._read_more():
+                    raise
+                continue
+            if end < len(self.buffer) and self.buffer[end] in self.DELIMITERS:
+                break
+            if self.eof or not self._read_more():
+                break
+        self.position = end
+        if self.position > JSON_READ_SIZE:
+            self.buffer = self.buffer[self.position :]
+            self.position = 0
+        return value
+
+    def items(self, close: str) -> Iterator[object]:
+        """Elements of an array (close="]") or keys of an object (close="}")
+        whose opening bracket was consumed; the caller reads each member"""
+        if self.peek() == close:
+            self.position += 1
+            return
+        while True:
+            yield
+            separator = self.peek()
+            self.position += 1
+            if separator == close:
+                return
+            if separator != ",":
+                raise json.JSONDecodeError(
+                    f"Expecting ',' or {close!r}", self.buffer, self.position - 1
+                )
+
+
+def _is_json_lines(path: str, first_block: str) -> bool:
+    if Path(path).suffix.lower() in (".jsonl", ".ndjson"):
+        return True
+    # A complete value on the first line followed by more content
+    first_line, newline, rest = first_block.partition("\n")
+    if not newline or not rest.strip():
+        return False
+    try:
+        json.loads(first_line)
+    except json.JSONDecodeError:
+        return False
+    return True
+
+
+def iter_json_records(path: str) -> Iterator[object]:
+    """Top-level records of a JSON file without loading it as one object
+
+    Arrays are decoded element by element from a sliding buffer. Objects yield
+    one record per member, and members holding an array one record per
+    element, streamed the same way; JSON Lines files yield one record per line.
+    """
+    with open(path, encoding="utf-8-sig") as f:
+        if _is_json_lines(path, f.read(JSON_READ_SIZE)):
+            f.seek(0)
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        f.seek(0)
+
+        stream = _JsonStream(f)
+        first = stream.peek()
+        if first == "[":
+            stream.position += 1
+            for _ in stream.items("]"):
+                yield stream.value()
+        elif first == "{":
+            stream.position += 1
+            for _ in stream.items("}"):
+                key = stream.value()
+                stream.expect(":")
+                if stream.peek() == "[":
+                    stream.position += 1
+                    for _ in stream.items("]"):
+                        yield {key: stream.value()}
+                else:
+                    yield {key: stream.value()}
+        else:
+            yield stream.value()
+        if stream.peek():
+            raise json.JSONDecodeError("Extra data", stream.buffer, stream.position)
+
+
+@register_loader(
+    "json", extensions=(".json", ".jsonl", ".ndjson"), mime_types=("application/json",)
+)
+def load_json(path: str) -> List[Document]:
+    records = (
+        (index, json.dumps(record, ensure_ascii=False))
+        for index, record in enumerate(iter_json_records(path))
+    )
+    return _group_records(records, path, "record")
+
+
+# SQL -----------------------------------------------------------------------
+
+_SQL_TOKEN_RE = re.compile(
+    r"--[^\n]*"  # line comment
+    r"|/\*.*?\*/"  # block comment
+    r"|'(?:[^']|'')*'"  # string literal
+    r"|\"(?:[^\"]|\"\")*\"|\[[^\]]*\]"  # quoted identifiers
+    r"|;|[^-/'\"\[;]+|.",
+    re.DOTALL,
+)
+
+
+def split_sql_statements(sql: str) -> List[str]:
+    """Statements separated by ';' outside quotes, brackets and comments
+
+    Comments directly preceding a statement stay with it, as mapping specs
+    document fields that way.
+    """
+    statements, current = [], []
+    for token in _SQL_TOKEN_RE.findall(sql):
+        if token == ";":
+            statement = "".join(current).strip()
+            if statement:
+                statements.append(statement + ";")
+            current = []
+        else:
+            current.append(token)
+    tail = "".join(current).strip()
+    if tail:
+        statements.append(tail)
+    return statements
+
+
+@register_loader("sql", extensions=(".sql",), mime_types=("application/sql",))
+def load_sql(path: str) -> List[Document]:
+    statements = enumerate(split_sql_statements(read_text(path)))
+    return _group_records(statements, path, "statement")
+
+
+# DOCX ----------------------------------------------------------------------
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_HEADING_RE = re.compile(r"(?:heading|berschrift|titre)\s*(\d)", re.IGNORECASE)
+
+
+def _paragraph_text(paragraph: ElementTree.Element) -> str:
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == f"{_W}t":
+            parts.append(node.text or "")
+        elif node.tag == f"{_W}tab":
+            parts.append("\t")
+        elif node.tag in (f"{_W}br", f"{_W}cr"):
+            parts.append("\n")
+    return "".join(parts).strip()
+
+
+def iter_docx_blocks(path: str) -> Iterator[str]:
+    """Paragraph texts and table rows (cells joined by ' | ') in document order
+
+    Streams word/document.xml with iterparse; headings get a markdown prefix.
+    """
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+        table_depth = 0
+        row: List[str] = []
+        cell: List[str] = []
+        for event, element in ElementTree.iterparse(xml, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                if tag == f"{_W}tbl":
+                    table_depth += 1
+                continue
+            if tag == f"{_W}p":
+                text = _paragraph_text(element)
+                if table_depth:
+                    if text:
+                        cell.append(text)
+                elif text:
+                    style = element.find(f"{_W}pPr/{_W}pStyle")
+                    match = (
+                        _HEADING_RE.search(style.get(f"{_W}val", ""))
+                        if style is not None
+                        else None
+                    )
+                    yield f"{'#' * int(match.group(1))} {text}" if match else text
+                element.clear()
+            elif tag == f"{_W}tc" and table_depth:
+                row.append(" ".join(cell))
+                cell = []
+            elif tag == f"{_W}tr" and table_depth:
+                if table_depth == 1:
+                    if any(row):
+                        yield " | ".join(row)
+                    row = []
+                element.clear()
+            elif tag == f"{_W}tbl":
+                table_depth -= 1
+
+
+@register_loader("docx", extensions=(".docx",), mime_types=(DOCX_MIME_TYPE,))
+def load_docx(path: str) -> List[Document]:
+    text = "\n".join(iter_docx_blocks(path))
+    return [Document(page_content=text, metadata={"source": path})]
+
+
+# Spreadsheets and PDF -------------------------------------------------------
+
+
+@register_loader("csv", extensions=(".csv",), mime_types=("text/csv",))
+def load_csv(path: str) -> List[Document]:
+    reader = csv.reader(io.StringIO(read_text(path)))
+    header = next(reader, [])
+    rows = (
+        (index, "; ".join(f"{h}: {v}" for h, v in zip(header, row) if v))
+        for index, row in enumerate(reader)
+    )
+    return _group_records(rows, path, "row")
+
+
+@register_loader("xlsx", extensions=(".xlsx",), mime_types=(XLSX_MIME_TYPE,))
+def load_xlsx(path: str) -> List[Document]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    documents = []
+    try:
+        for sheet in workbook.worksheets:
+            rows = (
+                (index, " | ".join("" if v is None else str(v) for v in values))
+                for index, values in enumerate(sheet.iter_rows(values_only=True))
+                if any(v is not None for v in values)
+            )
+            for document in _group_records(rows, path, "row"):
+                document.metadata["sheet"] = sheet.title
+                documents.append(document)
+    finally:
+        workbook.close()
+    return documents
+
+
+@register_loader("pdf", extensions=(".pdf",), mime_types=("application/pdf",))
+def load_pdf(path: str) -> List[Document]:
+    from langchain_community.document_loaders import PyPDFLoader
+
+    return PyPDFLoader(path).load()
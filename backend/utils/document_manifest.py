@@ -0,0 +1,122 @@
+"""
+Manifest of ingested documents keyed by content hash
+One entry per distinct file content and category: the stored file, its chunk
+count and how long ingesting it took. Byte-identical re-uploads, under any
+name, only add a reference to the existing entry and are not processed again
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentManifest:
+    """category -> sha256 -> document entry, persisted as JSON"""
+
+    def __init__(self, path: str = "document_manifest.json", max_references: int = 50):
+        self.path = path
+        self.max_references = max_references
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._entries = json.load(f).get("categories", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read document manifest {path}: {e}")
+
+    def claim(
+        self, category: str, sha256: str, filename: str, size: int, **reference
+    ) -> Optional[Dict[str, Any]]:
+        """Register new content, or return the entry of identical content
+
+        Returns None when the content is new (the caller ingests it), else a
+        copy of the existing entry after recording this upload as a reference.
+        """
+        now = datetime.now().isoformat()
+        with self._lock:
+            entries = self._entries.setdefault(category, {})
+            entry = entries.get(sha256)
+            if entry is None:
+                entries[sha256] = {
+                    "filename": filename,
+                    "size": size,
+                    "status": "pending",
+                    "chunks": None,
+                    "processing_seconds": None,
+                    "stored_at": now,
+                    "references": [],
+                }
+                self._save()
+                return None
+            entry["references"].append({"filename": filename, "at": now, **reference})
+            del entry["references"][: -self.max_references]
+            entry["reference_count"] = entry.get("reference_count", 0) + 1
+            self._save()
+            return json.loads(json.dumps(entry))
+
+    def mark_ingested(
+        self, category: str, sha256: str, chunks: int, processing_seconds: float
+    ):
+        with self._lock:
+            entry = self._entries.get(category, {}).get(sha256)
+            if entry is not None:
+                entry.update(
+                    status="ingested",
+                    chunks=chunks,
+                    processing_seconds=round(processing_seconds, 3),
+                )
+                self._save()
+
+    def forget(self, category: str, sha256: str):
+        """Drop an entry whose ingestion failed so the content can be retried"""
+        with self._lock:
+            if self._entries.get(category, {}).pop(sha256, None) is not None:
+                self._save()
+
+    def drop_pending(self) -> int:
+        """Forget content still pending from a previous run
+
+        Ingestion jobs live in memory, so that content will never be ingested
+        and is treated as new again. Call once on startup.
+        """
+        with self._lock:
+            orphaned = [
+                (category, sha256)
+                for category, entries in self._entries.items()
+                for sha256, entry in entries.items()
+                if entry["status"] == "pending"
+            ]
+            for category, sha256 in orphaned:
+                del self._entries[category][sha256]
+            if orphaned:
+                logger.info(f"Dropped {len(orphaned)} pending manifest entries")
+                self._save()
+        return len(orphaned)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                category: {
+                    "documents": len(entries),
+                    "duplicate_uploads": sum(
+                        e.get("reference_count", 0) for e in entries.values()
+                    ),
+                    "bytes": sum(e["size"] for e in entries.values()),
+                }
+                for category, entries in self._entries.items()
+            }
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"categories": self._entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write document manifest {self.path}: {e}")
@@ -0,0 +1,128 @@
+"""
+Document parsing and splitting in a process pool
+PDF, DOCX and XLSX parsing is CPU-bound Python, so files are parsed in worker
+processes sized to the machine's cores and results are yielded as they
+complete. A failing or crashing file only fails its own result
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def parse_and_split(path: str) -> Dict[str, Any]:
+    """Load and chunk one file (runs in a worker process); never raises"""
+    started = time.perf_counter()
+    try:
+        from pages.rag_cag import process_document, split_documents
+
+        documents = process_document(path)
+        if not documents:
+            raise ValueError("No content could be extracted")
+        chunks = split_documents(documents)
+        error = None
+    except Exception as e:
+        documents, chunks = [], []
+        error = f"{type(e).__name__}: {e}"
+    return {
+        "path": path,
+        "documents": len(documents),
+        "chunks": chunks,
+        "error": error,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def _failed(path: str, error: str) -> Dict[str, Any]:
+    return {"path": path, "documents": 0, "chunks": [], "error": error, "seconds": 0.0}
+
+
+class ParsingPool:
+    """Lazily started process pool for parse_and_split
+
+    Uses the spawn start method: the server process runs background threads,
+    which must not be forked, and spawn is the only method on Windows.
+    """
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _reset(self, broken: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _run_round(
+        self, paths: List[str], indexes: List[int]
+    ) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+        """Results of one pool round; None for files lost to a worker crash"""
+        pool = self._pool()
+        futures = {pool.submit(parse_and_split, paths[i]): i for i in indexes}
+        broken = False
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except BrokenProcessPool:
+                broken = True
+                yield futures[future], None
+        if broken:
+            self._reset(pool)
+
+    def parse_files(self, paths: List[str]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Yield (index, result) per file in completion order
+
+        Files lost to a worker crash are retried together once, then one at a
+        time, so only the file that crashes its worker ends up failed.
+        """
+        if self.workers <= 1:
+            for index, path in enumerate(paths):
+                yield index, parse_and_split(path)
+            return
+
+        pending = list(range(len(paths)))
+        for attempt in range(3):
+            crashed = []
+            rounds = [pending] if attempt < 2 else [[i] for i in pending]
+            for indexes in rounds:
+                for index, result in self._run_round(paths, indexes):
+                    if result is None:
+                        crashed.append(index)
+                    else:
+                        yield index, result
+            if not crashed:
+                return
+            pending = sorted(crashed)
+        for index in pending:
+            logger.warning(f"⚠️ Parsing {paths[index]} crashed its worker")
+            yield index, _failed(paths[index], "Parser process crashed")
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self) -> "ParsingPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
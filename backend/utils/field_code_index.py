@@ -0,0 +1,135 @@
+"""
+Exact-match index from reporting field codes to vector store chunk IDs
+Built next to each vector store at ingest time. Queries naming field codes
+(A020, B017, B500, ...) or column identifiers (CRR3_APPLICABLE_FLAG) get the
+chunks that define them by dictionary lookup, ahead of the similarity search
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE_NAME = "field_codes.json"
+MAX_POSTINGS_PER_CODE = 20
+
+# Field codes like B017 and upper-case identifiers with an underscore
+FIELD_CODE_RE = re.compile(r"\b(?:[A-Z]\d{3}|[A-Z][A-Z0-9]*_[A-Z0-9_]*[A-Z0-9])\b")
+_DEFINING_AFTER_RE = re.compile(r"\s*(?:[:=]|\(|-\s|–|\|)")
+_DEFINING_BEFORE_RE = re.compile(r"(?:^|\n)[\s|*#>-]*$|\bAS\s+$", re.IGNORECASE)
+DEFINITION_WEIGHT = 5
+
+
+def extract_field_codes(text: str) -> List[str]:
+    """Field codes and identifiers in order of first mention"""
+    return list(dict.fromkeys(FIELD_CODE_RE.findall(text)))
+
+
+def score_field_codes(text: str) -> Dict[str, int]:
+    """Per-code relevance of a chunk: mentions, defining mentions weigh more
+
+    A mention counts as defining when the code starts a line/table cell, is
+    followed by ':', '=' or a description, or is a SQL alias (AS B017).
+    """
+    scores: Dict[str, int] = {}
+    for match in FIELD_CODE_RE.finditer(text):
+        before = text[max(0, match.start() - 40) : match.start()]
+        defining = bool(
+            _DEFINING_BEFORE_RE.search(before)
+            or _DEFINING_AFTER_RE.match(text, match.end())
+        )
+        code = match.group(0)
+        scores[code] = scores.get(code, 0) + (DEFINITION_WEIGHT if defining else 1)
+    return scores
+
+
+class FieldCodeIndex:
+    """code -> [(chunk_id, score)] postings persisted as JSON in the store folder"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.postings: Dict[str, List[Tuple[str, int]]] = {}
+        self.mtime = None
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                self.postings = {
+                    code: [tuple(p) for p in postings]
+                    for code, postings in data.get("codes", {}).items()
+                }
+                self.mtime = os.path.getmtime(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read field code index {path}: {e}")
+
+    @classmethod
+    def for_store(cls, store_directory: str) -> "FieldCodeIndex":
+        return cls(os.path.join(store_directory, INDEX_FILE_NAME))
+
+    def add_chunks(self, chunk_ids: Iterable[str], texts: Iterable[str]):
+        """Index new chunks; each code keeps its highest scoring chunks"""
+        touched = set()
+        for chunk_id, text in zip(chunk_ids, texts):
+            for code, score in score_field_codes(text).items():
+                self.postings.setdefault(code, []).append((chunk_id, score))
+                touched.add(code)
+        for code in touched:
+            postings = sorted(self.postings[code], key=lambda p: p[1], reverse=True)
+            self.postings[code] = postings[:MAX_POSTINGS_PER_CODE]
+
+    def clear(self):
+        self.postings = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"codes": self.postings}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.mtime = os.path.getmtime(self.path)
+
+    def lookup(self, codes: Iterable[str], per_code: int = 2) -> List[str]:
+        """Chunk IDs defining the given codes, best first, without duplicates"""
+        found: List[str] = []
+        for code in codes:
+            for chunk_id, _ in self.postings.get(code, ())[:per_code]:
+                if chunk_id not in found:
+                    found.append(chunk_id)
+        return found
+
+    def __len__(self) -> int:
+        return len(self.postings)
+
+
+_loaded: Dict[str, FieldCodeIndex] = {}
+_loaded_lock = threading.Lock()
+
+
+def load_field_code_index(store_directory: str) -> FieldCodeIndex:
+    """Cached index of a store, re-read only when the file changed on disk"""
+    path = os.path.join(store_directory, INDEX_FILE_NAME)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    with _loaded_lock:
+        index = _loaded.get(path)
+        if index is None or index.mtime != mtime:
+            index = FieldCodeIndex(path)
+            _loaded[path] = index
+        return index
+
+
+def merge_documents(*document_lists) -> List:
+    """Concatenate document lists, dropping chunks already seen"""
+    seen, merged = set(), []
+    for documents in document_lists:
+        for document in documents:
+            if document.page_content not in seen:
+                seen.add(document.page_content)
+                merged.append(document)
+    return merged
@@ -0,0 +1,141 @@
+"""
+Background document ingestion jobs
+Uploads are stored and queued; asyncio workers run the blocking ingestion
+pipeline in a thread and the handler reports per-file stages as it goes.
+Job state is kept in memory for the most recent jobs
+"""
+
+import asyncio
+import copy
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INGESTION_STAGES = ("stored", "parsed", "chunked", "embedded", "indexed")
+
+ProgressCallback = Callable[..., None]
+
+
+class IngestionJobs:
+    """Queue of ingestion jobs drained by a pool of asyncio workers
+
+    handler(job, progress) runs in a worker thread; progress(file_index,
+    stage=..., **fields) updates one file of the job. The handler's return
+    value is merged into the job when it completes.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Dict[str, Any], ProgressCallback], Dict[str, Any]],
+        workers: int = 2,
+        history: int = 200,
+    ):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.history = history
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """Start the workers (call from the event loop)"""
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(
+        self, category: str, files: List[Dict[str, Any]], **metadata
+    ) -> Dict[str, Any]:
+        """Register a job for stored files and queue it"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        job = {
+            "job_id": f"INGEST_{timestamp}_{uuid.uuid4().hex[:6]}",
+            "category": category,
+            "status": "queued",
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "files": [{"stage": "stored", **f} for f in files],
+            **metadata,
+        }
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs.values()))
+                if oldest["status"] in ("queued", "running"):
+                    break
+                self._jobs.popitem(last=False)
+            snapshot = copy.deepcopy(job)
+        self._queue.put_nowait(job["job_id"])
+        return snapshot
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job else None
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Newest jobs first, without the per-file detail"""
+        with self._lock:
+            jobs = list(self._jobs.values())[-limit:]
+            return [
+                {
+                    **{k: v for k, v in job.items() if k != "files"},
+                    "file_count": len(job["files"]),
+                }
+                for job in reversed(jobs)
+            ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job["status"] for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            **{s: statuses.count(s) for s in ("queued", "running", "failed")},
+        }
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _progress(self, job_id: str) -> ProgressCallback:
+        def progress(file_index: int, **fields):
+            with self._lock:
+                self._jobs[job_id]["files"][file_index].update(fields)
+
+        return progress
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job_id = await self._queue.get()
+            self._update(
+                job_id, status="running", started_at=datetime.now().isoformat()
+            )
+            job = self.get(job_id)
+            try:
+                result = await asyncio.to_thread(
+                    self.handler, job, self._progress(job_id)
+                )
+                self._update(job_id, status="completed", **(result or {}))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ingestion job {job_id} failed: {e}")
+                self._update(job_id, status="failed", error=str(e))
+            finally:
+                self._update(job_id, finished_at=datetime.now().isoformat())
+                self._queue.task_done()
@@ -0,0 +1,282 @@
+"""
+Field-level lineage index over the mapping documents
+Every CTE column of a parsed mapping becomes a node linked to the columns its
+expression reads, down to the source table columns (pos.B500 as RISK_APPROACH).
+The graph is persisted as JSON and a field's lineage is a walk over adjacency
+lists, so the analysis prompt gets the exact derivation instead of text chunks
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from utils.mapping_rules import MappingRuleEngine, MappingSpec, SelectItem
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9_]*")
+_FIELD_CODE_RE = re.compile(r"^([A-Z]\d{3})_")
+
+
+def _file_signature(path: str) -> Optional[List[int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def build_mapping_lineage(spec: MappingSpec) -> Dict[str, Any]:
+    """Nodes (column definitions and source columns) of one mapping with edges"""
+    nodes: Dict[str, Dict[str, Any]] = {}
+    main_table = spec.tables.get(spec.main_alias, spec.main_alias)
+    renames = {
+        item.alias: item
+        for item in spec.items
+        if item.stage_index == 0 and item.is_passthrough
+    }
+
+    def item_id(item: SelectItem) -> str:
+        return f"{item.stage}.{item.alias}"
+
+    def source_id(qualifier: Optional[str], name: str) -> str:
+        table = spec.tables.get(qualifier, qualifier) if qualifier else main_table
+        node_id = f"{table}.{name}" if table else name
+        if node_id not in nodes:
+            nodes[node_id] = {
+                "name": name,
+                "kind": "source",
+                "table": table,
+                "depends_on": [],
+                "used_by": [],
+            }
+        return node_id
+
+    for item in spec.items:
+        node_id = item_id(item)
+        depends_on = []
+        for column in item.expr.columns():
+            definition = spec.definition(column.name, item.stage_index)
+            if definition is not None:
+                target = item_id(definition)
+            elif item.stage_index > 0 and column.name in renames:
+                target = item_id(renames[column.name])
+            else:
+                target = source_id(column.qualifier, column.name)
+            if target != node_id and target not in depends_on:
+                depends_on.append(target)
+        nodes[node_id] = {
+            "name": item.alias,
+            "kind": "output" if item.stage == "final" else "derived",
+            "stage": item.stage,
+            "expression": item.expr.sql,
+            "depends_on": depends_on,
+            "used_by": [],
+        }
+    for node_id, node in nodes.items():
+        for target in node["depends_on"]:
+            nodes[target]["used_by"].append(node_id)
+
+    # Name lookup: every column name, plus reporting codes (B017) for the column
+    # the rule engine evaluates them with
+    fields: Dict[str, List[str]] = {}
+    for node_id, node in nodes.items():
+        fields.setdefault(node["name"], []).append(node_id)
+    codes = {m.group(1) for name in list(fields) if (m := _FIELD_CODE_RE.match(name))}
+    for code in codes:
+        column = spec.resolve_field(code)
+        definition = spec.definition(column, spec.final_scope) if column else None
+        if definition is not None and code not in fields:
+            fields[code] = [item_id(definition)]
+
+    return {
+        "source_file": spec.source_file,
+        "signature": _file_signature(spec.source_file),
+        "stages": spec.stages,
+        "nodes": nodes,
+        "fields": fields,
+    }
+
+
+class LineageIndex:
+    """Persisted lineage graphs of all loaded mappings"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.mappings: Dict[str, Dict[str, Any]] = {}
+        self.built_at: Optional[str] = None
+        self._names: Set[str] = set()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _index_names(self):
+        self._names = {f for graph in self.mappings.values() for f in graph["fields"]}
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read lineage index {self.path}: {e}")
+            return
+        if data.get("version") == INDEX_VERSION:
+            self.mappings = data.get("mappings", {})
+            self.built_at = data.get("built_at")
+            self._index_names()
+
+    def _save(self):
+        data = {
+            "version": INDEX_VERSION,
+            "built_at": self.built_at,
+            "mappings": self.mappings,
+        }
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def sync(self, engine: MappingRuleEngine) -> Dict[str, Any]:
+        """Rebuild the graphs whose mapping file changed; drop removed mappings"""
+        rebuilt = []
+        with self._lock:
+            mappings = {}
+            for name, spec in engine.mappings.items():
+                stored = self.mappings.get(name)
+                if (
+                    stored
+                    and stored.get("source_file") == spec.source_file
+                    and stored.get("signature") == _file_signature(spec.source_file)
+                ):
+                    mappings[name] = stored
+                else:
+                    mappings[name] = build_mapping_lineage(spec)
+                    rebuilt.append(name)
+            removed = sorted(set(self.mappings) - set(mappings))
+            self.mappings = mappings
+            self._index_names()
+            if rebuilt or removed or not self.path.exists():
+                self.built_at = datetime.now().isoformat()
+                try:
+                    self._save()
+                except OSError as e:
+                    logger.warning(f"Could not write lineage index {self.path}: {e}")
+        if rebuilt or removed:
+            logger.info(f"🧬 Lineage index rebuilt for {rebuilt}, removed {removed}")
+        return {"rebuilt": rebuilt, "removed": removed, **self.summary()}
+
+    def find_fields(self, text: str) -> List[str]:
+        """Known field/column names mentioned in a free-text query"""
+        found = []
+        for word in _WORD_RE.findall(text):
+            word = word.upper()
+            if word in self._names and word not in found:
+                found.append(word)
+        return found
+
+    def lineage(
+        self,
+        field: str,
+        mapping: Optional[str] = None,
+        max_depth: int = 12,
+    ) -> List[Dict[str, Any]]:
+        """Upstream subgraph of a field per mapping (breadth first from the field)"""
+        field = field.upper()
+        results = []
+        for name, graph in self.mappings.items():
+            if mapping and name != mapping.upper():
+                continue
+            start = graph["fields"].get(field)
+            if not start:
+                continue
+            nodes = graph["nodes"]
+            seen: Set[str] = set(start)
+            queue = deque((node_id, 0) for node_id in start)
+            ordered: List[Tuple[str, int]] = []
+            while queue:
+                node_id, depth = queue.popleft()
+                ordered.append((node_id, depth))
+                if depth >= max_depth:
+                    continue
+                for target in nodes[node_id]["depends_on"]:
+                    if target not in seen:
+                        seen.add(target)
+                        queue.append((target, depth + 1))
+            results.append(
+                {
+                    "mapping": name,
+                    "field": field,
+                    "source_file": graph["source_file"],
+                    "nodes": [
+                        {"id": node_id, "depth": depth, **nodes[node_id]}
+                        for node_id, depth in ordered
+                    ],
+                    "sources": [
+                        node_id
+                        for node_id, _ in ordered
+                        if nodes[node_id]["kind"] == "source"
+                    ],
+                }
+            )
+        return results
+
+    def context_for_query(
+        self,
+        query: str,
+        mapping: Optional[str] = None,
+        max_fields: int = 3,
+        max_chars: int = 4000,
+    ) -> Tuple[str, List[str]]:
+        """Prompt section with the lineage of the fields a query mentions"""
+        parts, files = [], []
+        for field in self.find_fields(query)[:max_fields]:
+            for subgraph in self.lineage(field, mapping):
+                parts.append(format_lineage(subgraph))
+                file_name = Path(subgraph["source_file"]).name
+                if file_name not in files:
+                    files.append(file_name)
+        if not parts:
+            return "", []
+        text = "\n".join(parts)
+        if len(text) > max_chars:
+            text = text[:max_chars] + "\n  ..."
+        return f"[FIELD LINEAGE]\n{text}", files
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "built_at": self.built_at,
+            "mappings": {
+                name: {
+                    "source_file": graph["source_file"],
+                    "nodes": len(graph["nodes"]),
+                    "edges": sum(len(n["depends_on"]) for n in graph["nodes"].values()),
+                    "sources": sum(
+                        n["kind"] == "source" for n in graph["nodes"].values()
+                    ),
+                }
+                for name, graph in self.mappings.items()
+            },
+        }
+
+
+def format_lineage(subgraph: Dict[str, Any], max_expression: int = 160) -> str:
+    """Readable derivation chain of one field for the prompt"""
+    lines = [f"{subgraph['mapping']} · {subgraph['field']}:"]
+    for node in subgraph["nodes"]:
+        indent = "  " * (node["depth"] + 1)
+        if node["kind"] == "source":
+            continue
+        expression = " ".join(node["expression"].split())
+        if len(expression) > max_expression:
+            expression = expression[:max_expression] + " ..."
+        lines.append(f"{indent}{node['id']} = {expression}")
+    if subgraph["sources"]:
+        lines.append(f"  Quellfelder: {', '.join(subgraph['sources'])}")
+    return "\n".join(lines)
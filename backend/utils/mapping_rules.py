@@ -0,0 +1,1246 @@
+"""
+Deterministic mapping rule engine compiled from the mapping SQL documents
+Each "Mapping <REGIME>:" section (CTE chain of CASE expressions) is parsed once
+into an expression tree and compiled to closures, so a single position can be
+evaluated in microseconds together with the exact CASE branches that fired
+"""
+
+import logging
+import math
+import re
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAPPING_FILE_TYPES = {".txt", ".sql", ".md"}
+NULL_VALUES = {"", "NULL", "NONE", "NAN"}
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+)
+    |(?P<comment>--[^\n]*)
+    |(?P<string>'(?:[^']|'')*')
+    |(?P<number>\d+(?:\.\d+)?)
+    |(?P<ident>[A-Za-z_][A-Za-z0-9_$#]*)
+    |(?P<op><=|>=|!=|<>|\|\||[=<>(),.*/+\-;])
+    |(?P<other>.)
+    """,
+    re.VERBOSE,
+)
+_SECTION_RE = re.compile(r"^\s*Mapping\s+([A-Za-z0-9_]+)\s*:\s*$", re.MULTILINE)
+# "NAME = value", or "B500: value" for field codes as long as the value is not
+# itself an assignment ("Position X1: B500 = 0" keeps B500 = 0)
+_POSITION_FIELD_RE = re.compile(
+    r"\b(?:([A-Za-z][A-Za-z0-9_]*)\s*=|([A-Za-z]\d+)\s*:(?!\s*\w+\s*=))"
+    r"\s*('[^']*'|\"[^\"]*\"|[^\s;,]+)"
+)
+
+
+class MappingParseError(ValueError):
+    pass
+
+
+# --------------------------------------------------------------------------
+# Tokenizer and expression tree
+# --------------------------------------------------------------------------
+
+
+class Token:
+    __slots__ = ("kind", "value", "upper")
+
+    def __init__(self, kind: str, value: str):
+        self.kind = kind
+        self.value = value
+        self.upper = value.upper()
+
+    def __repr__(self):
+        return f"Token({self.kind}, {self.value!r})"
+
+
+def tokenize(text: str) -> List[Token]:
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind in ("ws", "comment", "other"):
+            continue
+        tokens.append(Token(kind, match.group()))
+    return tokens
+
+
+def tokens_to_sql(tokens: List[Token]) -> str:
+    """Readable SQL text for a token slice (used in rule traces)"""
+    text = " ".join(t.value for t in tokens)
+    text = re.sub(r"\s*\.\s*", ".", text)
+    text = re.sub(r"\(\s+", "(", text)
+    text = re.sub(r"\s+([),])", r"\1", text)
+    return text
+
+
+def _is_null(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, float) and math.isnan(value):
+        return True
+    return False
+
+
+def _to_number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).strip().replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _parse_date(text: str) -> Optional[date]:
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y", "%Y%m%d", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return datetime.strptime(text[:19], fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _to_date(value: Any) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return _parse_date(str(value).strip())
+
+
+def _coerce(a: Any, b: Any) -> Tuple[Any, Any]:
+    """Make a position value comparable with a literal (CSV values are strings)"""
+    if isinstance(a, (int, float)) and not isinstance(b, (int, float)):
+        number = _to_number(b)
+        return (a, number) if number is not None else (str(a), str(b))
+    if isinstance(b, (int, float)) and not isinstance(a, (int, float)):
+        number = _to_number(a)
+        return (number, b) if number is not None else (str(a), str(b))
+    if isinstance(a, date) and not isinstance(b, date):
+        other = _to_date(b)
+        return (a, other) if other is not None else (str(a), str(b))
+    if isinstance(b, date) and not isinstance(a, date):
+        other = _to_date(a)
+        return (other, b) if other is not None else (str(a), str(b))
+    return a, b
+
+
+def sql_equals(a: Any, b: Any) -> Optional[bool]:
+    if _is_null(a) or _is_null(b):
+        return None
+    a, b = _coerce(a, b)
+    if isinstance(a, float) and isinstance(b, float):
+        return abs(a - b) < 1e-9
+    return a == b
+
+
+def _compare(op: str, a: Any, b: Any) -> Optional[bool]:
+    if op in ("=", "!=", "<>"):
+        equal = sql_equals(a, b)
+        return equal if equal is None or op == "=" else not equal
+    if _is_null(a) or _is_null(b):
+        return None
+    a, b = _coerce(a, b)
+    try:
+        if op == "<":
+            return a < b
+        if op == "<=":
+            return a <= b
+        if op == ">":
+            return a > b
+        return a >= b
+    except TypeError:
+        return None
+
+
+def _months_between(later: Any, earlier: Any) -> Optional[float]:
+    d1, d2 = _to_date(later), _to_date(earlier)
+    if d1 is None or d2 is None:
+        return None
+    return (d1.year - d2.year) * 12 + (d1.month - d2.month) + (d1.day - d2.day) / 31
+
+
+def _arith(op: str, a: Any, b: Any) -> Optional[Any]:
+    if op == "||":
+        return None if _is_null(a) or _is_null(b) else f"{a}{b}"
+    x, y = _to_number(a), _to_number(b)
+    if x is None or y is None:
+        return None
+    if op == "+":
+        return x + y
+    if op == "-":
+        return x - y
+    if op == "*":
+        return x * y
+    return x / y if y else None
+
+
+SQL_FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    "MONTHS_BETWEEN": _months_between,
+    "NVL": lambda a, b: b if _is_null(a) else a,
+    "COALESCE": lambda *args: next((a for a in args if not _is_null(a)), None),
+    "UPPER": lambda a: None if _is_null(a) else str(a).upper(),
+    "TRIM": lambda a: None if _is_null(a) else str(a).strip(),
+    "ABS": lambda a: None if _to_number(a) is None else abs(_to_number(a)),
+    "ROUND": lambda a, n=0: (
+        None if _to_number(a) is None else round(_to_number(a), int(_to_number(n)))
+    ),
+    "SYSDATE": lambda: date.today(),
+}
+
+Evaluator = Callable[["_Evaluation", int], Any]
+
+
+class Expr:
+    """Node of a parsed SQL expression"""
+
+    sql: str = ""
+
+    def compile(self) -> Evaluator:
+        raise NotImplementedError
+
+    def children(self) -> Iterable["Expr"]:
+        return ()
+
+    def columns(self) -> List["Column"]:
+        """Column references in this expression (depth first, no duplicates)"""
+        seen, found = set(), []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Column) and node.key not in seen:
+                seen.add(node.key)
+                found.append(node)
+            stack.extend(reversed(list(node.children())))
+        return found
+
+
+class Literal(Expr):
+    def __init__(self, value: Any, sql: str):
+        self.value = value
+        self.sql = sql
+
+    def compile(self) -> Evaluator:
+        value = self.value
+        return lambda ev, scope: value
+
+
+class Column(Expr):
+    def __init__(self, name: str, qualifier: Optional[str] = None):
+        self.name = name.upper()
+        self.qualifier = qualifier
+        self.sql = f"{qualifier}.{name}" if qualifier else name
+
+    @property
+    def key(self) -> Tuple[Optional[str], str]:
+        return (self.qualifier, self.name)
+
+    def compile(self) -> Evaluator:
+        name = self.name
+        return lambda ev, scope: ev.lookup(name, scope)
+
+
+class Function(Expr):
+    def __init__(self, name: str, args: List[Expr], sql: str):
+        self.name = name.upper()
+        self.args = args
+        self.sql = sql
+
+    def children(self):
+        return self.args
+
+    def compile(self) -> Evaluator:
+        func = SQL_FUNCTIONS.get(self.name)
+        if func is None:
+            raise MappingParseError(f"Unsupported SQL function {self.name}")
+        args = [a.compile() for a in self.args]
+        return lambda ev, scope: func(*(a(ev, scope) for a in args))
+
+
+class Subquery(Expr):
+    """Scalar subquery - not evaluable for a single position"""
+
+    def __init__(self, sql: str):
+        self.sql = sql
+
+    def compile(self) -> Evaluator:
+        return lambda ev, scope: None
+
+
+class BinaryOp(Expr):
+    def __init__(self, op: str, left: Expr, right: Expr, sql: str):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.sql = sql
+
+    def children(self):
+        return (self.left, self.right)
+
+    def compile(self) -> Evaluator:
+        op, left, right = self.op, self.left.compile(), self.right.compile()
+        return lambda ev, scope: _arith(op, left(ev, scope), right(ev, scope))
+
+
+class Negate(Expr):
+    def __init__(self, operand: Expr, sql: str):
+        self.operand = operand
+        self.sql = sql
+
+    def children(self):
+        return (self.operand,)
+
+    def compile(self) -> Evaluator:
+        operand = self.operand.compile()
+
+        def evaluate(ev, scope):
+            value = _to_number(operand(ev, scope))
+            return None if value is None else -value
+
+        return evaluate
+
+
+class Comparison(Expr):
+    def __init__(self, op: str, left: Expr, right: Expr, sql: str):
+        self.op = "!=" if op == "<>" else op
+        self.left = left
+        self.right = right
+        self.sql = sql
+
+    def children(self):
+        return (self.left, self.right)
+
+    def compile(self) -> Evaluator:
+        op, left, right = self.op, self.left.compile(), self.right.compile()
+        return lambda ev, scope: _compare(op, left(ev, scope), right(ev, scope))
+
+
+class InList(Expr):
+    def __init__(self, operand: Expr, items: List[Expr], negated: bool, sql: str):
+        self.operand = operand
+        self.items = items
+        self.negated = negated
+        self.sql = sql
+
+    def children(self):
+        return [self.operand, *self.items]
+
+    def compile(self) -> Evaluator:
+        operand = self.operand.compile()
+        items = [i.compile() for i in self.items]
+        negated = self.negated
+
+        def evaluate(ev, scope):
+            value = operand(ev, scope)
+            if _is_null(value):
+                return None
+            unknown = False
+            for item in items:
+                equal = sql_equals(value, item(ev, scope))
+                if equal:
+                    return not negated
+                unknown = unknown or equal is None
+            return None if unknown else negated
+
+        return evaluate
+
+
+class IsNull(Expr):
+    def __init__(self, operand: Expr, negated: bool, sql: str):
+        self.operand = operand
+        self.negated = negated
+        self.sql = sql
+
+    def children(self):
+        return (self.operand,)
+
+    def compile(self) -> Evaluator:
+        operand, negated = self.operand.compile(), self.negated
+        return lambda ev, scope: _is_null(operand(ev, scope)) != negated
+
+
+class Between(Expr):
+    def __init__(self, operand: Expr, low: Expr, high: Expr, negated: bool, sql: str):
+        self.operand = operand
+        self.low = low
+        self.high = high
+        self.negated = negated
+        self.sql = sql
+
+    def children(self):
+        return (self.operand, self.low, self.high)
+
+    def compile(self) -> Evaluator:
+        operand, low, high = (e.compile() for e in self.children())
+        negated = self.negated
+
+        def evaluate(ev, scope):
+            value = operand(ev, scope)
+            result = _and(
+                _compare(">=", value, low(ev, scope)),
+                _compare("<=", value, high(ev, scope)),
+            )
+            return result if result is None or not negated else not result
+
+        return evaluate
+
+
+def _and(a: Optional[bool], b: Optional[bool]) -> Optional[bool]:
+    if a is False or b is False:
+        return False
+    if a is None or b is None:
+        return None
+    return True
+
+
+def _or(a: Optional[bool], b: Optional[bool]) -> Optional[bool]:
+    if a is True or b is True:
+        return True
+    if a is None or b is None:
+        return None
+    return False
+
+
+class BoolOp(Expr):
+    def __init__(self, op: str, operands: List[Expr], sql: str):
+        self.op = op
+        self.operands = operands
+        self.sql = sql
+
+    def children(self):
+        return self.operands
+
+    def compile(self) -> Evaluator:
+        operands = [o.compile() for o in self.operands]
+        if self.op == "AND":
+
+            def evaluate(ev, scope):
+                result: Optional[bool] = True
+                for operand in operands:
+                    result = _and(result, operand(ev, scope))
+                    if result is False:
+                        return False
+                return result
+
+        else:
+
+            def evaluate(ev, scope):
+                result: Optional[bool] = False
+                for operand in operands:
+                    result = _or(result, operand(ev, scope))
+                    if result is True:
+                        return True
+                return result
+
+        return evaluate
+
+
+class Not(Expr):
+    def __init__(self, operand: Expr, sql: str):
+        self.operand = operand
+        self.sql = sql
+
+    def children(self):
+        return (self.operand,)
+
+    def compile(self) -> Evaluator:
+        operand = self.operand.compile()
+
+        def evaluate(ev, scope):
+            value = operand(ev, scope)
+            return None if value is None else not value
+
+        return evaluate
+
+
+class Case(Expr):
+    """CASE [operand] WHEN ... THEN ... [ELSE ...] END"""
+
+    def __init__(
+        self,
+        operand: Optional[Expr],
+        branches: List[Tuple[Expr, Expr]],
+        default: Optional[Expr],
+        sql: str,
+    ):
+        self.operand = operand
+        self.branches = branches
+        self.default = default
+        self.sql = sql
+
+    def children(self):
+        nodes = [self.operand] if self.operand else []
+        for condition, result in self.branches:
+            nodes += [condition, result]
+        if self.default is not None:
+            nodes.append(self.default)
+        return nodes
+
+    @staticmethod
+    def describe(condition: Optional[Expr], result: Expr) -> str:
+        """Trace text of a branch; nested CASE results are traced separately"""
+        text = f"WHEN {condition.sql}" if condition is not None else "ELSE"
+        if isinstance(result, Case):
+            return text
+        if condition is None:
+            return f"{text} {result.sql}"
+        return f"{text} THEN {result.sql}"
+
+    def compile(self) -> Evaluator:
+        operand = self.operand.compile() if self.operand else None
+        branches = [
+            (c.compile(), r.compile(), self.describe(c, r)) for c, r in self.branches
+        ]
+        default = self.default.compile() if self.default is not None else None
+        default_text = (
+            self.describe(None, self.default) if self.default is not None else None
+        )
+
+        def evaluate(ev, scope):
+            value = operand(ev, scope) if operand else None
+            for condition, result, text in branches:
+                if operand:
+                    matched = sql_equals(value, condition(ev, scope))
+                else:
+                    matched = condition(ev, scope)
+                if matched is True:
+                    ev.record(text)
+                    return result(ev, scope)
+            if default is None:
+                ev.record("ELSE NULL")
+                return None
+            ev.record(default_text)
+            return default(ev, scope)
+
+        return evaluate
+
+
+# --------------------------------------------------------------------------
+# Parser
+# --------------------------------------------------------------------------
+
+
+class _Parser:
+    """Recursive descent parser for the SQL expression subset used in mappings"""
+
+    def __init__(self, tokens: List[Token]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def at(self, *values: str) -> bool:
+        token = self.peek()
+        return token is not None and token.upper in values
+
+    def advance(self) -> Token:
+        token = self.peek()
+        if token is None:
+            raise MappingParseError("Unexpected end of expression")
+        self.pos += 1
+        return token
+
+    def expect(self, value: str) -> Token:
+        token = self.advance()
+        if token.upper != value:
+            raise MappingParseError(f"Expected {value}, got {token.value}")
+        return token
+
+    def sql_since(self, start: int) -> str:
+        return tokens_to_sql(self.tokens[start : self.pos])
+
+    def parse(self) -> Expr:
+        expr = self.parse_or()
+        if self.peek() is not None:
+            raise MappingParseError(f"Unexpected token {self.peek().value}")
+        return expr
+
+    def parse_or(self) -> Expr:
+        start = self.pos
+        operands = [self.parse_and()]
+        while self.at("OR"):
+            self.advance()
+            operands.append(self.parse_and())
+        if len(operands) == 1:
+            return operands[0]
+        return BoolOp("OR", operands, self.sql_since(start))
+
+    def parse_and(self) -> Expr:
+        start = self.pos
+        operands = [self.parse_not()]
+        while self.at("AND"):
+            self.advance()
+            operands.append(self.parse_not())
+        if len(operands) == 1:
+            return operands[0]
+        return BoolOp("AND", operands, self.sql_since(start))
+
+    def parse_not(self) -> Expr:
+        if self.at("NOT"):
+            start = self.pos
+            self.advance()
+            operand = self.parse_not()
+            return Not(operand, self.sql_since(start))
+        return self.parse_predicate()
+
+    def parse_predicate(self) -> Expr:
+        start = self.pos
+        left = self.parse_additive()
+        if self.at("=", "!=", "<>", "<", "<=", ">", ">="):
+            op = self.advance().value
+            right = self.parse_additive()
+            return Comparison(op, left, right, self.sql_since(start))
+        if self.at("IS"):
+            self.advance()
+            negated = self.at("NOT")
+            if negated:
+                self.advance()
+            self.expect("NULL")
+            return IsNull(left, negated, self.sql_since(start))
+        negated = self.at("NOT") and self.peek(1) and self.peek(1).upper in (
+            "IN",
+            "BETWEEN",
+        )
+        if negated:
+            self.advance()
+        if self.at("IN"):
+            self.advance()
+            self.expect("(")
+            items = [self.parse_additive()]
+            while self.at(","):
+                self.advance()
+                items.append(self.parse_additive())
+            self.expect(")")
+            return InList(left, items, negated, self.sql_since(start))
+        if self.at("BETWEEN"):
+            self.advance()
+            low = self.parse_additive()
+            self.expect("AND")
+            high = self.parse_additive()
+            return Between(left, low, high, negated, self.sql_since(start))
+        return left
+
+    def parse_additive(self) -> Expr:
+        start = self.pos
+        left = self.parse_term()
+        while self.at("+", "-", "||"):
+            op = self.advance().value
+            right = self.parse_term()
+            left = BinaryOp(op, left, right, self.sql_since(start))
+        return left
+
+    def parse_term(self) -> Expr:
+        start = self.pos
+        left = self.parse_unary()
+        while self.at("*", "/"):
+            op = self.advance().value
+            right = self.parse_unary()
+            left = BinaryOp(op, left, right, self.sql_since(start))
+        return left
+
+    def parse_unary(self) -> Expr:
+        if self.at("-"):
+            start = self.pos
+            self.advance()
+            operand = self.parse_unary()
+            return Negate(operand, self.sql_since(start))
+        return self.parse_primary()
+
+    def parse_primary(self) -> Expr:
+        start = self.pos
+        token = self.advance()
+        if token.kind == "number":
+            value = float(token.value) if "." in token.value else int(token.value)
+            return Literal(value, token.value)
+        if token.kind == "string":
+            return Literal(token.value[1:-1].replace("''", "'"), token.value)
+        if token.value == "(":
+            if self.at("SELECT"):
+                depth = 1
+                while depth:
+                    inner = self.advance()
+                    depth += {"(": 1, ")": -1}.get(inner.value, 0)
+                return Subquery(self.sql_since(start))
+            expr = self.parse_or()
+            self.expect(")")
+            return expr
+        if token.upper == "CASE":
+            return self.parse_case(start)
+        if token.upper == "NULL":
+            return Literal(None, "NULL")
+        if token.upper == "DATE" and self.peek() and self.peek().kind == "string":
+            text = self.advance().value[1:-1]
+            return Literal(_to_date(text), self.sql_since(start))
+        if token.upper in ("SYSDATE", "CURRENT_DATE"):
+            return Function("SYSDATE", [], token.value)
+        if token.kind != "ident":
+            raise MappingParseError(f"Unexpected token {token.value}")
+        if self.at("("):
+            self.advance()
+            args = []
+            if not self.at(")"):
+                args.append(self.parse_or())
+                while self.at(","):
+                    self.advance()
+                    args.append(self.parse_or())
+            self.expect(")")
+            return Function(token.value, args, self.sql_since(start))
+        if self.at(".") and self.peek(1) and self.peek(1).kind == "ident":
+            self.advance()
+            name = self.advance().value
+            return Column(name, token.value)
+        return Column(token.value)
+
+    def parse_case(self, start: int) -> Case:
+        operand = None if self.at("WHEN") else self.parse_additive()
+        branches = []
+        while self.at("WHEN"):
+            self.advance()
+            condition = self.parse_or()
+            self.expect("THEN")
+            branches.append((condition, self.parse_or()))
+        default = None
+        if self.at("ELSE"):
+            self.advance()
+            default = self.parse_or()
+        self.expect("END")
+        if not branches:
+            raise MappingParseError("CASE without WHEN")
+        return Case(operand, branches, default, self.sql_since(start))
+
+
+def parse_expression(tokens: List[Token]) -> Expr:
+    return _Parser(tokens).parse()
+
+
+# --------------------------------------------------------------------------
+# Mapping documents
+# --------------------------------------------------------------------------
+
+
+class SelectItem:
+    """One output column of a CTE or of the final SELECT"""
+
+    def __init__(self, alias: str, expr: Expr, stage: str, stage_index: int):
+        self.alias = alias.upper()
+        self.expr = expr
+        self.stage = stage
+        self.stage_index = stage_index
+        self.evaluate = expr.compile()
+
+    @property
+    def is_passthrough(self) -> bool:
+        return isinstance(self.expr, Column)
+
+
+class MappingSpec:
+    """Parsed mapping section: CTE stages, their columns and source tables"""
+
+    def __init__(self, name: str, source_file: str):
+        self.name = name
+        self.source_file = source_file
+        self.stages: List[str] = []
+        self.tables: Dict[str, str] = {}  # alias -> table of the first stage
+        self.main_alias: Optional[str] = None
+        self.items: List[SelectItem] = []
+        self.outputs: List[str] = []  # final SELECT column names
+        self.errors: List[str] = []
+        self._definitions: Dict[str, List[SelectItem]] = {}
+        self.input_names: Dict[str, List[str]] = {}
+
+    def add_item(self, item: SelectItem):
+        if item.stage_index == 0 and item.is_passthrough:
+            # source_data renames (pos.B500 as RISK_APPROACH) are inputs that may
+            # arrive under either name; joined-table columns only by alias
+            source = item.expr
+            names = [item.alias]
+            if source.name != item.alias and source.qualifier in (
+                None,
+                self.main_alias,
+            ):
+                names.append(source.name)
+                self.input_names.setdefault(source.name, [source.name]).append(
+                    item.alias
+                )
+            self.input_names[item.alias] = names
+        elif not (item.is_passthrough and item.expr.name == item.alias):
+            self._definitions.setdefault(item.alias, []).append(item)
+        self.items.append(item)
+
+    def definition(self, name: str, scope: int) -> Optional[SelectItem]:
+        """Latest definition of a column visible from the given stage"""
+        found = None
+        for item in self._definitions.get(name, ()):
+            if item.stage_index < scope:
+                found = item
+        return found
+
+    def resolve_field(self, field: str) -> Optional[str]:
+        """Map a reporting field to the column that computes it
+
+        Fields without a final SELECT (e.g. a truncated section) resolve to the
+        last column named <field>_* such as B017 -> B017_CCF_CALCULATED.
+        """
+        field = field.upper()
+        if field in self._definitions or field in self.input_names:
+            return field
+        prefixed = [i.alias for i in self.items if i.alias.startswith(f"{field}_")]
+        return prefixed[-1] if prefixed else None
+
+    @property
+    def computed_columns(self) -> List[str]:
+        return list(self._definitions)
+
+    @property
+    def final_scope(self) -> int:
+        return len(self.stages) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "source_file": self.source_file,
+            "stages": self.stages,
+            "computed_columns": len(self._definitions),
+            "inputs": sorted(self.input_names),
+            "outputs": self.outputs,
+            "errors": self.errors,
+        }
+
+
+def _split_top_level(tokens: List[Token], separator: str = ",") -> List[List[Token]]:
+    parts, current, depth = [], [], 0
+    for token in tokens:
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        if depth == 0 and token.value == separator:
+            parts.append(current)
+            current = []
+        else:
+            current.append(token)
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _find_top_level(tokens: List[Token], keywords: Iterable[str], start: int = 0):
+    keywords = set(keywords)
+    depth = 0
+    for index in range(start, len(tokens)):
+        token = tokens[index]
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        elif depth == 0 and token.upper in keywords:
+            return index
+    return len(tokens)
+
+
+def _parse_tables(tokens: List[Token]) -> Tuple[Dict[str, str], Optional[str]]:
+    """alias -> table from a FROM clause; also returns the FROM (main) alias"""
+    tables, main_alias = {}, None
+    for index, token in enumerate(tokens):
+        if token.upper not in ("FROM", "JOIN"):
+            continue
+        cursor = index + 1
+        parts = []
+        while cursor < len(tokens) and tokens[cursor].kind == "ident":
+            parts.append(tokens[cursor].value)
+            if cursor + 1 < len(tokens) and tokens[cursor + 1].value == ".":
+                cursor += 2
+            else:
+                cursor += 1
+                break
+        if not parts:
+            continue
+        table = ".".join(parts)
+        alias = table
+        if cursor < len(tokens) and tokens[cursor].upper == "AS":
+            cursor += 1
+        if (
+            cursor < len(tokens)
+            and tokens[cursor].kind == "ident"
+            and tokens[cursor].upper not in ("ON", "LEFT", "JOIN", "WHERE", "INNER")
+        ):
+            alias = tokens[cursor].value
+        tables[alias] = table
+        if token.upper == "FROM" and main_alias is None:
+            main_alias = alias
+    return tables, main_alias
+
+
+def _parse_select(spec: MappingSpec, tokens: List[Token], stage: str, index: int):
+    """Parse 'SELECT items FROM ...' tokens into the spec"""
+    if not tokens or tokens[0].upper != "SELECT":
+        spec.errors.append(f"{stage}: no SELECT")
+        return
+    body_start = 2 if len(tokens) > 1 and tokens[1].upper == "DISTINCT" else 1
+    from_index = _find_top_level(tokens, {"FROM"}, body_start)
+    if index == 0:
+        spec.tables, spec.main_alias = _parse_tables(tokens[from_index:])
+
+    for item_tokens in _split_top_level(tokens[body_start:from_index]):
+        if len(item_tokens) == 1 and item_tokens[0].value == "*":
+            continue
+        alias = None
+        if (
+            len(item_tokens) > 2
+            and item_tokens[-2].upper == "AS"
+            and item_tokens[-1].kind == "ident"
+        ):
+            alias = item_tokens[-1].value
+            item_tokens = item_tokens[:-2]
+        try:
+            expr = parse_expression(item_tokens)
+            if alias is None:
+                if not isinstance(expr, Column):
+                    raise MappingParseError("expression without alias")
+                alias = expr.name
+            spec.add_item(SelectItem(alias, expr, stage, index))
+            if stage == "final":
+                spec.outputs.append(alias.upper())
+        except MappingParseError as e:
+            spec.errors.append(f"{stage}: {tokens_to_sql(item_tokens)[:80]} ({e})")
+
+
+def parse_mapping_sql(name: str, text: str, source_file: str = "") -> MappingSpec:
+    """Parse one WITH ... SELECT mapping into a MappingSpec"""
+    spec = MappingSpec(name, source_file)
+    tokens = tokenize(text)
+    cursor = next((i for i, t in enumerate(tokens) if t.upper == "WITH"), None)
+    if cursor is None:
+        select = next((i for i, t in enumerate(tokens) if t.upper == "SELECT"), None)
+        if select is not None:
+            spec.stages.append("select")
+            _parse_select(spec, tokens[select:], "select", 0)
+        return spec
+
+    cursor += 1
+    while cursor + 2 < len(tokens):
+        stage, as_token, open_paren = tokens[cursor : cursor + 3]
+        if as_token.upper != "AS" or open_paren.value != "(":
+            break
+        depth, end = 0, len(tokens)
+        for index in range(cursor + 2, len(tokens)):
+            depth += {"(": 1, ")": -1}.get(tokens[index].value, 0)
+            if depth == 0:
+                end = index
+                break
+        spec.stages.append(stage.value)
+        _parse_select(
+            spec, tokens[cursor + 3 : end], stage.value, len(spec.stages) - 1
+        )
+        cursor = end + 1
+        if cursor < len(tokens) and tokens[cursor].value == ",":
+            cursor += 1
+        else:
+            break
+
+    if cursor < len(tokens) and tokens[cursor].upper == "SELECT":
+        final = [t for t in tokens[cursor:] if t.value != ";"]
+        _parse_select(spec, final, "final", len(spec.stages))
+    return spec
+
+
+def split_mapping_sections(text: str, default_name: str) -> List[Tuple[str, str]]:
+    """Split a document on 'Mapping <NAME>:' headers"""
+    matches = list(_SECTION_RE.finditer(text))
+    if not matches:
+        return [(default_name, text)]
+    sections = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        sections.append((match.group(1).upper(), text[match.end() : end]))
+    return sections
+
+
+# --------------------------------------------------------------------------
+# Evaluation
+# --------------------------------------------------------------------------
+
+
+def normalize_position(position: Dict[str, Any]) -> Dict[str, Any]:
+    """Upper-case keys, strip quotes and map NULL-like values to None"""
+    normalized = {}
+    for key, value in position.items():
+        if isinstance(value, str):
+            value = value.strip().strip("'\"")
+            if value.upper() in NULL_VALUES:
+                value = None
+        elif _is_null(value):
+            value = None
+        normalized[str(key).strip().upper()] = value
+    return normalized
+
+
+class _Evaluation:
+    """Lazy per-position evaluation; only columns the target needs are computed"""
+
+    def __init__(self, spec: MappingSpec, position: Dict[str, Any]):
+        self.spec = spec
+        self.position = position
+        self.memo: Dict[int, Any] = {}
+        self.inputs: Dict[str, Any] = {}
+        self.missing: List[str] = []
+        self.trace: List[Dict[str, Any]] = []
+        self._branches: Optional[List[str]] = None
+
+    def record(self, text: str):
+        if self._branches is not None:
+            self._branches.append(text)
+
+    def lookup(self, name: str, scope: int) -> Any:
+        item = self.spec.definition(name, scope)
+        if item is None:
+            return self.input(name)
+        key = id(item)
+        if key in self.memo:
+            return self.memo[key]
+        outer, self._branches = self._branches, []
+        try:
+            value = item.evaluate(self, item.stage_index)
+        finally:
+            branches, self._branches = self._branches, outer
+        if branches:
+            self.trace.append(
+                {
+                    "column": item.alias,
+                    "stage": item.stage,
+                    "value": value,
+                    "branches": branches,
+                }
+            )
+        self.memo[key] = value
+        return value
+
+    def input(self, name: str) -> Any:
+        for candidate in self.spec.input_names.get(name, (name,)):
+            if candidate in self.position:
+                value = self.position[candidate]
+                self.inputs[candidate] = value
+                return value
+        if name not in self.missing:
+            self.missing.append(name)
+        return None
+
+
+def _round_value(value: Any) -> Any:
+    if isinstance(value, float):
+        return round(value, 6)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def values_match(expected: Any, reported: Any) -> Optional[bool]:
+    """Compare an engine result with a reported value ('20%' == 0.2)"""
+    if isinstance(reported, str) and reported.strip().endswith("%"):
+        number = _to_number(reported.strip().rstrip("%"))
+        reported = None if number is None else number / 100
+    if _is_null(expected) and _is_null(reported):
+        return True
+    return sql_equals(expected, reported)
+
+
+class MappingRuleEngine:
+    """Registry of compiled mappings loaded from the mapping document folders"""
+
+    def __init__(self, directories: Iterable[str] = (), default_regime: str = "CRR3"):
+        self.directories = [d for d in directories if d]
+        self.default_regime = default_regime.upper()
+        self.mappings: Dict[str, MappingSpec] = {}
+        self.loaded_at: Optional[str] = None
+
+    def reload(self) -> Dict[str, Any]:
+        """(Re)parse every mapping document; later files override earlier names"""
+        mappings = {}
+        for directory in self.directories:
+            path = Path(directory)
+            if not path.is_dir():
+                continue
+            for file in sorted(path.iterdir()):
+                if file.suffix.lower() not in MAPPING_FILE_TYPES:
+                    continue
+                try:
+                    text = file.read_text(encoding="utf-8", errors="replace")
+                except OSError as e:
+                    logger.warning(f"Could not read mapping file {file}: {e}")
+                    continue
+                for name, section in split_mapping_sections(text, file.stem.upper()):
+                    spec = parse_mapping_sql(name, section, str(file))
+                    if spec.items:
+                        mappings[name] = spec
+        self.mappings = mappings
+        self.loaded_at = datetime.now().isoformat()
+        logger.info(f"📐 Loaded {len(mappings)} mapping rule sets: {list(mappings)}")
+        return self.summary()
+
+    def add_mapping(self, spec: MappingSpec):
+        self.mappings[spec.name] = spec
+
+    def select_mapping(
+        self, position: Dict[str, Any], regime: Optional[str] = None
+    ) -> Optional[MappingSpec]:
+        if regime:
+            return self.mappings.get(regime.upper())
+        flag = position.get("CRR3_APPLICABLE_FLAG")
+        if flag is not None:
+            preferred = "CRR3" if str(flag).upper() == "Y" else "CRR2"
+            if preferred in self.mappings:
+                return self.mappings[preferred]
+        if self.default_regime in self.mappings:
+            return self.mappings[self.default_regime]
+        return next(iter(self.mappings.values()), None)
+
+    def evaluate(
+        self,
+        position: Dict[str, Any],
+        field: str = "B017",
+        regime: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Expected value of a field for one position with the rule trace"""
+        position = normalize_position(position)
+        spec = self.select_mapping(position, regime)
+        if spec is None:
+            raise KeyError(f"No mapping rules loaded for regime {regime or 'default'}")
+        column = spec.resolve_field(field)
+        if column is None:
+            raise KeyError(f"Field {field} is not defined in mapping {spec.name}")
+
+        evaluation = _Evaluation(spec, position)
+        value = _round_value(evaluation.lookup(column, spec.final_scope))
+        # Only computed fields can be checked against a reported value, and
+        # only when every input is known: with missing inputs (taken as NULL)
+        # the expected value is conditional, so it is no finding either way
+        reported, matches = None, None
+        if field.upper() in position and column in spec.computed_columns:
+            reported = position[field.upper()]
+            if not evaluation.missing:
+                matches = values_match(value, reported)
+        return {
+            "regime": spec.name,
+            "field": field.upper(),
+            "column": column,
+            "expected": value,
+            "reported": reported,
+            "matches": matches,
+            "deterministic": not evaluation.missing,
+            "missing_inputs": evaluation.missing,
+            "inputs_used": evaluation.inputs,
+            "rule": self._rule_text(evaluation.trace, column),
+            "trace": [
+                {**step, "value": _round_value(step["value"])}
+                for step in evaluation.trace
+            ],
+        }
+
+    @staticmethod
+    def _rule_text(trace: List[Dict[str, Any]], column: str) -> str:
+        step = next((t for t in reversed(trace) if t["column"] == column), None)
+        if step is None and trace:
+            step = trace[-1]
+        if step is None:
+            return "direct mapping"
+        return f"{step['stage']}.{step['column']}: " + " → ".join(step["branches"])
+
+    def check_position(
+        self,
+        position: Dict[str, Any],
+        fields: Optional[Iterable[str]] = None,
+        regime: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Evaluate computed fields for one position
+
+        Without explicit fields, every computed field the position reports a
+        value for is checked. Returns None when there is nothing to evaluate.
+        """
+        if not self.mappings or not position:
+            return None
+        spec = self.select_mapping(normalize_position(position), regime)
+        if spec is None:
+            return None
+        if fields is None:
+            fields = [str(key).strip() for key in position]
+        targets = [
+            field.upper()
+            for field in dict.fromkeys(fields)
+            if spec.resolve_field(field) in spec.computed_columns
+        ]
+        if not targets:
+            return None
+
+        results = [self.evaluate(position, field, spec.name) for field in targets]
+        return {
+            "regime": spec.name,
+            "position": position,
+            "results": results,
+            "deterministic": all(r["deterministic"] for r in results),
+            "discrepancy": any(r["matches"] is False for r in results),
+        }
+
+    def check_query(
+        self, query: str, regime: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Evaluate the computed fields a free-text question mentions"""
+        position = parse_position_text(query)
+        mentioned = [w.upper() for w in re.findall(r"\w+", query)]
+        return self.check_position(position, mentioned, regime)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "directories": self.directories,
+            "default_regime": self.default_regime,
+            "loaded_at": self.loaded_at,
+            "mappings": [spec.summary() for spec in self.mappings.values()],
+        }
+
+
+def parse_position_text(text: str) -> Dict[str, str]:
+    """'B500 = 0 ; B603 = T ; B017 = 0.4' -> {'B500': '0', 'B603': 'T', ...}"""
+    position = {}
+    for name, code, value in _POSITION_FIELD_RE.findall(text):
+        name = name or code
+        if not value.startswith(("'", '"')):
+            value = value.rstrip("?!.:")
+        position[name.upper()] = value
+    return position
+
+
+def format_rule_check(check: Dict[str, Any]) -> str:
+    """Compact German summary of a rule check for prompts and answers"""
+    lines = [f"[DETERMINISTISCHE REGELPRÜFUNG - Mapping {check['regime']}]"]
+    for result in check["results"]:
+        if result["matches"] is True:
+            status = "✅ stimmt mit Mapping-Regel überein"
+        elif result["matches"] is False:
+            status = f"❌ Abweichung (gemeldet: {result['reported']})"
+        elif result["missing_inputs"]:
+            status = "ℹ️ nur erwartet, falls die fehlenden Eingabefelder NULL sind"
+            if result["reported"] is not None:
+                status += f" (gemeldet: {result['reported']}, nicht prüfbar)"
+        else:
+            status = "ℹ️ erwarteter Wert"
+        lines.append(f"{result['field']} = {result['expected']} - {status}")
+        lines.append(f"Regel: {result['rule']}")
+        for step in result["trace"]:
+            if step["column"] != result["column"]:
+                branches = " → ".join(step["branches"])
+                lines.append(f"  {step['column']} = {step['value']} ({branches})")
+        if result["missing_inputs"]:
+            lines.append(
+                "Fehlende Eingabefelder (als NULL gewertet): "
+                + ", ".join(result["missing_inputs"])
+            )
+    return "\n".join(lines)
@@ -0,0 +1,671 @@
+"""
+Vectorized bulk validation of position extracts against the mapping rules
+The expression trees from utils.mapping_rules are evaluated column-wise with
+pandas over fixed-size chunks, so memory stays bounded for large extracts and
+only mismatching rows (with the rule that produced the expected value) are kept
+"""
+
+import csv
+import logging
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.mapping_rules import (
+    NULL_VALUES,
+    SQL_FUNCTIONS,
+    BinaryOp,
+    Between,
+    BoolOp,
+    Case,
+    Column,
+    Comparison,
+    Expr,
+    Function,
+    InList,
+    IsNull,
+    Literal,
+    MappingParseError,
+    MappingRuleEngine,
+    MappingSpec,
+    Negate,
+    Not,
+    Subquery,
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+KEY_COLUMNS = ["POSITION_ID", "CONTRACT_ID", "CUSTOMER_ID"]
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def process_peak_memory_mb() -> Optional[float]:
+    """High-water mark of this process's resident set size since it started,
+    not of a single validation run (None where unsupported)"""
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _sniff_separator(path: Path) -> str:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        sample = f.read(65536)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+    except csv.Error:
+        return ","
+
+
+def iter_position_chunks(
+    path: str, chunk_size: int, columns: Optional[Iterable[str]] = None
+) -> Iterator[pd.DataFrame]:
+    """Read a CSV/Parquet/XLSX extract as string columns in chunks
+
+    When ``columns`` is given, other columns are skipped while parsing. XLSX
+    sheets are read row by row in openpyxl's read-only mode.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    wanted = {c.upper() for c in columns} if columns else None
+    usecols = (lambda c: str(c).strip().upper() in wanted) if wanted else None
+    if suffix in (".csv", ".txt"):
+        yield from pd.read_csv(
+            path,
+            dtype=str,
+            sep=_sniff_separator(path),
+            chunksize=chunk_size,
+            keep_default_na=False,
+            usecols=usecols,
+        )
+    elif suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        names = [n for n in parquet.schema_arrow.names if not wanted or usecols(n)]
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=names):
+            yield batch.to_pandas().astype(object).where(lambda f: f.notna(), "")
+    elif suffix == ".xlsx":
+        yield from _iter_xlsx_chunks(path, chunk_size, usecols)
+    else:
+        raise ValueError(f"Unsupported extract format: {suffix}")
+
+
+def _iter_xlsx_chunks(
+    path: Path, chunk_size: int, usecols: Optional[Callable[[str], bool]]
+) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        names = ["" if name is None else str(name) for name in header]
+        keep = [i for i, name in enumerate(names) if usecols is None or usecols(name)]
+        columns = [names[i] for i in keep]
+        chunk: List[List[str]] = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            chunk.append(
+                ["" if i >= len(row) or row[i] is None else str(row[i]) for i in keep]
+            )
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk, columns=columns, dtype=object)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns, dtype=object)
+    finally:
+        workbook.close()
+
+
+_NULL_SPELLINGS = {v for n in NULL_VALUES for v in (n, n.lower(), n.capitalize())}
+
+
+def normalize_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """Upper-case column names, trim values and turn NULL-like values into NA"""
+    frame = frame.copy()
+    frame.columns = [str(c).strip().upper() for c in frame.columns]
+    for column in frame.columns:
+        values = frame[column].astype(object).str.strip()
+        frame[column] = values.mask(values.isin(_NULL_SPELLINGS))
+    return frame
+
+
+def required_columns(engine: MappingRuleEngine, fields: Optional[List[str]] = None):
+    """Upper-case extract columns the loaded mappings can use"""
+    needed = set(KEY_COLUMNS) | {"CRR3_APPLICABLE_FLAG"}
+    for spec in engine.mappings.values():
+        for names in spec.input_names.values():
+            needed.update(names)
+        needed.update(fields or spec.computed_columns)
+        needed.update(spec.outputs)
+    return needed
+
+
+# --------------------------------------------------------------------------
+# Column-wise evaluation of the expression tree
+# --------------------------------------------------------------------------
+
+
+def _is_numeric(value: Any) -> bool:
+    if isinstance(value, pd.Series):
+        return pd.api.types.is_numeric_dtype(value.dtype)
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_date(value: Any) -> bool:
+    if isinstance(value, pd.Series):
+        return pd.api.types.is_datetime64_any_dtype(value.dtype)
+    return isinstance(value, pd.Timestamp)
+
+
+def _num(value: Any) -> Any:
+    if isinstance(value, pd.Series):
+        if pd.api.types.is_numeric_dtype(value.dtype):
+            return value.astype(float)
+        return pd.to_numeric(value, errors="coerce")
+    if value is None or value is pd.NA:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _date(value: Any) -> Any:
+    if isinstance(value, pd.Series):
+        if _is_date(value):
+            return value
+        return pd.to_datetime(value, errors="coerce")
+    return pd.to_datetime(value, errors="coerce")
+
+
+def _isna(value: Any, index: pd.Index) -> pd.Series:
+    if isinstance(value, pd.Series):
+        return value.isna()
+    return pd.Series(bool(pd.isna(value)), index=index)
+
+
+def _boolean(values: Any, null_mask: pd.Series, index: pd.Index) -> pd.Series:
+    """Nullable boolean Series (Kleene logic for AND/OR/NOT)"""
+    if not isinstance(values, pd.Series):
+        values = pd.Series(values, index=index)
+    result = values.fillna(False).astype(bool).astype("boolean")
+    result[null_mask.to_numpy()] = pd.NA
+    return result
+
+
+class VectorEvaluation:
+    """Evaluates one mapping over a chunk; computed columns are memoized"""
+
+    def __init__(self, spec: MappingSpec, frame: pd.DataFrame):
+        self.spec = spec
+        self.frame = frame
+        self.index = frame.index
+        self.memo: Dict[int, Any] = {}
+        self.labels: Dict[str, pd.Series] = {}
+        self.case_labels: Dict[int, pd.Series] = {}
+        self.missing: List[str] = []
+
+    def series(self, value: Any) -> pd.Series:
+        if isinstance(value, pd.Series):
+            return value
+        return pd.Series([value] * len(self.index), index=self.index, dtype=object)
+
+    def lookup(self, name: str, scope: int) -> Any:
+        item = self.spec.definition(name, scope)
+        if item is None:
+            return self.input(name)
+        key = id(item)
+        if key not in self.memo:
+            value = self.evaluate(item.expr, item.stage_index)
+            if isinstance(item.expr, Case):
+                self.labels[item.alias] = self.case_labels[id(item.expr)]
+            self.memo[key] = value
+        return self.memo[key]
+
+    def input(self, name: str) -> Any:
+        for candidate in self.spec.input_names.get(name, (name,)):
+            if candidate in self.frame.columns:
+                return self.frame[candidate]
+        if name not in self.missing:
+            self.missing.append(name)
+        return self.series(None)
+
+    def evaluate(self, node: Expr, scope: int) -> Any:
+        if isinstance(node, Literal):
+            if hasattr(node.value, "isoformat"):
+                return pd.Timestamp(node.value)
+            return node.value
+        if isinstance(node, Column):
+            return self.lookup(node.name, scope)
+        if isinstance(node, Case):
+            return self._case(node, scope)
+        if isinstance(node, Comparison):
+            return self._compare(
+                node.op,
+                self.evaluate(node.left, scope),
+                self.evaluate(node.right, scope),
+            )
+        if isinstance(node, InList):
+            return self._in_list(node, scope)
+        if isinstance(node, IsNull):
+            null = _isna(self.evaluate(node.operand, scope), self.index)
+            return (~null if node.negated else null).astype("boolean")
+        if isinstance(node, Between):
+            value = self.evaluate(node.operand, scope)
+            result = self._compare(
+                ">=", value, self.evaluate(node.low, scope)
+            ) & self._compare("<=", value, self.evaluate(node.high, scope))
+            return ~result if node.negated else result
+        if isinstance(node, BoolOp):
+            operands = [self.evaluate(o, scope) for o in node.operands]
+            result = operands[0]
+            for operand in operands[1:]:
+                result = result & operand if node.op == "AND" else result | operand
+            return result
+        if isinstance(node, Not):
+            return ~self.evaluate(node.operand, scope)
+        if isinstance(node, BinaryOp):
+            return self._arith(
+                node.op,
+                self.evaluate(node.left, scope),
+                self.evaluate(node.right, scope),
+            )
+        if isinstance(node, Negate):
+            return -_num(self.evaluate(node.operand, scope))
+        if isinstance(node, Function):
+            return self._function(node, scope)
+        if isinstance(node, Subquery):
+            return self.series(None)
+        raise MappingParseError(f"Cannot vectorize {type(node).__name__}")
+
+    def _compare(self, op: str, a: Any, b: Any) -> pd.Series:
+        null = _isna(a, self.index) | _isna(b, self.index)
+        if _is_numeric(a) or _is_numeric(b):
+            a, b = _num(a), _num(b)
+            null = null | _isna(a, self.index) | _isna(b, self.index)
+        elif _is_date(a) or _is_date(b):
+            a, b = _date(a), _date(b)
+            null = null | _isna(a, self.index) | _isna(b, self.index)
+        elif op not in ("=", "!="):
+            a = self.series(a).astype(str)
+            b = b.astype(str) if isinstance(b, pd.Series) else str(b)
+        if op == "=":
+            values = a == b
+        elif op == "!=":
+            values = a != b
+        elif op == "<":
+            values = a < b
+        elif op == "<=":
+            values = a <= b
+        elif op == ">":
+            values = a > b
+        else:
+            values = a >= b
+        return _boolean(values, null, self.index)
+
+    def _in_list(self, node: InList, scope: int) -> pd.Series:
+        value = self.evaluate(node.operand, scope)
+        items = [self.evaluate(i, scope) for i in node.items]
+        null = _isna(value, self.index)
+        if all(not isinstance(i, pd.Series) for i in items):
+            if any(_is_numeric(i) for i in items):
+                value = _num(value)
+                null = null | _isna(value, self.index)
+                values = self.series(value).isin([_num(i) for i in items])
+            else:
+                values = self.series(value).isin([str(i) for i in items])
+        else:
+            values = pd.Series(False, index=self.index)
+            for item in items:
+                values = values | self._compare("=", value, item).fillna(False)
+        result = _boolean(values, null, self.index)
+        return ~result if node.negated else result
+
+    def _arith(self, op: str, a: Any, b: Any) -> Any:
+        if op == "||":
+            return self.series(a).astype(str) + self.series(b).astype(str)
+        a, b = _num(a), _num(b)
+        if op == "+":
+            return a + b
+        if op == "-":
+            return a - b
+        if op == "*":
+            return a * b
+        result = a / b
+        if isinstance(result, pd.Series):
+            return result.replace([np.inf, -np.inf], np.nan)
+        return result if np.isfinite(result) else np.nan
+
+    def _function(self, node: Function, scope: int) -> Any:
+        args = [self.evaluate(a, scope) for a in node.args]
+        name = node.name
+        if name == "MONTHS_BETWEEN":
+            later, earlier = (self.series(_date(a)) for a in args)
+            return (
+                (later.dt.year - earlier.dt.year) * 12
+                + (later.dt.month - earlier.dt.month)
+                + (later.dt.day - earlier.dt.day) / 31
+            )
+        if name in ("NVL", "COALESCE"):
+            result = self.series(args[0])
+            for arg in args[1:]:
+                result = result.where(result.notna(), self.series(arg))
+            return result
+        if name == "UPPER":
+            return self.series(args[0]).str.upper()
+        if name == "TRIM":
+            return self.series(args[0]).str.strip()
+        if name == "ABS":
+            return _num(args[0]).abs()
+        if name == "ROUND":
+            return _num(args[0]).round(int(args[1]) if len(args) > 1 else 0)
+        if name == "SYSDATE":
+            return pd.Timestamp.today().normalize()
+        if name in SQL_FUNCTIONS:
+            func = SQL_FUNCTIONS[name]
+            frame = pd.concat([self.series(a) for a in args], axis=1)
+            return frame.apply(lambda row: func(*row), axis=1)
+        raise MappingParseError(f"Unsupported SQL function {name}")
+
+    def _case(self, node: Case, scope: int) -> pd.Series:
+        size = len(self.index)
+        values = np.full(size, None, dtype=object)
+        labels = np.full(size, "ELSE NULL", dtype=object)
+        remaining = np.ones(size, dtype=bool)
+        operand = self.evaluate(node.operand, scope) if node.operand else None
+
+        branches = [(c, r, Case.describe(c, r)) for c, r in node.branches]
+        if node.default is not None:
+            branches.append((None, node.default, Case.describe(None, node.default)))
+
+        for condition, result, text in branches:
+            if not remaining.any():
+                break
+            if condition is None:
+                hit = remaining
+            else:
+                matched = self.evaluate(condition, scope)
+                if operand is not None:
+                    matched = self._compare("=", operand, matched)
+                hit = remaining & matched.fillna(False).to_numpy(dtype=bool)
+            if not hit.any():
+                continue
+            branch_values = self.evaluate(result, scope)
+            if isinstance(branch_values, pd.Series):
+                values[hit] = branch_values.to_numpy(dtype=object)[hit]
+            else:
+                values[hit] = branch_values
+            if isinstance(result, Case):
+                labels[hit] = f"{text} → " + self.case_labels[id(result)][hit]
+            else:
+                labels[hit] = text
+            remaining &= ~hit
+
+        self.case_labels[id(node)] = labels
+        values = pd.Series(values, index=self.index)
+        numeric = pd.to_numeric(values, errors="coerce")
+        if numeric.isna().sum() == values.isna().sum():
+            return numeric
+        return values
+
+
+def dependency_columns(spec: MappingSpec, column: str) -> List[str]:
+    """Computed columns a column depends on (transitively, evaluation order)"""
+    ordered: List[str] = []
+
+    def visit(name: str, scope: int):
+        item = spec.definition(name, scope)
+        if item is None or item.alias in ordered:
+            return
+        for ref in item.expr.columns():
+            visit(ref.name, item.stage_index)
+        ordered.append(item.alias)
+
+    visit(column, spec.final_scope)
+    return ordered[:-1]
+
+
+def input_columns(spec: MappingSpec, column: str) -> List[str]:
+    """Extract columns a computed column reads (transitively)"""
+    inputs: List[str] = []
+    seen = set()
+
+    def visit(name: str, scope: int):
+        item = spec.definition(name, scope)
+        if item is None:
+            if name not in inputs:
+                inputs.append(name)
+            return
+        if id(item) in seen:
+            return
+        seen.add(id(item))
+        for ref in item.expr.columns():
+            visit(ref.name, item.stage_index)
+
+    visit(column, spec.final_scope)
+    return inputs
+
+
+# --------------------------------------------------------------------------
+# Validation pipeline
+# --------------------------------------------------------------------------
+
+
+def _reported_matches(expected: pd.Series, reported: pd.Series) -> np.ndarray:
+    both_null = expected.isna().to_numpy() & reported.isna().to_numpy()
+    if pd.api.types.is_numeric_dtype(expected.dtype):
+        text = reported.astype("string")
+        percent = text.str.endswith("%").fillna(False).to_numpy(dtype=bool)
+        number = pd.to_numeric(text.str.rstrip("%").str.replace(",", "."), "coerce")
+        number = number.to_numpy(dtype=float)
+        number[percent] = number[percent] / 100
+        equal = np.isclose(expected.to_numpy(dtype=float), number, atol=1e-9)
+    else:
+        equal = (
+            expected.astype(str).to_numpy() == reported.astype(str).to_numpy()
+        ) & reported.notna().to_numpy()
+    return equal | both_null
+
+
+def validate_frame(
+    engine: MappingRuleEngine,
+    frame: pd.DataFrame,
+    fields: Optional[Iterable[str]] = None,
+    regime: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Validate a normalized chunk; returns mismatch rows and missing inputs
+
+    Where a field reads an input the chunk lacks, the vector result takes it as
+    NULL for every row. Its failing rows are re-checked with the scalar engine,
+    which only counts a row when its rule path does not touch the absent input;
+    the others are reported per field as unverifiable.
+    """
+    groups = []
+    if regime:
+        groups.append((engine.select_mapping({}, regime), frame))
+    elif "CRR3_APPLICABLE_FLAG" in frame.columns and {
+        "CRR3",
+        "CRR2",
+    } <= set(engine.mappings):
+        crr3 = frame["CRR3_APPLICABLE_FLAG"].fillna("").str.upper().eq("Y")
+        groups += [
+            (engine.mappings["CRR3"], frame[crr3]),
+            (engine.mappings["CRR2"], frame[~crr3]),
+        ]
+    else:
+        groups.append((engine.select_mapping({}), frame))
+
+    mismatches, missing = [], {}
+    unverifiable: Counter = Counter()
+    for spec, subset in groups:
+        if spec is None or subset.empty:
+            continue
+        evaluation = VectorEvaluation(spec, subset)
+        candidates = fields if fields is not None else subset.columns
+        targets = [
+            f.upper()
+            for f in candidates
+            if spec.resolve_field(f) in spec.computed_columns
+            and f.upper() in subset.columns
+        ]
+        for field in targets:
+            column = spec.resolve_field(field)
+            expected = evaluation.series(
+                evaluation.lookup(column, spec.final_scope)
+            )
+            # Follow renames (B017_CCF_FINAL as B017) to the rule that decides
+            item = spec.definition(column, spec.final_scope)
+            while isinstance(item.expr, Column):
+                source = spec.definition(item.expr.name, item.stage_index)
+                if source is None:
+                    break
+                item = source
+            reported = subset[field]
+            failed = ~_reported_matches(expected, reported)
+            if not failed.any():
+                continue
+            if set(input_columns(spec, column)) & set(evaluation.missing):
+                rows = subset.loc[failed].to_dict("records")
+                verdicts = [
+                    engine.evaluate(row, field, spec.name)["matches"] for row in rows
+                ]
+                unverifiable[field] += sum(v is None for v in verdicts)
+                failed[np.flatnonzero(failed)] = [v is False for v in verdicts]
+                if not failed.any():
+                    continue
+            labels = evaluation.labels.get(item.alias)
+            rule = f"{item.stage}.{item.alias}: " + (
+                labels[failed] if labels is not None else item.expr.sql
+            )
+            result = pd.DataFrame(
+                {
+                    "row_number": subset.index[failed],
+                    "regime": spec.name,
+                    "field": field,
+                    "expected": expected[failed].to_numpy(),
+                    "reported": reported[failed].to_numpy(),
+                    "rule": rule,
+                }
+            )
+            trace_parts = []
+            for dep in dependency_columns(spec, column):
+                if dep in evaluation.labels:
+                    values = evaluation.series(evaluation.lookup(dep, spec.final_scope))
+                    trace_parts.append(
+                        f"{dep}=" + values.to_numpy(dtype=object)[failed].astype(str)
+                    )
+            trace = trace_parts[0] if trace_parts else ""
+            for part in trace_parts[1:]:
+                trace = trace + "; " + part
+            result["trace"] = trace
+            for key in KEY_COLUMNS:
+                if key in subset.columns:
+                    result[key] = subset.loc[failed, key].to_numpy()
+            mismatches.append(result)
+        if evaluation.missing:
+            missing[spec.name] = evaluation.missing
+
+    frame_out = pd.concat(mismatches, ignore_index=True) if mismatches else None
+    return {
+        "mismatches": frame_out,
+        "missing_inputs": missing,
+        "unverifiable": dict(unverifiable),
+    }
+
+
+def validate_positions_file(
+    path: str,
+    engine: MappingRuleEngine,
+    fields: Optional[Iterable[str]] = None,
+    regime: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    output_path: Optional[str] = None,
+    sample_limit: int = 100,
+    collect_rows: int = 0,
+) -> Dict[str, Any]:
+    """Stream an extract through the rules and write mismatching rows to CSV
+
+    Only one chunk is held in memory at a time. Up to ``collect_rows`` original
+    mismatching rows are returned so they can be queued for LLM analysis.
+    """
+    fields = [f.strip().upper() for f in fields] if fields else None
+    started = time.perf_counter()
+    rows = chunks = mismatch_count = 0
+    per_rule: Counter = Counter()
+    per_field: Counter = Counter()
+    unverifiable: Counter = Counter()
+    missing: Dict[str, List[str]] = {}
+    samples: List[Dict[str, Any]] = []
+    collected: List[Dict[str, Any]] = []
+    header_written = False
+
+    columns = None if collect_rows else required_columns(engine, fields)
+    for chunk in iter_position_chunks(path, chunk_size, columns):
+        frame = normalize_frame(chunk)
+        frame.index = pd.RangeIndex(rows + 1, rows + 1 + len(frame))
+        rows += len(frame)
+        chunks += 1
+
+        outcome = validate_frame(engine, frame, fields, regime)
+        for name, absent in outcome["missing_inputs"].items():
+            known = missing.setdefault(name, [])
+            known += [c for c in absent if c not in known]
+        unverifiable.update(outcome["unverifiable"])
+        mismatches = outcome["mismatches"]
+        if mismatches is None:
+            continue
+
+        mismatch_count += len(mismatches)
+        per_field.update(mismatches["field"])
+        per_rule.update(mismatches["regime"] + " " + mismatches["rule"])
+        if output_path:
+            mismatches.to_csv(
+                output_path, mode="a", header=not header_written, index=False
+            )
+            header_written = True
+        if len(samples) < sample_limit:
+            samples += mismatches.head(sample_limit - len(samples)).to_dict("records")
+        if len(collected) < collect_rows:
+            row_numbers = mismatches["row_number"].drop_duplicates()
+            row_numbers = row_numbers.head(collect_rows - len(collected))
+            original = chunk.set_axis(frame.index).loc[row_numbers]
+            collected += original.fillna("").to_dict("records")
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "rows": rows,
+        "chunks": chunks,
+        "chunk_size": chunk_size,
+        "mismatches": mismatch_count,
+        "mismatch_rate": round(mismatch_count / rows, 6) if rows else 0.0,
+        "mismatches_by_field": dict(per_field),
+        "top_failing_rules": [
+            {"rule": rule, "count": count} for rule, count in per_rule.most_common(20)
+        ],
+        "missing_inputs": missing,
+        "unverifiable_by_field": dict(unverifiable),
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed, 1) if elapsed else 0.0,
+        "process_peak_memory_mb": process_peak_memory_mb(),
+        "result_file": output_path if header_written else None,
+        "sample": samples,
+        "mismatch_rows": collected,
+    }
+    logger.info(
+        f"📊 Validated {rows} positions in {elapsed:.1f}s "
+        f"({summary['rows_per_sec']} rows/s), {mismatch_count} mismatches"
+    )
+    return summary
@@ -0,0 +1,198 @@
+"""
+Latency-aware routing across installed Ollama models
+Tracks rolling per-model latency, tokens/sec and error rate and picks the best
+model that currently meets the latency target (used for model="auto")
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+AUTO_MODEL = "auto"
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Rough token count (~4 characters per token) for throughput statistics"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ModelStats:
+    """Rolling window of recent calls for one model"""
+
+    def __init__(self, window_size: int, window_seconds: float):
+        self.samples: deque = deque(maxlen=window_size)
+        self.window_seconds = window_seconds
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def record(self, latency: float, tokens: int, ok: bool, now: float):
+        self.samples.append((now, latency, tokens, ok))
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        recent = [s for s in self.samples if now - s[0] <= self.window_seconds]
+        ok = [s for s in recent if s[3]]
+        latencies = [s[1] for s in ok]
+        busy_time = sum(latencies)
+        return {
+            "samples": len(recent),
+            "p50_latency_s": round(_percentile(latencies, 0.50), 3),
+            "p95_latency_s": round(_percentile(latencies, 0.95), 3),
+            "tokens_per_sec": (
+                round(sum(s[2] for s in ok) / busy_time, 2) if busy_time else 0.0
+            ),
+            "error_rate": (
+                round(1 - len(ok) / len(recent), 4) if recent else 0.0
+            ),
+            "in_flight": self.in_flight,
+            "cooling_down": self.cooldown_until > now,
+        }
+
+
+class _CallTracker:
+    """Handle returned by ModelRouter.track to report a successful call"""
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.tokens = 0
+
+    def success(self, latency: float, tokens: int):
+        self.latency = latency
+        self.tokens = tokens
+
+
+class ModelRouter:
+    """Chooses a model from live statistics, falling back when models misbehave"""
+
+    def __init__(
+        self,
+        preference: Iterable[str],
+        fallback_model: str,
+        latency_target_s: float = 30.0,
+        max_in_flight: int = 2,
+        max_error_rate: float = 0.5,
+        min_samples: int = 5,
+        failure_threshold: int = 3,
+        cooldown_s: float = 60.0,
+        window_size: int = 200,
+        window_seconds: float = 900.0,
+    ):
+        self.preference = [m for m in preference if m]
+        self.fallback_model = fallback_model
+        self.latency_target_s = latency_target_s
+        self.max_in_flight = max_in_flight
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.window_size = window_size
+        self.window_seconds = window_seconds
+        self._models: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, model: str) -> ModelStats:
+        stats = self._models.get(model)
+        if stats is None:
+            stats = self._models[model] = ModelStats(
+                self.window_size, self.window_seconds
+            )
+        return stats
+
+    @contextmanager
+    def track(self, model: str):
+        """Count the call as in flight and record its outcome on exit"""
+        tracker = _CallTracker()
+        started = time.monotonic()
+        with self._lock:
+            self._stats(model).in_flight += 1
+        cancelled = False
+        try:
+            yield tracker
+        except asyncio.CancelledError:
+            # The client went away; that says nothing about the model
+            cancelled = True
+            raise
+        finally:
+            now = time.monotonic()
+            ok = tracker.latency is not None
+            latency = tracker.latency if ok else now - started
+            with self._lock:
+                stats = self._stats(model)
+                stats.in_flight -= 1
+                if ok or not cancelled:
+                    stats.record(latency, tracker.tokens, ok, now)
+                if ok:
+                    stats.consecutive_failures = 0
+                elif not cancelled:
+                    stats.consecutive_failures += 1
+                    if stats.consecutive_failures >= self.failure_threshold:
+                        stats.cooldown_until = now + self.cooldown_s
+
+    def choose(
+        self,
+        installed: Iterable[str],
+        latency_target_s: Optional[float] = None,
+        exclude: Iterable[str] = (),
+    ) -> Tuple[str, str]:
+        """Return (model, reason) for the next request"""
+        target = latency_target_s or self.latency_target_s
+        excluded = set(exclude)
+        installed = [m for m in installed if m not in excluded]
+        candidates = [m for m in self.preference if m in installed]
+        candidates += [m for m in installed if m not in candidates]
+        if not candidates:
+            return self.fallback_model, "no installed models known - using default"
+
+        now = time.monotonic()
+        with self._lock:
+            snapshots = {m: self._stats(m).snapshot(now) for m in candidates}
+
+        def healthy(model: str) -> bool:
+            snap = snapshots[model]
+            if snap["cooling_down"]:
+                return False
+            return (
+                snap["samples"] < self.min_samples
+                or snap["error_rate"] <= self.max_error_rate
+            )
+
+        usable = [m for m in candidates if healthy(m)]
+        if not usable:
+            return self.fallback_model, "all models unhealthy - using default"
+
+        available = [
+            m for m in usable if snapshots[m]["in_flight"] < self.max_in_flight
+        ]
+        if not available:
+            model = min(usable, key=lambda m: snapshots[m]["in_flight"])
+            return model, "all models busy - least loaded"
+
+        for model in available:
+            snap = snapshots[model]
+            if not snap["p50_latency_s"]:
+                return model, "no latency data yet - exploring preferred model"
+            if snap["p50_latency_s"] <= target:
+                return model, f"p50 {snap['p50_latency_s']}s within {target}s target"
+
+        model = min(available, key=lambda m: snapshots[m]["p50_latency_s"])
+        return model, "no model meets latency target - fastest available"
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            models = {m: s.snapshot(now) for m, s in self._models.items()}
+        return {
+            "latency_target_s": self.latency_target_s,
+            "preference": self.preference,
+            "models": models,
+        }
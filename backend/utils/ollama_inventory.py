@@ -0,0 +1,181 @@
+"""
+Cached inventory of the models installed in and loaded by Ollama
+Reads the HTTP API (/api/tags, /api/ps) instead of shelling out to `ollama list`.
+A background task keeps the snapshot fresh, so health probes and routing read
+it from memory and never wait on Ollama
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+def base_model_name(name: str) -> str:
+    """'llama3:8b-instruct' -> 'llama3'"""
+    return name.split(":")[0]
+
+
+class OllamaInventory:
+    """TTL-cached snapshot of installed and loaded Ollama models"""
+
+    def __init__(
+        self,
+        base_url: str,
+        ttl_seconds: float = 10.0,
+        timeout_seconds: float = 2.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.ttl_seconds = ttl_seconds
+        self.timeout_seconds = timeout_seconds
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._fetched_at = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._stale_refresh: Optional[asyncio.Task] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._stats = {"refreshes": 0, "failures": 0, "served_stale": 0}
+
+    def start(self):
+        """Start the background refresh loop (call from the event loop)"""
+        self._session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=self.timeout_seconds)
+        )
+        self._loop_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._stale_refresh:
+            self._stale_refresh.cancel()
+            self._stale_refresh = None
+        if self._loop_task:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Keep refreshing; the last snapshot stays in use meanwhile
+                self._stats["failures"] += 1
+                logger.warning(f"Ollama inventory refresh failed: {e!r}")
+            await asyncio.sleep(max(self.ttl_seconds / 2, 0.5))
+
+    async def _get_json(self, path: str) -> Dict[str, Any]:
+        session = self._session
+        if session is None or session.closed:
+            async with aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout_seconds)
+            ) as temporary:
+                async with temporary.get(f"{self.base_url}{path}") as response:
+                    response.raise_for_status()
+                    return await response.json()
+        async with session.get(f"{self.base_url}{path}") as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def _fetch(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            tags, ps = await asyncio.gather(
+                self._get_json("/api/tags"), self._get_json("/api/ps")
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            self._stats["failures"] += 1
+            return {
+                "status": "offline",
+                "error": str(e) or type(e).__name__,
+                "installed": [],
+                "loaded": [],
+                "checked_at": datetime.now().isoformat(),
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+
+        installed = [
+            {
+                "name": model["name"],
+                "id": base_model_name(model["name"]),
+                "size": model.get("size"),
+                "modified_at": model.get("modified_at"),
+                "digest": model.get("digest"),
+                "details": model.get("details", {}),
+            }
+            for model in tags.get("models", [])
+        ]
+        loaded = [
+            {
+                "name": model["name"],
+                "id": base_model_name(model["name"]),
+                "size": model.get("size"),
+                "size_vram": model.get("size_vram"),
+                "gpu_share": (
+                    round(model["size_vram"] / model["size"], 3)
+                    if model.get("size") and model.get("size_vram") is not None
+                    else None
+                ),
+                "expires_at": model.get("expires_at"),
+            }
+            for model in ps.get("models", [])
+        ]
+        return {
+            "status": "online",
+            "error": None,
+            "installed": installed,
+            "loaded": loaded,
+            "checked_at": datetime.now().isoformat(),
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    async def refresh(self) -> Dict[str, Any]:
+        """Query Ollama now; concurrent callers share one request"""
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._fetch())
+        snapshot = await asyncio.shield(self._refreshing)
+        if self._snapshot is None or snapshot is not self._snapshot:
+            self._snapshot = snapshot
+            self._fetched_at = time.monotonic()
+            self._stats["refreshes"] += 1
+        return snapshot
+
+    async def get(self) -> Dict[str, Any]:
+        """Cached snapshot; a stale one is served while a refresh runs"""
+        if self._snapshot is None:
+            return await self.refresh()
+        if time.monotonic() - self._fetched_at > self.ttl_seconds:
+            self._stats["served_stale"] += 1
+            if self._stale_refresh is None or self._stale_refresh.done():
+                # Referenced so the task is not garbage collected mid-refresh
+                self._stale_refresh = asyncio.create_task(self.refresh())
+                self._stale_refresh.add_done_callback(self._log_failed_refresh)
+        return self._snapshot
+
+    def _log_failed_refresh(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self._stats["failures"] += 1
+            logger.warning(f"Ollama inventory refresh failed: {task.exception()!r}")
+
+    async def installed_models(self) -> List[str]:
+        """Installed model names without tags (empty while Ollama is offline)"""
+        snapshot = await self.get()
+        return list(dict.fromkeys(m["id"] for m in snapshot["installed"]))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "ttl_seconds": self.ttl_seconds,
+            "age_seconds": (
+                round(time.monotonic() - self._fetched_at, 2)
+                if self._snapshot
+                else None
+            ),
+            "background_refresh": self._loop_task is not None,
+        }
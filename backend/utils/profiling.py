@@ -0,0 +1,180 @@
+"""
+Opt-in request profiling
+Two modes: a stack sampler over all threads (covers asyncio.to_thread work; its
+collapsed stacks feed flamegraph.pl or speedscope) and cProfile on the event
+loop thread (pstats). Profiles are kept on disk under an ID; only one request
+is profiled at a time
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+PROFILE_MODES = ("sampling", "deterministic")
+
+
+class StackSampler:
+    """Samples the stacks of all other threads at a fixed interval"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="profile-sampler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({Path(code.co_filename).name}:"
+                        f"{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.items())
+
+    def top_functions(self, limit: int = 25) -> List[Dict[str, Any]]:
+        """Functions by samples on top of the stack (self time)"""
+        leaf: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaf[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaf.values()) or 1
+        return [
+            {"function": name, "samples": n, "share": round(n / total, 4)}
+            for name, n in leaf.most_common(limit)
+        ]
+
+
+class RequestProfiler:
+    """Profiles one request at a time and stores the result under an ID"""
+
+    def __init__(self, directory: str, max_profiles: int = 50):
+        self.directory = Path(directory)
+        self.max_profiles = max_profiles
+        self._busy = threading.Lock()
+
+    def start(self, mode: str = "sampling") -> Optional[Dict[str, Any]]:
+        """Begin profiling; None when another request is being profiled"""
+        if not self._busy.acquire(blocking=False):
+            return None
+        mode = mode if mode in PROFILE_MODES else "sampling"
+        session = {"mode": mode, "started": time.perf_counter()}
+        if mode == "deterministic":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:  # another profiler/tracer is active
+                self._busy.release()
+                return None
+            session["profile"] = profile
+        else:
+            sampler = StackSampler()
+            sampler.start()
+            session["sampler"] = sampler
+        return session
+
+    def stop(self, session: Dict[str, Any]):
+        """Stop collecting; call from the thread that started the session"""
+        try:
+            session["elapsed"] = time.perf_counter() - session["started"]
+            if "profile" in session:
+                session["profile"].disable()
+            else:
+                session["sampler"].stop()
+        finally:
+            self._busy.release()
+
+    def save(self, session: Dict[str, Any], **metadata) -> str:
+        """Write the profile files of a stopped session and return its ID"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        profile_id = f"{timestamp}_{uuid.uuid4().hex[:8]}"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        info = {
+            "id": profile_id,
+            "mode": session["mode"],
+            "duration_ms": round(session["elapsed"] * 1000, 1),
+            "created_at": datetime.now().isoformat(),
+            **metadata,
+        }
+        if "profile" in session:
+            profile = session["profile"]
+            profile.dump_stats(str(self.directory / f"{profile_id}.pstats"))
+            text = io.StringIO()
+            stats = pstats.Stats(profile, stream=text)
+            stats.sort_stats("cumulative").print_stats(40)
+            (self.directory / f"{profile_id}.txt").write_text(text.getvalue())
+            info["files"] = ["pstats", "txt"]
+        else:
+            sampler = session["sampler"]
+            collapsed = self.directory / f"{profile_id}.collapsed"
+            collapsed.write_text(sampler.collapsed())
+            info["samples"] = sampler.samples
+            info["top_functions"] = sampler.top_functions()
+            info["files"] = ["collapsed"]
+        info_path = self.directory / f"{profile_id}.json"
+        info_path.write_text(json.dumps(info, indent=2))
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        infos = sorted(self.directory.glob("*.json"))
+        for stale in infos[: max(0, len(infos) - self.max_profiles)]:
+            for path in self.directory.glob(f"{stale.stem}.*"):
+                path.unlink(missing_ok=True)
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Newest profiles first (without the per-function breakdown)"""
+        infos = sorted(self.directory.glob("*.json"), reverse=True)[:limit]
+        result = []
+        for path in infos:
+            try:
+                info = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            info.pop("top_functions", None)
+            result.append(info)
+        return result
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        path = self.directory / f"{Path(profile_id).name}.json"
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def file_path(self, profile_id: str, kind: str) -> Optional[Path]:
+        if kind not in ("pstats", "txt", "collapsed"):
+            return None
+        path = self.directory / f"{Path(profile_id).name}.{kind}"
+        return path if path.exists() else None
@@ -0,0 +1,180 @@
+"""
+Per-key token-bucket rate limiting for outbound API proxies (Gemini)
+Buckets are O(1) to check, never sleep, and report an ETA when a request is rejected
+"""
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a key has no tokens left; carries the seconds until the next token"""
+
+    def __init__(self, retry_after: float, message: str = "Rate limit exceeded"):
+        super().__init__(message)
+        self.retry_after = max(0.0, retry_after)
+
+    @property
+    def retry_after_header(self) -> str:
+        """Retry-After header value (whole seconds, at least 1)"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` burst, refilled at `rate` tokens per second"""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated_at", "blocked_until")
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated_at = now
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def try_consume(self, now: float, cost: float = 1.0) -> float:
+        """Consume `cost` tokens. Returns 0.0 on success, otherwise seconds to wait"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def block_for(self, now: float, seconds: float):
+        """Honor an upstream Retry-After: drain the bucket and block until it expires"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.updated_at = max(self.updated_at, self.blocked_until)
+
+
+class KeyedRateLimiter:
+    """Token buckets keyed by API key (optionally combined with analyst_id)
+
+    Checks happen under a lock without awaiting, so there is no race between the
+    check and the consume, and one key's burst never delays another key.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 14,
+        burst: Optional[int] = None,
+        max_keys: int = 10000,
+    ):
+        if requests_per_minute <= 0:
+            raise ValueError(
+                f"requests_per_minute must be positive, got {requests_per_minute}"
+            )
+        capacity = float(burst if burst is not None else max(1, requests_per_minute))
+        if capacity < 1:
+            raise ValueError(f"burst must allow at least one request, got {burst}")
+        self.rate = requests_per_minute / 60.0
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "allowed": 0,
+            "rejected": 0,
+            "upstream_429": 0,
+            "total_retry_after_seconds": 0.0,
+            "max_retry_after_seconds": 0.0,
+        }
+
+    @staticmethod
+    def make_key(api_key: str, analyst_id: Optional[str] = None) -> str:
+        """Hash the API key so raw secrets are never kept in memory or exported"""
+        digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        return f"{digest}:{analyst_id}" if analyst_id else digest
+
+    def _bucket(self, key: str, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.capacity, self.rate, now)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def check(self, key: str, cost: float = 1.0) -> Tuple[bool, float]:
+        """Try to take a token for `key`. Returns (allowed, retry_after_seconds)"""
+        now = time.monotonic()
+        with self._lock:
+            wait = self._bucket(key, now).try_consume(now, cost)
+            if wait <= 0:
+                self._stats["allowed"] += 1
+                return True, 0.0
+            self._stats["rejected"] += 1
+            self._stats["total_retry_after_seconds"] += wait
+            self._stats["max_retry_after_seconds"] = max(
+                self._stats["max_retry_after_seconds"], wait
+            )
+            return False, wait
+
+    def acquire(self, key: str, cost: float = 1.0):
+        """Like `check`, but raises RateLimitExceeded instead of returning False"""
+        allowed, retry_after = self.check(key, cost)
+        if not allowed:
+            raise RateLimitExceeded(
+                retry_after,
+                f"Rate limit exceeded - retry in {retry_after:.1f}s",
+            )
+
+    def penalize(self, key: str, retry_after: float):
+        """Apply an upstream 429 Retry-After to the key's bucket"""
+        now = time.monotonic()
+        with self._lock:
+            self._bucket(key, now).block_for(now, retry_after)
+            self._stats["upstream_429"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Rejection and wait statistics for monitoring endpoints"""
+        with self._lock:
+            stats = dict(self._stats)
+            now = time.monotonic()
+            stats["tracked_keys"] = len(self._buckets)
+            stats["blocked_keys"] = sum(
+                1 for b in self._buckets.values() if b.blocked_until > now
+            )
+        decisions = stats["allowed"] + stats["rejected"]
+        stats["rejection_rate"] = (
+            round(stats["rejected"] / decisions, 4) if decisions else 0.0
+        )
+        stats["avg_retry_after_seconds"] = (
+            round(stats["total_retry_after_seconds"] / stats["rejected"], 3)
+            if stats["rejected"]
+            else 0.0
+        )
+        stats["requests_per_minute"] = round(self.rate * 60, 2)
+        stats["burst_capacity"] = self.capacity
+        return stats
+
+
+def parse_retry_after(value: Optional[str], default: float) -> float:
+    """Parse a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,103 @@
+"""
+Exact-match response cache with singleflight deduplication
+Keys are hashes of the fully rendered prompt plus model parameters; entries expire
+after a TTL and the least recently used entry is evicted when the cache is full
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+def make_cache_key(
+    prompt: str, model: str, params: Optional[Dict[str, Any]] = None
+) -> str:
+    """Stable SHA-256 over prompt, model and generation parameters"""
+    payload = json.dumps(
+        {"prompt": prompt, "model": model, "params": params or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """TTL + LRU bounded cache that coalesces concurrent identical requests"""
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def invalidate(self, key: Optional[str] = None):
+        """Drop one entry, or everything when no key is given"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    async def get_or_generate(
+        self, key: str, generate: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, str]:
+        """Return (value, status) where status is 'hit', 'coalesced' or 'miss'
+
+        Only one generation runs per key at a time; concurrent callers await the
+        same task. The task is shielded so a disconnecting caller does not cancel
+        the generation for everyone else. Failures are not cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            self._stats["hits"] += 1
+            return value, "hit"
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(task), "coalesced"
+
+        self._stats["misses"] += 1
+        task = asyncio.ensure_future(generate())
+        self._in_flight[key] = task
+
+        def _done(finished: asyncio.Task):
+            self._in_flight.pop(key, None)
+            if not finished.cancelled() and finished.exception() is None:
+                self.set(key, finished.result())
+
+        task.add_done_callback(_done)
+        return await asyncio.shield(task), "miss"
+
+    def stats(self) -> Dict[str, Any]:
+        served = self._stats["hits"] + self._stats["coalesced"]
+        lookups = served + self._stats["misses"]
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "in_flight": len(self._in_flight),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hit_rate": round(served / lookups, 4) if lookups else 0.0,
+        }
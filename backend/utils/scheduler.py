@@ -0,0 +1,280 @@
+"""
+Admission-controlled, priority-aware scheduler for LLM execution
+Strict priority lanes, weighted fair queuing across departments inside a lane,
+bounded queue depth with load shedding and per-lane queue-time metrics
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+# Highest priority first
+PRIORITY_LANES = ("critical", "high", "standard", "low")
+
+PRIORITY_ALIASES = {
+    "urgent": "critical",
+    "kritisch": "critical",
+    "dringend": "critical",
+    "hoch": "high",
+    "normal": "standard",
+    "mittel": "standard",
+    "niedrig": "low",
+    "batch": "low",
+    "background": "low",
+}
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when a request is rejected or shed because the queue is full"""
+
+    def __init__(self, lane: str, retry_after: float, message: str):
+        super().__init__(message)
+        self.lane = lane
+        self.retry_after = max(1.0, retry_after)
+
+
+def normalize_priority(priority_level: Optional[str]) -> str:
+    """Map a free-form priority_level onto one of the scheduler lanes"""
+    level = (priority_level or "standard").strip().lower()
+    level = PRIORITY_ALIASES.get(level, level)
+    return level if level in PRIORITY_LANES else "standard"
+
+
+def parse_department_weights(spec: str) -> Dict[str, float]:
+    """Parse 'Risk=3,Finance=1' into a department -> weight mapping"""
+    weights = {}
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        name, _, value = part.partition("=")
+        try:
+            weight = float(value)
+        except ValueError:
+            continue
+        if name.strip() and weight > 0:
+            weights[name.strip()] = weight
+    return weights
+
+
+class _Waiter:
+    __slots__ = ("future", "lane", "department", "enqueued_at", "cancelled")
+
+    def __init__(self, future: asyncio.Future, lane: str, department: str):
+        self.future = future
+        self.lane = lane
+        self.department = department
+        self.enqueued_at = time.monotonic()
+        self.cancelled = False
+
+
+class _Lane:
+    """One priority lane: a WFQ heap ordered by virtual finish tag"""
+
+    def __init__(self, name: str, sample_size: int):
+        self.name = name
+        self.heap: List[tuple] = []
+        self.queued = 0
+        self.virtual_time = 0.0
+        self.department_finish: Dict[str, float] = {}
+        self.admitted = 0
+        self.shed = 0
+        self.rejected = 0
+        self.queue_waits: deque = deque(maxlen=sample_size)
+
+    def push(self, waiter: _Waiter, weight: float, seq: int):
+        start = max(
+            self.virtual_time, self.department_finish.get(waiter.department, 0.0)
+        )
+        finish = start + 1.0 / weight
+        self.department_finish[waiter.department] = finish
+        heapq.heappush(self.heap, (finish, seq, waiter))
+        self.queued += 1
+
+    def pop(self) -> Optional[_Waiter]:
+        while self.heap:
+            finish, _, waiter = heapq.heappop(self.heap)
+            if waiter.cancelled:
+                continue
+            # No longer queued: a cancellation racing with this pop must not
+            # decrement the counter again
+            waiter.cancelled = True
+            self.queued -= 1
+            self.virtual_time = finish
+            if not self.queued:
+                # Idle lane: forget finish tags so departments restart on equal terms
+                self.department_finish.clear()
+            return waiter
+        return None
+
+    def newest(self) -> Optional[_Waiter]:
+        """Most recently enqueued live waiter (shed candidate)"""
+        live = [entry for entry in self.heap if not entry[2].cancelled]
+        return max(live, key=lambda entry: entry[1])[2] if live else None
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.queue_waits)
+
+        def percentile(q: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))], 4)
+
+        return {
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "rejected": self.rejected,
+            "queue_time_avg_s": round(sum(waits) / len(waits), 4) if waits else 0.0,
+            "queue_time_p50_s": percentile(0.50),
+            "queue_time_p95_s": percentile(0.95),
+            "queue_time_max_s": round(waits[-1], 4) if waits else 0.0,
+        }
+
+
+class PriorityScheduler:
+    """Limits concurrent LLM executions and orders waiters by priority lane
+
+    Intended for use from a single event loop:
+
+        async with scheduler.slot(request.priority_level, request.department):
+            result = await asyncio.to_thread(llm.invoke, prompt)
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 2,
+        max_queue_depth: int = 100,
+        department_weights: Optional[Dict[str, float]] = None,
+        default_weight: float = 1.0,
+        sample_size: int = 1000,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_depth = max(0, max_queue_depth)
+        self.department_weights = department_weights or {}
+        self.default_weight = default_weight
+        self.lanes = {name: _Lane(name, sample_size) for name in PRIORITY_LANES}
+        self.running = 0
+        self._seq = itertools.count()
+        self._service_time_ewma = 0.0
+
+    @property
+    def queued(self) -> int:
+        return sum(lane.queued for lane in self.lanes.values())
+
+    def _weight(self, department: str) -> float:
+        return self.department_weights.get(department, self.default_weight)
+
+    def _estimated_wait(self, position: int) -> float:
+        per_slot = self._service_time_ewma or 5.0
+        return per_slot * (position + 1) / self.max_concurrency
+
+    def _admit(self, lane: _Lane, waited: float):
+        self.running += 1
+        lane.admitted += 1
+        lane.queue_waits.append(waited)
+
+    def _shed_for(self, lane_name: str) -> bool:
+        """Drop the newest waiter of the lowest lane below `lane_name`, if any"""
+        incoming = PRIORITY_LANES.index(lane_name)
+        for name in reversed(PRIORITY_LANES[incoming + 1 :]):
+            lane = self.lanes[name]
+            victim = lane.newest()
+            if victim is None:
+                continue
+            victim.cancelled = True
+            lane.queued -= 1
+            lane.shed += 1
+            if not victim.future.done():
+                victim.future.set_exception(
+                    SchedulerOverloaded(
+                        name,
+                        self._estimated_wait(self.queued),
+                        f"Request shed from '{name}' lane for higher-priority work",
+                    )
+                )
+            return True
+        return False
+
+    def _dispatch(self):
+        while self.running < self.max_concurrency:
+            waiter = None
+            for name in PRIORITY_LANES:
+                waiter = self.lanes[name].pop()
+                if waiter is not None:
+                    break
+            if waiter is None:
+                return
+            if waiter.future.done():
+                continue
+            waited = time.monotonic() - waiter.enqueued_at
+            self._admit(self.lanes[waiter.lane], waited)
+            waiter.future.set_result(None)
+
+    async def acquire(self, priority_level: Optional[str], department: Optional[str]):
+        """Wait for an execution slot; raises SchedulerOverloaded when shed"""
+        lane_name = normalize_priority(priority_level)
+        lane = self.lanes[lane_name]
+        department = department or "default"
+
+        if self.running < self.max_concurrency and not self.queued:
+            self._admit(lane, 0.0)
+            return
+
+        if self.queued >= self.max_queue_depth and not self._shed_for(lane_name):
+            lane.rejected += 1
+            raise SchedulerOverloaded(
+                lane_name,
+                self._estimated_wait(self.queued),
+                f"LLM queue is full ({self.max_queue_depth} waiting)",
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(future, lane_name, department)
+        lane.push(waiter, self._weight(department), next(self._seq))
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Slot was granted just before cancellation - give it back
+                if waiter.future.exception() is None:
+                    self.release()
+            elif not waiter.cancelled:
+                waiter.cancelled = True
+                lane.queued -= 1
+            raise
+
+    def release(self, service_time: Optional[float] = None):
+        """Free a slot and admit the next waiter"""
+        self.running = max(0, self.running - 1)
+        if service_time is not None:
+            self._service_time_ewma = (
+                service_time
+                if not self._service_time_ewma
+                else 0.8 * self._service_time_ewma + 0.2 * service_time
+            )
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority_level: Optional[str], department: Optional[str]):
+        await self.acquire(priority_level, department)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, shedding and queue-time metrics per lane"""
+        return {
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "queued": self.queued,
+            "max_queue_depth": self.max_queue_depth,
+            "avg_service_time_s": round(self._service_time_ewma, 3),
+            "department_weights": self.department_weights,
+            "lanes": {name: lane.stats() for name, lane in self.lanes.items()},
+        }
@@ -0,0 +1,241 @@
+"""
+Persistent cache of natural-language to SQL translations
+Entries are keyed by the normalized question, the schema fingerprint, the
+modify flag and a fingerprint of the document context, and kept in SQLite so
+they survive restarts. Paraphrased questions can optionally be matched by
+embedding similarity. SQL that was executed successfully is promoted: it is
+kept longer and evicted last
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+SIMILARITY_THRESHOLD = 0.92
+
+
+def normalize_question(question: str) -> str:
+    """Case, whitespace and punctuation insensitive form of a question"""
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def fingerprint(value: Any) -> str:
+    """SHA-256 of a JSON-serializable value (e.g. a schema structure)"""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def translation_key(
+    question: str, schema_hash: str, modify: bool, context_hash: str
+) -> str:
+    return fingerprint(
+        [normalize_question(question), schema_hash, bool(modify), context_hash]
+    )
+
+
+class SqlTranslationCache:
+    """Question -> SQL entries in a WAL-mode SQLite database
+
+    Entries expire after ttl_seconds, promoted ones after promoted_ttl_seconds;
+    beyond max_entries the least recently used unpromoted entries go first.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "sql_cache.db",
+        ttl_seconds: float = 7 * 24 * 3600,
+        promoted_ttl_seconds: float = 90 * 24 * 3600,
+        max_entries: int = 5000,
+        similarity_threshold: float = SIMILARITY_THRESHOLD,
+    ):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.promoted_ttl_seconds = promoted_ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_schema(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS translations (
+                    cache_key TEXT PRIMARY KEY,
+                    question TEXT NOT NULL,
+                    schema_hash TEXT NOT NULL,
+                    modify INTEGER NOT NULL,
+                    context_hash TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    embedding BLOB,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    promoted INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_translations_scope
+                    ON translations(schema_hash, modify, context_hash);
+                CREATE INDEX IF NOT EXISTS idx_translations_eviction
+                    ON translations(promoted, last_used);
+                """
+            )
+
+    def get(
+        self, question: str, schema_hash: str, modify: bool, context_hash: str
+    ) -> Optional[Dict[str, Any]]:
+        """Exact hit for the normalized question, or None"""
+        key = translation_key(question, schema_hash, modify, context_hash)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT cache_key, sql, hits, promoted FROM translations"
+                " WHERE cache_key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                return None
+            self._touch(conn, key)
+        return {**dict(row), "match": "exact", "similarity": 1.0}
+
+    def get_similar(
+        self,
+        schema_hash: str,
+        modify: bool,
+        context_hash: str,
+        embedding: Sequence[float],
+    ) -> Optional[Dict[str, Any]]:
+        """Best entry of the same scope whose question embedding is at least
+        similarity_threshold (cosine) close, or None"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT cache_key, sql, hits, promoted, question, embedding"
+                " FROM translations WHERE schema_hash = ? AND modify = ?"
+                " AND context_hash = ? AND embedding IS NOT NULL AND expires_at > ?",
+                (schema_hash, int(modify), context_hash, time.time()),
+            ).fetchall()
+            query = _unit(np.asarray(embedding, dtype=np.float32))
+            # Entries embedded by another model (other dimension) never match
+            rows = [row for row in rows if len(row["embedding"]) == query.nbytes]
+            if not rows:
+                return None
+            matrix = np.stack(
+                [np.frombuffer(row["embedding"], dtype=np.float32) for row in rows]
+            )
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+            row = rows[best]
+            self._touch(conn, row["cache_key"])
+        return {
+            **{k: row[k] for k in ("cache_key", "sql", "hits", "promoted")},
+            "match": "similar",
+            "similar_question": row["question"],
+            "similarity": round(float(similarities[best]), 4),
+        }
+
+    def put(
+        self,
+        question: str,
+        schema_hash: str,
+        modify: bool,
+        context_hash: str,
+        sql: str,
+        embedding: Optional[Sequence[float]] = None,
+    ) -> str:
+        """Store a translation; returns its cache key for promote()"""
+        key = translation_key(question, schema_hash, modify, context_hash)
+        vector = None
+        if embedding is not None:
+            vector = _unit(np.asarray(embedding, dtype=np.float32)).tobytes()
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO translations (cache_key, question, schema_hash, modify,"
+                " context_hash, sql, embedding, created_at, last_used, expires_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(cache_key) DO UPDATE SET sql = excluded.sql,"
+                " embedding = excluded.embedding, last_used = excluded.last_used,"
+                " expires_at = excluded.expires_at, promoted = 0",
+                (
+                    key,
+                    normalize_question(question),
+                    schema_hash,
+                    int(modify),
+                    context_hash,
+                    sql,
+                    vector,
+                    now,
+                    now,
+                    now + self.ttl_seconds,
+                ),
+            )
+            self._evict(conn, now)
+        return key
+
+    def promote(self, cache_key: str):
+        """Keep an entry whose SQL was executed successfully for longer"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE translations SET promoted = 1, expires_at = ?"
+                " WHERE cache_key = ?",
+                (time.time() + self.promoted_ttl_seconds, cache_key),
+            )
+
+    def forget(self, cache_key: str):
+        """Drop an entry whose SQL turned out to be wrong"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM translations WHERE cache_key = ?", (cache_key,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) AS entries, COALESCE(SUM(promoted), 0) AS promoted,"
+                " COALESCE(SUM(hits), 0) AS hits FROM translations"
+            ).fetchone()
+        return dict(row)
+
+    def _touch(self, conn: sqlite3.Connection, cache_key: str):
+        conn.execute(
+            "UPDATE translations SET hits = hits + 1, last_used = ?"
+            " WHERE cache_key = ?",
+            (time.time(), cache_key),
+        )
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM translations WHERE expires_at <= ?", (now,))
+        excess = (
+            conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            - self.max_entries
+        )
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM translations WHERE cache_key IN (SELECT cache_key"
+                " FROM translations ORDER BY promoted, last_used LIMIT ?)",
+                (excess,),
+            )
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
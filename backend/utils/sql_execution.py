@@ -0,0 +1,165 @@
+"""
+Guarded execution of generated SQL against uploaded SQLite databases
+Queries run on read-only connections and their rows are fetched page by page
+with fetchmany, up to a row cap, so a broad SELECT never materializes the
+whole result. A progress handler interrupts statements that exceed their time
+budget or are cancelled
+"""
+
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_MAX_ROWS = 10000
+DEFAULT_TIMEOUT_SECONDS = 30.0
+# SQLite VM instructions between two deadline checks
+PROGRESS_INSTRUCTIONS = 10000
+
+ROW_RETURNING_KEYWORDS = ("SELECT", "WITH", "VALUES", "EXPLAIN")
+_LEADING_COMMENTS_RE = re.compile(r"^(?:\s+|--[^\n]*\n?|/\*.*?\*/)*", re.DOTALL)
+
+
+class QueryTimeout(Exception):
+    """The statement was interrupted after exceeding its time budget"""
+
+    def __init__(self, timeout_seconds: float):
+        super().__init__(f"Query interrupted after {timeout_seconds:g}s")
+        self.timeout_seconds = timeout_seconds
+
+
+def returns_rows(sql: str) -> bool:
+    """Whether the statement is a query (first keyword after comments)"""
+    body = _LEADING_COMMENTS_RE.sub("", sql, count=1)
+    return body[:8].upper().startswith(ROW_RETURNING_KEYWORDS)
+
+
+class _GuardedConnection:
+    """SQLite connection whose statements are interrupted at a deadline"""
+
+    def __init__(self, db_path: str, read_only: bool, timeout_seconds: float):
+        self.timeout_seconds = timeout_seconds
+        self._deadline = float("inf")
+        self._cancelled = False
+        if read_only:
+            uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+            self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.set_progress_handler(self._should_interrupt, PROGRESS_INSTRUCTIONS)
+
+    def _should_interrupt(self) -> int:
+        return int(self._cancelled or time.monotonic() > self._deadline)
+
+    def run(self, operation):
+        """Call operation() with a fresh time budget"""
+        self._deadline = time.monotonic() + self.timeout_seconds
+        try:
+            return operation()
+        except sqlite3.OperationalError as e:
+            if "interrupted" in str(e) and not self._cancelled:
+                raise QueryTimeout(self.timeout_seconds) from e
+            raise
+        finally:
+            self._deadline = float("inf")
+
+    def cancel(self):
+        self._cancelled = True
+        self.conn.interrupt()
+
+    def close(self):
+        self.conn.close()
+
+
+class QueryCursor:
+    """Result of a query read in pages from a read-only connection
+
+    fetch_page() returns the next page_size rows; at most max_rows rows are
+    read in total (truncated is then set). Each fetch gets its own time
+    budget, as SQLite computes rows lazily while they are fetched.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        sql: str,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        max_rows: int = DEFAULT_MAX_ROWS,
+        timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+    ):
+        self.sql = sql
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.rows_read = 0
+        self.pages_read = 0
+        self.exhausted = False
+        self.truncated = False
+        self.seconds = 0.0
+        self._lookahead: Optional[tuple] = None
+        self._guard = _GuardedConnection(db_path, True, timeout_seconds)
+        try:
+            self._cursor = self._timed(lambda: self._guard.conn.execute(sql))
+        except Exception:
+            self._guard.close()
+            raise
+        self.columns: List[str] = [d[0] for d in self._cursor.description or ()]
+        if not self.columns:
+            self._finish()
+
+    def _timed(self, operation):
+        started = time.perf_counter()
+        try:
+            return self._guard.run(operation)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+    def fetch_page(self) -> List[tuple]:
+        """Next page of rows; empty once the result or the row cap is reached"""
+        if self.exhausted:
+            return []
+        limit = min(self.page_size, self.max_rows - self.rows_read)
+        rows = [self._lookahead] if self._lookahead is not None else []
+        self._lookahead = None
+        # One row beyond the page tells whether another page exists
+        rows += self._timed(lambda: self._cursor.fetchmany(limit + 1 - len(rows)))
+        if len(rows) > limit:
+            self._lookahead = rows.pop()
+        self.rows_read += len(rows)
+        self.pages_read += 1
+        if self._lookahead is None:
+            self._finish()
+        elif self.rows_read >= self.max_rows:
+            self.truncated = True
+            self._finish()
+        return rows
+
+    def cancel(self):
+        """Interrupt a running fetch (callable from another thread)"""
+        self._guard.cancel()
+
+    def _finish(self):
+        self.exhausted = True
+        self._lookahead = None
+        self._guard.close()
+
+    def close(self):
+        if not self.exhausted:
+            self._finish()
+
+
+def execute_statement(
+    db_path: str, sql: str, timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS
+) -> Any:
+    """Run a modifying statement in a transaction; returns the affected rows"""
+    guard = _GuardedConnection(db_path, False, timeout_seconds)
+    try:
+        cursor = guard.run(lambda: guard.conn.execute(sql))
+        guard.conn.commit()
+        return cursor.rowcount
+    except Exception:
+        guard.conn.rollback()
+        raise
+    finally:
+        guard.close()
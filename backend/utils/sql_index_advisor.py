@@ -0,0 +1,480 @@
+"""
+Query plan inspection and index advice for generated SQL
+Every statement is checked with EXPLAIN QUERY PLAN; full scans of large tables
+are flagged, and indexes on the columns the statement filters or joins on are
+proposed. Candidates are tried as hypothetical indexes on an in-memory copy of
+the schema and kept only if the planner then searches instead of scanning.
+Accepted indexes are created on a working copy of the database (the upload
+itself is never changed) and remembered per database content in a JSON file
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils.sql_execution import DEFAULT_TIMEOUT_SECONDS, QueryCursor, returns_rows
+
+logger = logging.getLogger(__name__)
+
+LARGE_TABLE_ROWS = 10000
+MAX_INDEX_COLUMNS = 3
+
+_IDENT = r'"[^"]+"|\[[^\]]+\]|`[^`]+`|\w+'
+_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(.+?)(?: AS (\S+))?(?: USING (.*))?$")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_FROM_RE = re.compile(
+    rf"(?:\bFROM|\bJOIN|\bUPDATE|,)\s+({_IDENT})(?:\s+(?:AS\s+)?({_IDENT}))?",
+    re.IGNORECASE,
+)
+_REF = rf"(?:({_IDENT})\s*\.\s*)?({_IDENT})"
+_OPERATOR = r"(==|=|<>|!=|<=|>=|<|>|\bIN\b|\bIS\b|\bLIKE\b|\bBETWEEN\b|\bGLOB\b)"
+_LEFT_PREDICATE_RE = re.compile(rf"{_REF}\s*(?:NOT\s+)?{_OPERATOR}", re.IGNORECASE)
+_RIGHT_PREDICATE_RE = re.compile(rf"(?:==|=)\s*{_REF}", re.IGNORECASE)
+_EQUALITY_OPERATORS = ("=", "==", "IN", "IS")
+# Words that can follow a table name but are not an alias
+_SQL_KEYWORDS = set(
+    "WHERE ON JOIN LEFT RIGHT FULL INNER OUTER CROSS NATURAL USING GROUP ORDER "
+    "LIMIT HAVING UNION EXCEPT INTERSECT WINDOW SET VALUES AS".split()
+)
+
+
+def _unquote(identifier: str) -> str:
+    if identifier[:1] in "\"[`":
+        return identifier[1:-1]
+    return identifier
+
+
+def _strip_literals(sql: str) -> str:
+    return _STRING_RE.sub("''", _COMMENT_RE.sub(" ", sql))
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def explain_query_plan(conn: sqlite3.Connection, sql: str) -> List[Dict[str, Any]]:
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    return [{"id": r[0], "parent": r[1], "detail": r[3]} for r in rows]
+
+
+def _tables(conn: sqlite3.Connection) -> Dict[str, str]:
+    """lowercase name -> name of the database's tables"""
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'"
+        " AND name NOT LIKE 'sqlite_%'"
+    ).fetchall()
+    return {name.lower(): name for (name,) in rows}
+
+
+def _table_aliases(sql: str, tables: Dict[str, str]) -> Dict[str, str]:
+    """lowercase alias or table name -> table, for tables named in FROM/JOIN"""
+    aliases = {}
+    for table, alias in _FROM_RE.findall(sql):
+        name = tables.get(_unquote(table).lower())
+        if name is None:
+            continue
+        aliases[name.lower()] = name
+        if alias and _unquote(alias).upper() not in _SQL_KEYWORDS:
+            aliases[_unquote(alias).lower()] = name
+    return aliases
+
+
+def estimated_rows(conn: sqlite3.Connection, table: str) -> int:
+    """Row count estimate without scanning: MAX(rowid), else COUNT(*)"""
+    try:
+        (rows,) = conn.execute(
+            f"SELECT MAX(rowid) FROM {quote_identifier(table)}"
+        ).fetchone()
+    except sqlite3.OperationalError:  # WITHOUT ROWID table
+        (rows,) = conn.execute(
+            f"SELECT COUNT(*) FROM {quote_identifier(table)}"
+        ).fetchone()
+    return rows or 0
+
+
+def _table_scans(
+    plan: List[Dict[str, Any]],
+    aliases: Dict[str, str],
+    tables: Dict[str, str],
+    index_scans: bool = False,
+) -> Iterator[Tuple[str, str]]:
+    """(table, detail) of plan steps reading a whole table (or, with
+    index_scans, a whole index of it)"""
+    for step in plan:
+        match = _SCAN_RE.match(step["detail"])
+        if not match:
+            continue
+        if not index_scans and match.group(3) and "INDEX" in match.group(3):
+            continue
+        target = (match.group(2) or match.group(1)).lower()
+        table = aliases.get(target) or tables.get(match.group(1).lower())
+        if table is not None:  # else a subquery, CTE or view materialization
+            yield table, step["detail"]
+
+
+def full_scans(
+    conn: sqlite3.Connection,
+    plan: List[Dict[str, Any]],
+    aliases: Dict[str, str],
+    min_rows: int = LARGE_TABLE_ROWS,
+) -> List[Dict[str, Any]]:
+    """Full scans of tables with at least min_rows rows"""
+    scans = []
+    for table, detail in _table_scans(plan, aliases, _tables(conn)):
+        rows = estimated_rows(conn, table)
+        if rows >= min_rows:
+            scans.append({"table": table, "detail": detail, "rows": rows})
+    return scans
+
+
+def predicate_columns(
+    sql: str, aliases: Dict[str, str], columns: Dict[str, List[str]]
+) -> Dict[str, Dict[str, List[str]]]:
+    """table -> {"equality": [...], "range": [...]} columns compared in sql"""
+    found: Dict[str, Dict[str, List[str]]] = {}
+
+    def add(qualifier: str, column: str, kind: str):
+        column = _unquote(column)
+        if qualifier:
+            candidates = [aliases.get(_unquote(qualifier).lower())]
+        else:
+            candidates = sorted(set(aliases.values()))
+        for table in candidates:
+            if table is None:
+                continue
+            names = {c.lower(): c for c in columns.get(table, [])}
+            if column.lower() in names:
+                entry = found.setdefault(table, {"equality": [], "range": []})
+                name = names[column.lower()]
+                if name not in entry[kind]:
+                    entry[kind].append(name)
+
+    for qualifier, column, operator in _LEFT_PREDICATE_RE.findall(sql):
+        kind = "equality" if operator.upper() in _EQUALITY_OPERATORS else "range"
+        add(qualifier, column, kind)
+    for qualifier, column in _RIGHT_PREDICATE_RE.findall(sql):
+        add(qualifier, column, "equality")
+    for entry in found.values():
+        entry["range"] = [c for c in entry["range"] if c not in entry["equality"]]
+    return found
+
+
+def index_name(table: str, columns: List[str]) -> str:
+    name = re.sub(r"\W+", "_", f"idx_{table}_{'_'.join(columns)}").lower()
+    return name[:60]
+
+
+def _candidate_columns(predicates: Dict[str, List[str]]) -> List[List[str]]:
+    """Equality columns first, then one range column; then single columns"""
+    combined = (predicates["equality"] + predicates["range"][:1])[:MAX_INDEX_COLUMNS]
+    candidates = [combined] if combined else []
+    for column in predicates["equality"] + predicates["range"]:
+        if [column] not in candidates:
+            candidates.append([column])
+    return candidates
+
+
+def _schema_copy(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Empty in-memory database with the same tables, views, indexes and
+    planner statistics (sqlite_stat1, if the database was analyzed)"""
+    # Cached EXPLAIN statements are not re-planned after CREATE/DROP INDEX
+    copy = sqlite3.connect(":memory:", cached_statements=0)
+    statements = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL"
+        " AND name NOT LIKE 'sqlite_%'"
+        " ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END"
+    ).fetchall()
+    for (statement,) in statements:
+        try:
+            copy.execute(statement)
+        except sqlite3.Error as e:
+            logger.debug(f"Schema copy skipped a statement: {e}")
+    try:
+        stats = conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1").fetchall()
+    except sqlite3.OperationalError:  # never analyzed
+        stats = []
+    if stats:
+        copy.execute("ANALYZE sqlite_master")
+        copy.executemany("INSERT INTO sqlite_stat1 VALUES (?, ?, ?)", stats)
+        copy.execute("ANALYZE sqlite_master")
+    return copy
+
+
+def _index_statement(name: str, table: str, columns: List[str]) -> str:
+    return (
+        f"CREATE INDEX IF NOT EXISTS {quote_identifier(name)} ON "
+        f"{quote_identifier(table)} "
+        f"({', '.join(quote_identifier(c) for c in columns)})"
+    )
+
+
+def _drop(conn: sqlite3.Connection, candidate: Dict[str, Any]):
+    conn.execute(f"DROP INDEX {quote_identifier(candidate['name'])}")
+
+
+def candidate_indexes(
+    conn: sqlite3.Connection,
+    sql: str,
+    scans: List[Dict[str, Any]],
+    min_rows: int = LARGE_TABLE_ROWS,
+) -> List[Dict[str, Any]]:
+    """Indexes that turn the flagged scans into searches, tried hypothetically
+
+    Joins often need indexes on several tables before the planner changes its
+    loop order (e.g. on the filtered column of one table and the join column
+    of the other), so candidates of every table in FROM/JOIN are added one by
+    one and kept until no large table is scanned any more. Indexes the final
+    plan does without are dropped again. If not every scan can be avoided, the
+    set is still proposed when it removes some of them.
+    """
+    if not scans:
+        return []
+    tables = _tables(conn)
+    aliases = _table_aliases(_strip_literals(sql), tables)
+    flagged = [scan["table"] for scan in scans]
+    # Flagged tables first, then the other tables of the statement
+    involved = flagged + sorted(set(aliases.values()) - set(flagged))
+    columns, rowid_columns = {}, {}
+    for table in involved:
+        info = conn.execute(f"PRAGMA table_info({quote_identifier(table)})").fetchall()
+        columns[table] = [row[1] for row in info]
+        keys = [row for row in info if row[5]]
+        if len(keys) == 1 and keys[0][2].upper() == "INTEGER":
+            rowid_columns[table] = keys[0][1]
+    predicates = predicate_columns(_strip_literals(sql), aliases, columns)
+    # An INTEGER PRIMARY KEY is the rowid itself and needs no index
+    for table, column in rowid_columns.items():
+        entry = predicates.get(table)
+        if entry:
+            for kind in ("equality", "range"):
+                entry[kind] = [c for c in entry[kind] if c != column]
+            if not entry["equality"] and not entry["range"]:
+                del predicates[table]
+    rows: Dict[str, int] = {}
+
+    def large_scans(connection: sqlite3.Connection) -> set:
+        plan = explain_query_plan(connection, sql)
+        scanned = {t for t, _ in _table_scans(plan, aliases, tables, index_scans=True)}
+        for table in scanned - set(rows):
+            rows[table] = estimated_rows(conn, table)
+        return {t for t in scanned if rows[t] >= min_rows}
+
+    hypothetical = _schema_copy(conn)
+    try:
+        existing = {
+            name
+            for (name,) in hypothetical.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            )
+        }
+        initial = remaining = large_scans(hypothetical)
+        accepted: List[Dict[str, Any]] = []
+
+        def add(table: str, index_columns: List[str]) -> Optional[Dict[str, Any]]:
+            name = index_name(table, index_columns)
+            if name in existing:
+                return None
+            existing.add(name)
+            statement = _index_statement(name, table, index_columns)
+            hypothetical.execute(statement)
+            candidate = {
+                "name": name,
+                "table": table,
+                "columns": index_columns,
+                "sql": statement,
+            }
+            accepted.append(candidate)
+            return candidate
+
+        # The preferred index of each table, kept even while the plan does not
+        # change yet: the next table's index may be what makes it switch
+        for table in involved:
+            if remaining and table in predicates:
+                add(table, _candidate_columns(predicates[table])[0])
+                remaining = large_scans(hypothetical)
+        # Alternatives for tables that are still scanned, kept only if they help
+        for table in sorted(remaining & set(predicates)):
+            for index_columns in _candidate_columns(predicates[table])[1:]:
+                candidate = add(table, index_columns)
+                if candidate is None:
+                    continue
+                scanned = large_scans(hypothetical)
+                if len(scanned) < len(remaining):
+                    remaining = scanned
+                    break
+                _drop(hypothetical, candidate)
+                accepted.remove(candidate)
+        if len(remaining) >= len(initial):
+            return []
+        # Drop indexes the final plan does without, latest first
+        for candidate in reversed(list(accepted)):
+            _drop(hypothetical, candidate)
+            if len(large_scans(hypothetical)) <= len(remaining):
+                accepted.remove(candidate)
+            else:
+                hypothetical.execute(candidate["sql"])
+        return accepted
+    finally:
+        hypothetical.close()
+
+
+def time_query(
+    db_path: str, sql: str, timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS
+) -> float:
+    """Seconds to read the statement's full result (rows are discarded)"""
+    cursor = QueryCursor(db_path, sql, 5000, sys.maxsize, timeout_seconds)
+    try:
+        while not cursor.exhausted:
+            cursor.fetch_page()
+    finally:
+        cursor.close()
+    return cursor.seconds
+
+
+def working_copy_path(db_path: str) -> str:
+    path = Path(db_path)
+    return str(path.with_name(f"{path.stem}.indexed{path.suffix}"))
+
+
+class IndexAdvisor:
+    """Plan analysis plus the indexes created per database, persisted as JSON
+
+    Databases are identified by the SHA-256 of the uploaded file, so the same
+    upload in a later session gets its indexes back on a new working copy.
+    """
+
+    def __init__(
+        self, path: str = "index_advice.json", min_rows: int = LARGE_TABLE_ROWS
+    ):
+        self.path = path
+        self.min_rows = min_rows
+        self._lock = threading.Lock()
+        self._databases: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._databases = json.load(f).get("databases", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read index advice {path}: {e}")
+
+    def analyze(self, db_path: str, sql: str) -> Dict[str, Any]:
+        """Query plan, flagged full scans and validated candidate indexes"""
+        uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True)
+        try:
+            plan = explain_query_plan(conn, sql)
+            aliases = _table_aliases(_strip_literals(sql), _tables(conn))
+            scans = full_scans(conn, plan, aliases, self.min_rows)
+            candidates = candidate_indexes(conn, sql, scans, self.min_rows)
+        finally:
+            conn.close()
+        return {"plan": plan, "full_scans": scans, "candidates": candidates}
+
+    def recommended(self, db_hash: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            indexes = self._databases.get(db_hash, {}).get("indexes", {})
+            return [dict(entry) for entry in indexes.values()]
+
+    def prepare_working_copy(self, upload_path: str, db_hash: str) -> Optional[str]:
+        """Fresh working copy with the indexes recorded for this database, or
+        None when there are none"""
+        indexes = self.recommended(db_hash)
+        if not indexes:
+            return None
+        work_path = working_copy_path(upload_path)
+        self._copy(upload_path, work_path)
+        conn = sqlite3.connect(work_path)
+        try:
+            for entry in indexes:
+                try:
+                    conn.execute(entry["sql"])
+                except sqlite3.Error as e:
+                    logger.warning(f"Index {entry['name']} not recreated: {e}")
+            conn.commit()
+        finally:
+            conn.close()
+        return work_path
+
+    def apply(
+        self,
+        upload_path: str,
+        db_hash: str,
+        sql: str,
+        candidates: List[Dict[str, Any]],
+        timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+    ) -> Dict[str, Any]:
+        """Create candidates on the working copy and time the query before/after
+
+        The working copy of upload_path is created first if it does not exist
+        yet. Indexes that do not make the query faster are dropped again and
+        not recorded (kept is False). Timings are None for statements that
+        return no rows.
+        """
+        work_path = working_copy_path(upload_path)
+        if not os.path.exists(work_path):
+            self._copy(upload_path, work_path)
+        timed = returns_rows(sql)
+        before = time_query(work_path, sql, timeout_seconds) if timed else None
+        conn = sqlite3.connect(work_path)
+        try:
+            for candidate in candidates:
+                conn.execute(candidate["sql"])
+            conn.commit()
+            after = time_query(work_path, sql, timeout_seconds) if timed else None
+            # The planner assumes indexes help; unselective ones can be slower
+            kept = after is None or after < before
+            if not kept:
+                for candidate in candidates:
+                    _drop(conn, candidate)
+                conn.commit()
+        finally:
+            conn.close()
+
+        if kept:
+            now = datetime.now().isoformat()
+            with self._lock:
+                databases = self._databases.setdefault(db_hash, {"indexes": {}})
+                for candidate in candidates:
+                    databases["indexes"][candidate["name"]] = {
+                        **candidate,
+                        "created_at": now,
+                        "query": sql,
+                        "before_seconds": before,
+                        "after_seconds": after,
+                    }
+                self._save()
+        return {
+            "working_copy": work_path,
+            "before_seconds": before,
+            "after_seconds": after,
+            "kept": kept,
+            "indexes": [c["name"] for c in candidates],
+        }
+
+    @staticmethod
+    def _copy(source_path: str, target_path: str):
+        """Consistent copy through the SQLite backup API"""
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"databases": self._databases}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write index advice {self.path}: {e}")
@@ -0,0 +1,245 @@
+"""
+SQLite schema introspection and question-based schema pruning for NL->SQL
+The schema is read once per database content (keyed by the file's SHA-256)
+with two queries over the pragma table functions. A lexical index over table
+and column name tokens then picks the tables and columns relevant to a
+question, so the prompt stays small however many tables the database has
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+MAX_PROMPT_TABLES = 8
+MAX_PROMPT_COLUMNS = 30
+MAX_OTHER_TABLE_NAMES = 40
+MIN_PREFIX = 5
+# Question words that never identify a table or column
+STOPWORDS = set(
+    "alle aller alles auch aus bei das dem den der des die ein eine einen "
+    "einer fuer haben hat ist mit nach nicht oder pro sind und von "
+    "welche welcher wie wird zeige zum zur all and are for from have how "
+    "many per show the what which with".split()
+)
+
+_fingerprints: Dict[str, Tuple[int, int, str]] = {}
+_fingerprints_lock = threading.Lock()
+
+# Field codes (B017) stay whole, camelCase and snake_case are split
+_WORD_RE = re.compile(r"[A-Za-z]\d+|[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+_UMLAUTS = str.maketrans(
+    {"ä": "ae", "ö": "oe", "ü": "ue", "Ä": "Ae", "Ö": "Oe", "Ü": "Ue", "ß": "ss"}
+)
+
+
+def database_fingerprint(db_path: str) -> str:
+    """SHA-256 of the database file, rehashed only when size or mtime change"""
+    stat = os.stat(db_path)
+    key = os.path.abspath(db_path)
+    with _fingerprints_lock:
+        cached = _fingerprints.get(key)
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(db_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    fingerprint = digest.hexdigest()
+    with _fingerprints_lock:
+        _fingerprints[key] = (stat.st_size, stat.st_mtime_ns, fingerprint)
+    return fingerprint
+
+
+def introspect_schema(db_path: str) -> Dict[str, Dict[str, Any]]:
+    """table -> {"type", "columns": [{"name", "type"}], "primary_key",
+    "foreign_keys": [{"column", "table", "to"}]}, read in two queries"""
+    uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT m.name, m.type, p.name, p.type, p.pk"
+            " FROM sqlite_master AS m, pragma_table_info(m.name) AS p"
+            " WHERE m.type IN ('table', 'view') AND m.name NOT LIKE 'sqlite_%'"
+            " ORDER BY m.name, p.cid"
+        ).fetchall()
+        foreign_keys = conn.execute(
+            'SELECT m.name, f."from", f."table", f."to"'
+            " FROM sqlite_master AS m, pragma_foreign_key_list(m.name) AS f"
+            " WHERE m.type = 'table'"
+        ).fetchall()
+    finally:
+        conn.close()
+
+    structure: Dict[str, Dict[str, Any]] = {}
+    for table_name, table_type, column_name, column_type, pk in rows:
+        table = structure.setdefault(
+            table_name,
+            {"type": table_type, "columns": [], "primary_key": [], "foreign_keys": []},
+        )
+        table["columns"].append({"name": column_name, "type": column_type})
+        if pk:
+            table["primary_key"].append(column_name)
+    for table_name, column, target, target_column in foreign_keys:
+        if table_name in structure:
+            structure[table_name]["foreign_keys"].append(
+                {"column": column, "table": target, "to": target_column}
+            )
+    return structure
+
+
+def name_tokens(text: str) -> List[str]:
+    """Lowercase word tokens of identifiers or questions (snake, camel, digits)"""
+    words = _WORD_RE.findall(text.translate(_UMLAUTS))
+    return [w.lower() for w in words if len(w) > 1 or w.isdigit()]
+
+
+def _tokens_match(a: str, b: str) -> bool:
+    # Inflected forms: "kunden" ~ "kunde", "bestellt" ~ "bestellungen"
+    if a == b:
+        return True
+    if min(len(a), len(b)) < 4:
+        return False
+    if a.startswith(b) or b.startswith(a):
+        return True
+    prefix = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        prefix += 1
+    return prefix >= MIN_PREFIX
+
+
+class SchemaIndex:
+    """Lexical index over table and column names of one schema"""
+
+    def __init__(self, structure: Dict[str, Dict[str, Any]]):
+        self.structure = structure
+        self.schema_hash = hashlib.sha256(
+            json.dumps(structure, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        # token -> [(table, column or None)], tokens bucketed by first 3 letters
+        self._postings: Dict[str, List[Tuple[str, Optional[str]]]] = defaultdict(list)
+        for table_name, table in structure.items():
+            for token in set(name_tokens(table_name)):
+                self._postings[token].append((table_name, None))
+            for column in table["columns"]:
+                for token in set(name_tokens(column["name"])):
+                    self._postings[token].append((table_name, column["name"]))
+        self._buckets: Dict[str, List[str]] = defaultdict(list)
+        for token in self._postings:
+            self._buckets[token[:3]].append(token)
+        table_count = max(len(structure), 1)
+        self._idf = {
+            token: math.log(1 + table_count / len({t for t, _ in postings}))
+            for token, postings in self._postings.items()
+        }
+        self._neighbours: Dict[str, Set[str]] = defaultdict(set)
+        for table_name, table in structure.items():
+            for fk in table["foreign_keys"]:
+                if fk["table"] in structure:
+                    self._neighbours[table_name].add(fk["table"])
+                    self._neighbours[fk["table"]].add(table_name)
+
+    def _matching_tokens(self, token: str) -> List[str]:
+        return [t for t in self._buckets.get(token[:3], ()) if _tokens_match(token, t)]
+
+    def score(self, question: str) -> Tuple[Dict[str, float], Dict[str, Set[str]]]:
+        """Per-table relevance and the matched columns of each table"""
+        table_scores: Dict[str, float] = defaultdict(float)
+        matched_columns: Dict[str, Set[str]] = defaultdict(set)
+        # Numbers in a question are values, not names
+        question_tokens = {
+            t for t in name_tokens(question) if not t.isdigit() and t not in STOPWORDS
+        }
+        for token in question_tokens:
+            for indexed in self._matching_tokens(token):
+                weight = self._idf[indexed]
+                hit_tables = set()
+                for table_name, column in self._postings[indexed]:
+                    if column is None:
+                        table_scores[table_name] += 2 * weight
+                    else:
+                        matched_columns[table_name].add(column)
+                        if table_name not in hit_tables:
+                            table_scores[table_name] += weight
+                    hit_tables.add(table_name)
+        return table_scores, matched_columns
+
+    def relevant_schema(
+        self,
+        question: str,
+        max_tables: int = MAX_PROMPT_TABLES,
+        max_columns: int = MAX_PROMPT_COLUMNS,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Subset of the structure for the question: the best matching tables,
+        tables joined to them by foreign keys while there is room, and per
+        table its matched, key and leading columns up to max_columns"""
+        if len(self.structure) <= max_tables and all(
+            len(t["columns"]) <= max_columns for t in self.structure.values()
+        ):
+            return self.structure
+
+        table_scores, matched_columns = self.score(question)
+        ranked = sorted(table_scores, key=lambda t: (-table_scores[t], t))
+        selected = ranked[:max_tables]
+        for table_name in list(selected):
+            for neighbour in sorted(self._neighbours[table_name]):
+                if len(selected) >= max_tables:
+                    break
+                if neighbour not in selected:
+                    selected.append(neighbour)
+
+        pruned = {}
+        for table_name in selected:
+            table = self.structure[table_name]
+            keep = set(matched_columns.get(table_name, ()))
+            keep.update(table["primary_key"])
+            keep.update(fk["column"] for fk in table["foreign_keys"])
+            columns = [c for c in table["columns"] if c["name"] in keep][:max_columns]
+            for column in table["columns"]:
+                if len(columns) >= max_columns:
+                    break
+                if column not in columns:
+                    columns.append(column)
+            order = {c["name"]: i for i, c in enumerate(table["columns"])}
+            columns.sort(key=lambda c: order[c["name"]])
+            pruned[table_name] = {
+                **table,
+                "columns": columns,
+                "omitted_columns": len(table["columns"]) - len(columns),
+            }
+        return pruned
+
+    def prompt_schema(self, question: str, **limits) -> str:
+        """Compact schema text for the prompt, one line per relevant table"""
+        pruned = self.relevant_schema(question, **limits)
+        lines = []
+        for table_name, table in pruned.items():
+            foreign_keys = {fk["column"]: fk for fk in table["foreign_keys"]}
+            columns = []
+            for column in table["columns"]:
+                text = f'"{column["name"]}" {column["type"] or ""}'.rstrip()
+                if column["name"] in table["primary_key"]:
+                    text += " PK"
+                fk = foreign_keys.get(column["name"])
+                if fk:
+                    text += f' -> "{fk["table"]}"."{fk["to"] or "rowid"}"'
+                columns.append(text)
+            if table.get("omitted_columns"):
+                columns.append(f"... {table['omitted_columns']} weitere Spalten")
+            lines.append(f'"{table_name}" ({table["type"]}): {", ".join(columns)}')
+        others = [name for name in self.structure if name not in pruned]
+        if others:
+            shown = ", ".join(f'"{name}"' for name in others[:MAX_OTHER_TABLE_NAMES])
+            more = len(others) - MAX_OTHER_TABLE_NAMES
+            lines.append(
+                f"Weitere Tabellen: {shown}" + (f" (+{more})" if more > 0 else "")
+            )
+        return "\n".join(lines)
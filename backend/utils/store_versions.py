@@ -0,0 +1,70 @@
+"""
+Versioned vector store directories with an atomic switch
+Each update is saved to a new version folder inside the store directory and
+made visible by atomically replacing the CURRENT pointer file, so readers see
+either the old or the new index files, never a mix. Stores written before
+versioning (index files directly in the store directory) keep working
+"""
+
+import os
+import shutil
+import threading
+import time
+from typing import Dict
+
+CURRENT_FILE = "CURRENT"
+VERSION_PREFIX = "v"
+LEGACY_FILES = ("index.faiss", "index.pkl", "field_codes.json")
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def store_lock(store_dir: str) -> threading.Lock:
+    """Lock serializing the writers of one store within this process"""
+    key = os.path.abspath(store_dir)
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def active_store_path(store_dir: str) -> str:
+    """Folder holding the index files readers should load"""
+    try:
+        with open(os.path.join(store_dir, CURRENT_FILE), encoding="utf-8") as f:
+            version = f.read().strip()
+    except OSError:
+        return store_dir
+    return os.path.join(store_dir, version) if version else store_dir
+
+
+def new_version_path(store_dir: str) -> str:
+    return os.path.join(store_dir, f"{VERSION_PREFIX}{time.time_ns()}")
+
+
+def publish_version(store_dir: str, version_path: str, keep: int = 2):
+    """Point CURRENT at version_path and drop versions beyond the newest `keep`
+
+    The previous version is kept by default so readers that resolved it just
+    before the switch can still load it.
+    """
+    version = os.path.basename(version_path)
+    tmp_path = os.path.join(store_dir, f"{CURRENT_FILE}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(store_dir, CURRENT_FILE))
+
+    versions = sorted(
+        (
+            name
+            for name in os.listdir(store_dir)
+            if name.startswith(VERSION_PREFIX) and name[1:].isdigit()
+        ),
+        key=lambda name: int(name[1:]),
+    )
+    for stale in versions[: max(0, len(versions) - keep)]:
+        if stale != version:
+            shutil.rmtree(os.path.join(store_dir, stale), ignore_errors=True)
+    for name in LEGACY_FILES:
+        legacy = os.path.join(store_dir, name)
+        if os.path.isfile(legacy):
+            os.unlink(legacy)
@@ -0,0 +1,269 @@
+"""
+Lightweight request tracing with Server-Timing and an OTLP/JSON span file
+Each request gets a trace held in a context variable; stages open child spans
+(also inside asyncio.to_thread, which copies the context). Finished traces are
+appended as OTLP/JSON lines that the OpenTelemetry collector's otlpjsonfile
+receiver can read, and summed per stage into a Server-Timing header
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_SERVER_TIMING_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "error",
+        "is_root",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        attributes: Optional[Dict[str, Any]] = None,
+        start_ns: Optional[int] = None,
+        is_root: bool = False,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes or {})
+        self.error: Optional[str] = None
+        self.is_root = is_root
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 2 if self.is_root else 1,  # SERVER / INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": (
+                {"code": 2, "message": self.error} if self.error else {"code": 1}
+            ),
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class Trace:
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List[Span] = []
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: total per span name, root span as 'total'"""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            name = _SERVER_TIMING_NAME_RE.sub("_", span.name)
+            if span.is_root:
+                name = "total"
+            totals[name] = totals.get(name, 0.0) + span.duration_ms
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in totals.items())
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+
+class JsonLinesSpanSink:
+    """Appends OTLP/JSON trace requests to a file from a background thread"""
+
+    def __init__(self, path: str, service_name: str, max_bytes: int = 50 * 2**20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.resource = {
+            "attributes": [_otlp_attribute("service.name", service_name)]
+        }
+        self._queue: "queue.SimpleQueue[Optional[List[Span]]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(
+            target=self._run, name="trace-sink", daemon=True
+        )
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._thread.start()
+
+    def export(self, spans: List[Span]):
+        self._queue.put(spans)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            spans = self._queue.get()
+            if spans is None:
+                return
+            line = json.dumps(
+                {
+                    "resourceSpans": [
+                        {
+                            "resource": self.resource,
+                            "scopeSpans": [
+                                {
+                                    "scope": {"name": "ba-agent-tool"},
+                                    "spans": [s.to_otlp() for s in spans],
+                                }
+                            ],
+                        }
+                    ]
+                },
+                ensure_ascii=False,
+            )
+            try:
+                if (
+                    os.path.exists(self.path)
+                    and os.path.getsize(self.path) > self.max_bytes
+                ):
+                    os.replace(self.path, f"{self.path}.1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                logger.warning(f"Could not write spans to {self.path}: {e}")
+
+
+class Tracer:
+    """Creates traces and spans; listeners see every finished span"""
+
+    def __init__(
+        self,
+        sink: Optional[JsonLinesSpanSink] = None,
+        sample_rate: float = 1.0,
+    ):
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self._listeners: List[Callable[[Span], None]] = []
+
+    def add_listener(self, listener: Callable[[Span], None]):
+        self._listeners.append(listener)
+
+    def _finish(self, span: Span):
+        span.end_ns = time.time_ns()
+        for listener in self._listeners:
+            try:
+                listener(span)
+            except Exception as e:
+                logger.debug(f"Span listener failed: {e}")
+
+    @contextmanager
+    def start_trace(
+        self, name: str, traceparent: Optional[str] = None, **attributes
+    ) -> Iterator[Trace]:
+        """Root span of a request; continues an incoming W3C traceparent"""
+        match = _TRACEPARENT_RE.match(traceparent or "")
+        trace_id = match.group(1) if match else os.urandom(16).hex()
+        parent_id = match.group(2) if match else None
+        sampled = self.sink is not None and random.random() < self.sample_rate
+        trace = Trace(trace_id, sampled)
+        root = Span(name, trace_id, parent_id, attributes, is_root=True)
+        trace.spans.append(root)
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(root)
+        try:
+            yield trace
+        except BaseException as e:
+            root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            self._finish(root)
+            if trace.sampled:
+                self.sink.export(trace.spans)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Child span of the current span (timed even outside a trace)"""
+        trace = _current_trace.get()
+        parent = _current_span.get()
+        span = Span(
+            name,
+            trace.trace_id if trace else "",
+            parent.span_id if parent else "",
+            attributes,
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(span)
+            if trace is not None:
+                trace.spans.append(span)
+
+    def record_span(self, name: str, duration_seconds: float, **attributes) -> Span:
+        """Span for an interval measured elsewhere, ending now"""
+        trace = _current_trace.get()
+        parent = _current_span.get()
+        start_ns = time.time_ns() - int(duration_seconds * 1e9)
+        span = Span(
+            name,
+            trace.trace_id if trace else "",
+            parent.span_id if parent else "",
+            attributes,
+            start_ns=start_ns,
+        )
+        self._finish(span)
+        if trace is not None:
+            trace.spans.append(span)
+        return span
+
+    @staticmethod
+    def current_trace() -> Optional[Trace]:
+        return _current_trace.get()
@@ -0,0 +1,165 @@
+"""
+Streaming storage of uploaded files
+Copies an upload to its final location in fixed-size chunks, enforcing the size
+limit on the bytes actually received and hashing the content on the way. The
+file appears under its final name only once it is complete
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Optional, Tuple
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """The upload exceeded the size limit while it was being stored"""
+
+    def __init__(self, filename: str, max_bytes: int):
+        super().__init__(
+            f"File {filename} exceeds maximum size of {max_bytes/1024/1024:.1f}MB"
+        )
+        self.filename = filename
+        self.max_bytes = max_bytes
+
+
+def safe_filename(filename: str) -> str:
+    """Client supplied name reduced to its last path component"""
+    name = Path(filename.replace("\\", "/")).name
+    if not name or name in (".", ".."):
+        raise ValueError(f"Invalid file name: {filename!r}")
+    return name
+
+
+def store_upload(
+    source: BinaryIO,
+    filename: str,
+    target_dir: str,
+    max_bytes: int,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+    keep_if: Optional[Callable[[str, int], bool]] = None,
+) -> Dict[str, Any]:
+    """Stream an upload into target_dir, hashing it; blocking, run in a thread
+
+    Returns the stored file's name, path, size in bytes and sha256 hex digest.
+    keep_if(sha256, size) can reject the complete upload (e.g. a duplicate); it is
+    then discarded, "stored" is False and path is None.
+    """
+    name = safe_filename(filename)
+    os.makedirs(target_dir, exist_ok=True)
+    path = os.path.join(target_dir, name)
+    partial_path = f"{path}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(partial_path, "wb") as f:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(name, max_bytes)
+                digest.update(chunk)
+                f.write(chunk)
+        sha256 = digest.hexdigest()
+        stored = keep_if is None or keep_if(sha256, size)
+        if stored:
+            os.replace(partial_path, path)
+        else:
+            os.unlink(partial_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+        raise
+    return {
+        "filename": name,
+        "path": path if stored else None,
+        "size": size,
+        "sha256": sha256,
+        "stored": stored,
+    }
+
+
+class RequestSizeLimit:
+    """ASGI middleware bounding request bodies on the given path prefixes
+
+    The framework spools a multipart body completely (to a temporary file past
+    1MB) before the handler runs, so limits checked while storing an upload
+    only apply once everything was received. Requests declaring a larger
+    Content-Length are answered with 413 before their body is read; bodies
+    without one stop being read as soon as they exceed the limit.
+    """
+
+    def __init__(self, app, max_bytes: int, path_prefixes: Tuple[str, ...]):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_prefixes = path_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(
+            self.path_prefixes
+        ):
+            await self.app(scope, receive, send)
+            return
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Ends body parsing; the app's error response is replaced
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                if response_started:
+                    return
+                response_started = True
+                if exceeded:
+                    await self._reject(send)
+                    return
+            elif exceeded:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+            if not response_started:
+                await self._reject(send)
+
+    async def _reject(self, send):
+        body = json.dumps(
+            {
+                "detail": "Request body exceeds the upload limit of "
+                f"{self.max_bytes/1024/1024:.1f}MB"
+            }
+        ).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("ascii")),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})